@@ -1,6 +1,11 @@
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Comment, Post
+from .cache import bump_sidebar_version
+from .images import derivative_url
+from .models import Comment, OutboundEmail, Post
 
 
 @admin.register(Post)
@@ -22,8 +27,9 @@ class PostAdmin(admin.ModelAdmin):
     def image_thumb(self, obj):
         if getattr(obj, "image", None):
             return format_html(
-                '<img src="{}" style="height:40px;width:40px;object-fit:cover;border-radius:6px;" />',
-                obj.image.url,
+                '<img src="{}" style="height:40px;width:40px;object-fit:cover;border-radius:6px;" loading="lazy" />',
+                # Smallest derivative, not the multi-megabyte original
+                derivative_url(obj, 80),
             )
         return "—"
 
@@ -40,6 +46,37 @@ class CommentAdmin(admin.ModelAdmin):
     actions = ["approve_comments"]
 
     def approve_comments(self, request, queryset):
-        queryset.update(active=True)
+        # queryset.update() doesn't send post_save, so keep the denormalized
+        # comment counts, the sidebar cache and (through ``updated``) the
+        # posts' freshness validators in step by hand.
+        with transaction.atomic():
+            pending = queryset.filter(active=False)
+            deltas = list(
+                pending.order_by().values("post").annotate(total=Count("pk"))
+            )
+            pending.update(active=True, updated=timezone.now())
+            for row in deltas:
+                Post.adjust_comment_count(row["post"], row["total"])
+        bump_sidebar_version()
 
     approve_comments.short_description = "Approve selected comments"
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "to", "status", "attempts", "created", "sent_at")
+    list_filter = ("status", "created")
+    search_fields = ("subject", "to")
+    raw_id_fields = ("post",)
+    readonly_fields = ("attempts", "last_error", "created", "sent_at")
+    actions = ["requeue"]
+
+    def requeue(self, request, queryset):
+        # Picked up by the next `send_outbox` batch.
+        queryset.exclude(status=OutboundEmail.Status.SENT).update(
+            status=OutboundEmail.Status.QUEUED,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+
+    requeue.short_description = "Retry selected emails"
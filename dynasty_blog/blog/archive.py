@@ -0,0 +1,459 @@
+"""
+Streaming bulk import and export of posts with their tags and comments
+(``import_posts`` / ``export_posts``).
+
+Two formats carry the same records:
+
+* **JSONL**: one post per line, ``{"title", "slug", "author", "published",
+  "status", "body", "tags": [...], "comments": [{"name", "email", "body",
+  "created", "active"}]}``.
+* **Markdown directory**: one ``*.md`` file per post, with the scalar
+  fields and tags in ``---`` front matter and the body below it; comments
+  go in an optional ``<name>.comments.jsonl`` file next to it.
+
+Records are read and written one at a time and imported in chunks of
+``batch_size`` (one transaction each), so memory stays flat however large
+the archive is. Each chunk costs a handful of queries: existing slugs for
+its dates, tags, one ``bulk_create`` each for posts, tagged items and
+comments. Like ``bulk_create`` everywhere, this skips ``save()`` and
+signals: rendered fields and comment counts are filled in here, and similar
+posts and cache versions are refreshed once at the end.
+"""
+
+import json
+import os
+import re
+from datetime import datetime, time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from .cache import bump_feed_version, bump_posts_version, bump_sidebar_version
+from .models import Comment, Post
+from .routers import pin_primary
+from .similar import posts_sharing_tags, rebuild_similar_posts
+
+SLUG_LENGTH = Post._meta.get_field("slug").max_length
+FRONT_MATTER = "---"
+COMMENTS_SUFFIX = ".comments.jsonl"
+
+
+class ArchiveError(ValueError):
+    """A record that can't be imported; the message names the source."""
+
+
+# ---------------------------------------------------------------------
+# Front matter (the YAML subset we write: scalars and lists of scalars)
+# ---------------------------------------------------------------------
+def _scalar(text):
+    text = text.strip()
+    if text[:1] == '"':
+        return json.loads(text)
+    if text[:1] == "'" and text[-1:] == "'":
+        return text[1:-1].replace("''", "'")
+    return text
+
+
+def _split_inline_list(text):
+    # "[a, "b, c", d]" -> ["a", "b, c", "d"]
+    items = re.findall(r'\s*("(?:[^"\\]|\\.)*"|\'[^\']*\'|[^,]+)\s*(?:,|$)', text)
+    return [_scalar(item) for item in items if item.strip()]
+
+
+def parse_front_matter(text):
+    """``(meta, body)`` for a Markdown document with optional front matter."""
+    lines = text.splitlines(keepends=True)
+    if not lines or lines[0].strip() != FRONT_MATTER:
+        return {}, text
+    meta = {}
+    key = None
+    for index, line in enumerate(lines[1:], start=1):
+        stripped = line.strip()
+        if stripped == FRONT_MATTER:
+            return meta, "".join(lines[index + 1 :]).lstrip("\n")
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith("- ") and key is not None:
+            meta.setdefault(key, [])
+            if isinstance(meta[key], list):
+                meta[key].append(_scalar(stripped[2:]))
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            raise ArchiveError(f"Invalid front matter line {index + 1}: {line!r}")
+        key, value = key.strip(), value.strip()
+        if value.startswith("[") and value.endswith("]"):
+            meta[key] = _split_inline_list(value[1:-1])
+        elif value:
+            meta[key] = _scalar(value)
+        else:
+            meta[key] = []  # a block list follows (or an empty value)
+    raise ArchiveError("Front matter is not closed with '---'.")
+
+
+def dump_front_matter(meta, body):
+    lines = [FRONT_MATTER]
+    for key, value in meta.items():
+        if isinstance(value, (list, tuple)):
+            items = ", ".join(json.dumps(item, ensure_ascii=False) for item in value)
+            lines.append(f"{key}: [{items}]")
+        else:
+            lines.append(f"{key}: {json.dumps(value, ensure_ascii=False)}")
+    lines.append(FRONT_MATTER)
+    return "\n".join(lines) + "\n\n" + body.rstrip("\n") + "\n"
+
+
+# ---------------------------------------------------------------------
+# Readers: yield plain record dicts, one at a time
+# ---------------------------------------------------------------------
+def read_jsonl(stream, source="<stream>"):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ArchiveError(f"{source}:{number}: {exc}") from exc
+        record.setdefault("_source", f"{source}:{number}")
+        yield record
+
+
+def _markdown_files(path):
+    # scandir + sorted names per directory: no full listing kept in memory
+    # beyond one directory, and a stable order.
+    with os.scandir(path) as entries:
+        names = sorted((e.name, e.is_dir()) for e in entries)
+    for name, is_dir in names:
+        full = os.path.join(path, name)
+        if is_dir:
+            yield from _markdown_files(full)
+        elif name.endswith(".md"):
+            yield full
+
+
+def read_markdown_dir(path):
+    for filename in _markdown_files(path):
+        with open(filename, encoding="utf-8") as fh:
+            try:
+                meta, body = parse_front_matter(fh.read())
+            except ArchiveError as exc:
+                raise ArchiveError(f"{filename}: {exc}") from exc
+        record = {**meta, "body": body, "_source": filename}
+        record.setdefault(
+            "title", os.path.splitext(os.path.basename(filename))[0]
+        )
+        comments = filename[: -len(".md")] + COMMENTS_SUFFIX
+        if os.path.exists(comments):
+            with open(comments, encoding="utf-8") as fh:
+                record["comments"] = list(read_jsonl(fh, comments))
+        yield record
+
+
+# ---------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------
+def _parse_moment(value, source, default=None):
+    if value in (None, ""):
+        return default
+    moment = parse_datetime(str(value))
+    if moment is None:
+        day = parse_date(str(value))
+        if day is None:
+            raise ArchiveError(f"{source}: invalid date {value!r}")
+        moment = datetime.combine(day, time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _parse_status(value, source):
+    if value in (None, ""):
+        return Post.Status.PUBLISHED
+    text = str(value).strip().lower()
+    for status in Post.Status:
+        if text in (status.value.lower(), status.label.lower()):
+            return status
+    raise ArchiveError(f"{source}: unknown status {value!r}")
+
+
+def _parse_tags(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return list(dict.fromkeys(str(t).strip() for t in value or () if str(t).strip()))
+
+
+def _local_date(moment):
+    return timezone.localtime(moment).date()
+
+
+def _with_suffix(slug, n):
+    suffix = f"-{n}"
+    return slug[: SLUG_LENGTH - len(suffix)] + suffix
+
+
+class Importer:
+    """
+    Import records in chunks of ``batch_size``. Authors are matched by
+    username (``default_author`` when a record names none); unknown ones
+    are created without a usable password. A slug already used on the same
+    publication date, in the database or earlier in the chunk, gets a
+    ``-2``, ``-3``... suffix, as ``unique_for_date`` requires.
+    """
+
+    def __init__(self, batch_size=500, default_author=None, create_authors=True):
+        self.batch_size = batch_size
+        self.default_author = default_author
+        self.create_authors = create_authors
+        self.content_type = ContentType.objects.get_for_model(Post)
+        self._authors = {}
+        self._tag_ids = {}
+        self.touched_tags = set()
+        self.stats = {"posts": 0, "comments": 0, "tags": 0, "authors": 0, "renamed": 0}
+
+    # -- lookups cached for the whole run (bounded by authors / tags) ------
+    def _author_id(self, username, source):
+        username = username or self.default_author
+        if not username:
+            raise ArchiveError(f"{source}: no author and no default author given")
+        if username not in self._authors:
+            User = get_user_model()
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                if not self.create_authors:
+                    raise ArchiveError(f"{source}: unknown author {username!r}")
+                user = User(username=username)
+                user.set_unusable_password()
+                user.save()
+                self.stats["authors"] += 1
+            self._authors[username] = user.pk
+        return self._authors[username]
+
+    def _resolve_tags(self, names):
+        missing = [name for name in names if name not in self._tag_ids]
+        if missing:
+            for tag_id, name in Tag.objects.filter(name__in=missing).values_list(
+                "id", "name"
+            ):
+                self._tag_ids[name] = tag_id
+            for name in missing:
+                if name not in self._tag_ids:
+                    # New tags are rare; save() picks a unique slug.
+                    self._tag_ids[name] = Tag.objects.create(name=name).pk
+                    self.stats["tags"] += 1
+
+    # -- slugs ---------------------------------------------------------------
+    def _dedupe_slugs(self, posts):
+        dates = {_local_date(post.published) for post in posts}
+        taken = {
+            (_local_date(published), slug)
+            for published, slug in Post.objects.filter(
+                published__date__in=dates
+            ).values_list("published", "slug")
+        }
+        for post in posts:
+            day = _local_date(post.published)
+            base, n = post.slug, 1
+            while (day, post.slug) in taken:
+                n += 1
+                post.slug = _with_suffix(base, n)
+            if n > 1:
+                self.stats["renamed"] += 1
+            taken.add((day, post.slug))
+
+    # -- one chunk -----------------------------------------------------------
+    def _build(self, record):
+        source = record.get("_source", "<record>")
+        title = str(record.get("title") or "").strip()
+        if not title:
+            raise ArchiveError(f"{source}: missing title")
+        comments = []
+        for data in record.get("comments") or ():
+            comment = Comment(
+                name=str(data.get("name", ""))[:80],
+                email=data.get("email", ""),
+                body=data.get("body", ""),
+                active=bool(data.get("active", True)),
+            )
+            # Restored after the insert (auto_now_add overwrites it there).
+            comment.imported_created = _parse_moment(data.get("created"), source)
+            comments.append(comment)
+        post = Post(
+            title=title[:250],
+            slug=(slugify(record.get("slug") or title) or "post")[:SLUG_LENGTH],
+            author_id=self._author_id(record.get("author"), source),
+            body=record.get("body") or "",
+            published=_parse_moment(
+                record.get("published"), source, default=timezone.now()
+            ),
+            status=_parse_status(record.get("status"), source),
+            comment_count=sum(c.active for c in comments),
+        )
+        post.refresh_body_html(force=True)
+        return post, _parse_tags(record.get("tags")), comments
+
+    def _import_chunk(self, records):
+        built = [self._build(record) for record in records]
+        posts = [post for post, _, _ in built]
+        self._dedupe_slugs(posts)
+        self._resolve_tags({name for _, tags, _ in built for name in tags})
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+            if posts and posts[0].pk is None:  # backend can't return ids
+                ids = {
+                    (slug, published): pk
+                    for pk, slug, published in Post.objects.filter(
+                        slug__in=[p.slug for p in posts]
+                    ).values_list("id", "slug", "published")
+                }
+                for post in posts:
+                    post.pk = ids[post.slug, post.published]
+
+            items = []
+            comments = []
+            for post, tags, post_comments in built:
+                for name in tags:
+                    items.append(
+                        TaggedItem(
+                            tag_id=self._tag_ids[name],
+                            object_id=post.pk,
+                            content_type=self.content_type,
+                        )
+                    )
+                for comment in post_comments:
+                    comment.post_id = post.pk
+                    comments.append(comment)
+            TaggedItem.objects.bulk_create(items, ignore_conflicts=True)
+            Comment.objects.bulk_create(comments)
+            dated = []
+            for comment in comments:
+                if comment.imported_created and comment.pk is not None:
+                    comment.created = comment.imported_created
+                    dated.append(comment)
+            Comment.objects.bulk_update(dated, ["created"])
+
+        self.touched_tags.update(item.tag_id for item in items)
+        self.stats["posts"] += len(posts)
+        self.stats["comments"] += len(comments)
+
+    def run(self, records, progress=lambda stats: None):
+        # Slug de-duplication must see the rows the previous chunk just
+        # wrote, which a lagging replica may not have yet.
+        with pin_primary():
+            return self._run(records, progress)
+
+    def _run(self, records, progress):
+        records = iter(records)
+        while chunk := list(islice(records, self.batch_size)):
+            self._import_chunk(chunk)
+            progress(self.stats)
+        self.finish()
+        return self.stats
+
+    def finish(self):
+        """Refresh what the bulk inserts didn't: similar posts and caches."""
+        if self.touched_tags:
+            rebuild_similar_posts(
+                Post.published_posts.filter(
+                    id__in=posts_sharing_tags(self.touched_tags)
+                ).values_list("id", flat=True)
+            )
+        bump_posts_version()
+        bump_feed_version()
+        bump_sidebar_version()
+
+
+# ---------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------
+def export_records(queryset=None, chunk_size=500):
+    """Yield a record per post; rows are fetched ``chunk_size`` at a time."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    queryset = (
+        queryset.select_related("author")
+        .prefetch_related(
+            "tags",
+            Prefetch("comments", queryset=Comment.objects.order_by("created", "id")),
+        )
+        .order_by("published", "id")
+    )
+    for post in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            "title": post.title,
+            "slug": post.slug,
+            "author": post.author.get_username(),
+            "published": post.published.isoformat(),
+            "status": post.get_status_display().lower(),
+            "tags": sorted(tag.name for tag in post.tags.all()),
+            "body": post.body,
+            "comments": [
+                {
+                    "name": comment.name,
+                    "email": comment.email,
+                    "body": comment.body,
+                    "created": comment.created.isoformat(),
+                    "active": comment.active,
+                }
+                for comment in post.comments.all()
+            ],
+        }
+
+
+def write_jsonl(records, stream):
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_markdown_dir(records, path):
+    """
+    One ``YYYY-MM-DD-slug.md`` (+ comments file) per post under ``path``.
+    Names depend only on the records (a ``-2`` suffix for a repeated date
+    and slug, in export order), so exporting again into the same directory
+    overwrites the previous files instead of adding copies. Post and
+    comments files this export didn't write (posts deleted, renamed or
+    re-dated since, comments since removed) are deleted, so the directory
+    always imports as exactly this export.
+    """
+    os.makedirs(path, exist_ok=True)
+    written = set()
+    files = set()
+    for record in records:
+        record = dict(record)
+        body = record.pop("body")
+        comments = record.pop("comments")
+        name = base = f"{record['published'][:10]}-{record['slug']}"
+        n = 1
+        while name in written:
+            n += 1
+            name = f"{base}-{n}"
+        written.add(name)
+        with open(os.path.join(path, name + ".md"), "w", encoding="utf-8") as fh:
+            fh.write(dump_front_matter(record, body))
+        files.add(name + ".md")
+        if comments:
+            with open(
+                os.path.join(path, name + COMMENTS_SUFFIX), "w", encoding="utf-8"
+            ) as fh:
+                write_jsonl(comments, fh)
+            files.add(name + COMMENTS_SUFFIX)
+    with os.scandir(path) as entries:
+        stale = [
+            entry.path
+            for entry in entries
+            if entry.is_file()
+            and entry.name.endswith((".md", COMMENTS_SUFFIX))
+            and entry.name not in files
+        ]
+    for filename in stale:
+        os.remove(filename)
+    return len(written)
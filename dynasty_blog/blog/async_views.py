@@ -0,0 +1,256 @@
+"""
+Async versions of the read-only views, enabled with ``BLOG_ASYNC_VIEWS``.
+
+Under an ASGI server a sync view occupies a thread from the sync pool for
+its whole lifetime, so concurrency is capped by the pool size. These views
+stay on the event loop: queries go through the async ORM (``aget``,
+``acount``, ``async for``), independent ones (a page and its count,
+comments, similar posts, the sidebar when its fragment isn't cached) are
+awaited together with ``asyncio.gather``, and only template rendering,
+which may still touch the cache or the database, is handed to a thread.
+
+They produce the same pages, validators and cache entries as their sync
+counterparts in ``blog/views.py`` and ``blog/feeds.py``.
+"""
+
+import asyncio
+import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from taggit.models import Tag
+
+from . import freshness, metrics
+from .cache import afeed_cache_key, asearch_cache_key, asidebar_version
+from .feeds import LatestPostsFeed, TagPostsFeed
+from .forms import CommentForm, SearchForm
+from .models import Post
+from .pagination import CursorPaginator, pagination_mode
+from .routers import pin_primary
+from .search import get_search_backend
+from .similar import similar_posts_for
+from .views import _post_summaries
+
+arender = sync_to_async(render)
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """
+    ``django.views.decorators.http.condition`` for async views whose
+    validators are sync ORM lookups: both run in one thread hop (they share
+    a memoised query), then the 304 check and the view run on the loop.
+    """
+
+    def validators(request, *args, **kwargs):
+        last_modified = None
+        if last_modified_func:
+            if dt := last_modified_func(request, *args, **kwargs):
+                if not timezone.is_aware(dt):
+                    dt = timezone.make_aware(dt, datetime.timezone.utc)
+                last_modified = int(dt.timestamp())
+        etag = etag_func(request, *args, **kwargs) if etag_func else None
+        return (quote_etag(etag) if etag is not None else None), last_modified
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag, last_modified = await sync_to_async(validators)(
+                request, *args, **kwargs
+            )
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+
+        return inner
+
+    return decorator
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _aget_or_404(queryset, **filters):
+    try:
+        return await queryset.aget(**filters)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+async def _sidebar():
+    """
+    Data for the sidebar fragment in base.html, fetched concurrently, or
+    None when the fragment is already cached (the usual case).
+    """
+    key = make_template_fragment_key("blog_sidebar", [await asidebar_version()])
+    if await cache.ahas_key(key):
+        return None
+    posts = Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS)
+    # Rendered into the fragment cached under the current sidebar version.
+    with pin_primary():
+        total, latest, most_commented = await asyncio.gather(
+            Post.published_posts.acount(),
+            _alist(posts.order_by("-published")[:3]),
+            _alist(posts.order_by("-comment_count", "-published")[:5]),
+        )
+    return {"total": total, "latest": latest, "most_commented": most_commented}
+
+
+async def _apage(queryset, per_page, number):
+    """
+    ``Paginator.get_page`` with the COUNT and the (probable) page of rows
+    fetched concurrently; the rows are refetched only for an out-of-range
+    page number.
+    """
+    try:
+        guess = max(int(number), 1)
+    except (TypeError, ValueError):
+        guess = 1
+    count, rows = await asyncio.gather(
+        queryset.acount(),
+        _alist(queryset[(guess - 1) * per_page : guess * per_page]),
+    )
+    paginator = Paginator(queryset, per_page)
+    paginator.count = count  # cached_property: no second COUNT
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    if number != guess:
+        bottom = (number - 1) * per_page
+        rows = await _alist(queryset[bottom : bottom + per_page])
+    return Page(rows, number, paginator)
+
+
+@acondition(
+    etag_func=freshness.list_etag, last_modified_func=freshness.list_last_modified
+)
+async def post_list(request, tag_slug=None):
+    posts_list = _post_summaries(Post.published_posts.all())
+    tag = None
+    if tag_slug:
+        tag = await _aget_or_404(Tag.objects.all(), slug=tag_slug)
+        posts_list = posts_list.filter(tags__in=[tag])
+    if pagination_mode() == "cursor":
+        paginator = CursorPaginator(
+            posts_list, 3, count_key=f"tag:{tag.pk}" if tag else "all"
+        )
+        posts, sidebar = await asyncio.gather(
+            sync_to_async(paginator.get_page)(request.GET.get("cursor")), _sidebar()
+        )
+    else:
+        posts, sidebar = await asyncio.gather(
+            _apage(posts_list, 3, request.GET.get("page", 1)), _sidebar()
+        )
+    return await arender(
+        request,
+        "blog/post/list.html",
+        {"posts": posts, "tag": tag, "sidebar": sidebar},
+    )
+
+
+@acondition(
+    etag_func=freshness.detail_etag, last_modified_func=freshness.detail_last_modified
+)
+async def post_detail(request, year, month, day, post):
+    post = await _aget_or_404(
+        Post.objects.select_related("author"),
+        status=Post.Status.PUBLISHED,
+        slug=post,
+        published__year=year,
+        published__month=month,
+        published__day=day,
+    )
+    comments, similar_posts, sidebar = await asyncio.gather(
+        _alist(post.comments.filter(active=True)),
+        _alist(similar_posts_for(post)),
+        _sidebar(),
+    )
+    return await arender(
+        request,
+        "blog/post/detail.html",
+        {
+            "post": post,
+            "comments": comments,
+            "form": CommentForm(),
+            "similar_posts": similar_posts,
+            "sidebar": sidebar,
+        },
+    )
+
+
+async def post_search(request):
+    form = SearchForm()
+    query = None
+    search = None
+
+    if "query" in request.GET:
+        form = SearchForm(request.GET)
+        if form.is_valid():
+            query = form.cleaned_data["query"]
+            page_number = request.GET.get("page", 1)
+            # May probe the database (SQLite FTS5) on first use.
+            backend = await sync_to_async(get_search_backend)()
+            cache_key = await asearch_cache_key(backend.name, query, page_number)
+            search = await cache.aget(cache_key)
+            metrics.cache_lookup("search", search is not None)
+            if search is None:
+                # The backends build raw SQL / FTS queries synchronously.
+                # Pinned as in views.post_search: the result is cached.
+                with pin_primary():
+                    search = await sync_to_async(backend.search)(query, page_number)
+                await cache.aset(
+                    cache_key, search, settings.BLOG_SEARCH_CACHE_TIMEOUT
+                )
+
+    return await arender(
+        request,
+        "blog/post/search.html",
+        {
+            "form": form,
+            "query": query,
+            "search": search,
+            "results": search["results"] if search else [],
+            "sidebar": await _sidebar(),
+        },
+    )
+
+
+def _async_feed(feed):
+    """Serve ``feed`` from its XML cache on the loop; build it in a thread."""
+
+    async def view(request, *args, **kwargs):
+        cached = await cache.aget(await afeed_cache_key(request))
+        metrics.cache_lookup("feed", cached is not None)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return await sync_to_async(feed)(request, *args, **kwargs)
+
+    return acondition(
+        etag_func=freshness.feed_etag,
+        last_modified_func=freshness.feed_last_modified,
+    )(view)
+
+
+post_feed = _async_feed(LatestPostsFeed())
+post_feed_by_tag = _async_feed(TagPostsFeed())
@@ -0,0 +1,91 @@
+import re
+import threading
+from bisect import bisect_left
+
+from .cache import posts_version
+from .models import Post
+from .routers import pin_primary
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# A one-letter prefix matches a large share of all title words; as in the
+# search box's script, wait for at least this many characters.
+MIN_PREFIX = 2
+
+
+def _words(text):
+    return _WORD_RE.findall((text or "").lower())
+
+
+class TitleIndex:
+    """
+    In-process prefix index over published post titles.
+
+    Every word of every title is stored in one sorted list, so a prefix
+    lookup is a binary search plus a short scan; no database work per
+    keystroke. The index is rebuilt lazily when the posts version (bumped
+    by post save/delete signals) changes, which keeps every worker process
+    in step without any cross-process coordination.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        # ([(word, position)] sorted, [(title, url, title_words)] newest
+        # first); swapped as one tuple so readers never see a mix.
+        self._data = ([], [])
+
+    @pin_primary()
+    def _build(self):
+        # Built for the current posts version, so read from the primary: a
+        # lagging replica would pin stale titles until the next bump.
+        posts = []
+        entries = []
+        queryset = Post.published_posts.only("title", "slug", "published").order_by(
+            "-published"
+        )
+        for position, post in enumerate(queryset.iterator(chunk_size=2000)):
+            words = _words(post.title)
+            posts.append((post.title, post.get_absolute_url(), words))
+            entries.extend((word, position) for word in set(words))
+        entries.sort()
+        return entries, posts
+
+    def _ensure_current(self):
+        version = posts_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._data = self._build()
+                self._version = version
+
+    def suggest(self, prefix, limit=10):
+        """Titles where each typed word prefixes some title word, newest first."""
+        typed = _words(prefix)
+        # Candidates come from the longest typed word (the narrowest range
+        # of the sorted list); every other word must then prefix a word in
+        # the title.
+        key = max(typed, key=len, default="")
+        if len(key) < MIN_PREFIX:
+            return []
+        self._ensure_current()
+        entries, posts = self._data
+
+        positions = set()
+        i = bisect_left(entries, (key, -1))
+        while i < len(entries) and entries[i][0].startswith(key):
+            positions.add(entries[i][1])
+            i += 1
+
+        results = []
+        for position in sorted(positions):
+            title, url, words = posts[position]
+            if all(any(w.startswith(t) for w in words) for t in typed):
+                results.append({"title": title, "url": url})
+                if len(results) >= limit:
+                    break
+        return results
+
+
+title_index = TitleIndex()
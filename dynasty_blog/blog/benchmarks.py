@@ -0,0 +1,200 @@
+"""
+Request-level benchmarks for the public views (``python manage.py benchmark``).
+
+Each scenario requests one URL through the Django test client against the
+current database (typically filled by ``generate_blog_data``), after one
+warm-up request, and records latency percentiles plus the number of SQL
+queries. Results are compared with a stored baseline: more queries than the
+baseline is always a regression; a p95 slower than ``tolerance`` times the
+baseline (plus a small absolute slack for timer noise) is one too.
+"""
+
+import json
+import math
+import platform
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from taggit.models import Tag
+
+from .models import Comment, Post
+from .pagination import encode_cursor
+from .search import sqlite_fts_installed
+from .sitemaps import shard_size
+
+# Added to the baseline p95 before applying the tolerance, so sub-millisecond
+# scenarios don't flag timer jitter as a regression.
+SLACK_MS = 2.0
+
+
+class Scenario:
+    def __init__(self, name, url, settings=None):
+        self.name = name
+        self.url = url
+        self.settings = settings or {}
+
+
+def _search_term():
+    # The commonest title word: a query with plenty of matches.
+    titles = Post.published_posts.order_by("-comment_count").values_list(
+        "title", flat=True
+    )[:50]
+    words = [w.lower() for title in titles for w in title.split() if len(w) > 3]
+    return max(set(words), key=words.count) if words else "post"
+
+
+def scenarios():
+    """Scenarios for the data in the current database."""
+    posts = Post.published_posts.order_by("-published", "-id")
+    total = posts.count()
+    if not total:
+        return []
+    per_page = 3
+    deep_page = max(1, math.ceil(total / per_page) * 9 // 10)
+    deep_post = posts.defer(*Post.LIST_DEFERRED_FIELDS)[
+        max(0, (deep_page - 1) * per_page - 1)
+    ]
+    sample = posts.order_by("-comment_count").first()
+    tag = (
+        Tag.objects.annotate(uses=Count("taggit_taggeditem_items"))
+        .order_by("-uses")
+        .first()
+    )
+    term = _search_term()
+    search_url = f"{reverse('blog:post_search')}?query={term}"
+
+    result = [
+        Scenario("post_list", reverse("blog:post_list")),
+        Scenario("post_list_deep", f"{reverse('blog:post_list')}?page={deep_page}"),
+        Scenario(
+            "post_list_by_tag",
+            reverse("blog:post_list_by_tag", args=[tag.slug]) if tag else None,
+        ),
+        Scenario(
+            "post_list_cursor_deep",
+            f"{reverse('blog:post_list')}?cursor={encode_cursor(deep_post, 'next')}",
+            {"BLOG_PAGINATION_MODE": "cursor"},
+        ),
+        Scenario("post_detail", sample.get_absolute_url()),
+        Scenario("post_search", search_url),
+        Scenario(
+            "post_search_orm",
+            search_url,
+            {"BLOG_SEARCH_BACKEND": "blog.search.ORMSearchBackend"},
+        ),
+        Scenario("post_feed", reverse("blog:post_feed")),
+        Scenario("sitemap_index", reverse("sitemap")),
+        Scenario("sitemap_shard", reverse("sitemap_shard", args=[0])),
+    ]
+    return [scenario for scenario in result if scenario.url]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _client():
+    host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*", "")), None)
+    host = (host or "testserver").lstrip(".")
+    return Client(HTTP_HOST=host)
+
+
+def run_scenario(scenario, iterations=20, cold=False):
+    client = _client()
+    timings = []
+    queries = 0
+    with override_settings(**scenario.settings):
+        client.get(scenario.url)  # warm-up (imports, compiled templates)
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = client.get(scenario.url)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{scenario.name}: {scenario.url} returned {response.status_code}"
+                )
+            timings.append(elapsed)
+            queries = max(queries, len(ctx))
+    return {
+        "p50_ms": round(_percentile(timings, 50), 2),
+        "p90_ms": round(_percentile(timings, 90), 2),
+        "p95_ms": round(_percentile(timings, 95), 2),
+        "p99_ms": round(_percentile(timings, 99), 2),
+        "max_ms": round(max(timings), 2),
+        "queries": queries,
+    }
+
+
+def dataset():
+    return {
+        "vendor": connection.vendor,
+        "fts": connection.vendor == "sqlite" and sqlite_fts_installed(connection),
+        "posts": Post.published_posts.count(),
+        "comments": Comment.objects.count(),
+        "sitemap_shard_size": shard_size(),
+    }
+
+
+def run(iterations=20, cold=False, only=None, progress=lambda name, result: None):
+    results = {}
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = run_scenario(scenario, iterations, cold)
+        progress(scenario.name, results[scenario.name])
+    return {
+        "meta": {
+            **dataset(),
+            "iterations": iterations,
+            "cache": "cold" if cold else "warm",
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=1.25):
+    """``[(scenario, problem)]`` for every regression against ``baseline``."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        now = current["results"].get(name)
+        if now is None:
+            continue
+        if now["queries"] > base["queries"]:
+            regressions.append(
+                (name, f"{now['queries']} queries (baseline {base['queries']})")
+            )
+        limit = base["p95_ms"] * tolerance + SLACK_MS
+        if now["p95_ms"] > limit:
+            regressions.append(
+                (
+                    name,
+                    f"p95 {now['p95_ms']}ms > {limit:.2f}ms "
+                    f"(baseline {base['p95_ms']}ms x {tolerance})",
+                )
+            )
+    return regressions
+
+
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save(report, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write("\n")
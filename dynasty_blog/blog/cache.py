@@ -0,0 +1,116 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+SIDEBAR_VERSION_KEY = "blog:sidebar:version"
+POSTS_VERSION_KEY = "blog:posts:version"
+FEED_VERSION_KEY = "blog:feed:version"
+
+
+def _get_version(key) -> int:
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old key.
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+async def _aget_version(key) -> int:
+    """``_get_version`` for the async views, without blocking the loop."""
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def _bump_version(key) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def sidebar_cache_timeout() -> int:
+    """TTL (seconds) for the cached sidebar fragment; a safety net only."""
+    return int(getattr(settings, "BLOG_SIDEBAR_CACHE_TIMEOUT", 600))
+
+
+def sidebar_version() -> int:
+    """
+    Current sidebar version. Part of the fragment cache key, so bumping it
+    makes every previously cached sidebar unreachable.
+    """
+    return _get_version(SIDEBAR_VERSION_KEY)
+
+
+async def asidebar_version() -> int:
+    """``sidebar_version`` for the async views."""
+    return await _aget_version(SIDEBAR_VERSION_KEY)
+
+
+def bump_sidebar_version() -> None:
+    """Invalidate the cached sidebar (called when posts, comments or tags change)."""
+    _bump_version(SIDEBAR_VERSION_KEY)
+
+
+def posts_version() -> int:
+    """Version of the published post set; bumped whenever a post changes."""
+    return _get_version(POSTS_VERSION_KEY)
+
+
+def bump_posts_version() -> None:
+    """Invalidate caches derived from post content (e.g. search results)."""
+    _bump_version(POSTS_VERSION_KEY)
+
+
+def feed_version() -> int:
+    """Version of feed output; bumped only when published content changes."""
+    return _get_version(FEED_VERSION_KEY)
+
+
+def bump_feed_version() -> None:
+    """Invalidate cached feed XML (a published post was added/edited/removed)."""
+    _bump_version(FEED_VERSION_KEY)
+
+
+def feed_cache_key(request) -> str:
+    """
+    Cache key for the serialized feed at this scheme, host and path. The
+    query string is left out: feeds ignore it, and keying on it would let
+    ``?x=<random>`` bypass the cache and fill it with copies.
+    """
+    return _feed_cache_key(request, feed_version())
+
+
+async def afeed_cache_key(request) -> str:
+    """``feed_cache_key`` for the async views."""
+    return _feed_cache_key(request, await _aget_version(FEED_VERSION_KEY))
+
+
+def _feed_cache_key(request, version):
+    url = f"{request.scheme}://{request.get_host()}{request.path}"
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return f"blog:feed:{version}:{digest}"
+
+
+def search_cache_key(backend, query, page) -> str:
+    """Cache key for one page of search results for ``query``."""
+    return _search_cache_key(backend, query, page, posts_version())
+
+
+async def asearch_cache_key(backend, query, page) -> str:
+    """``search_cache_key`` for the async views."""
+    return _search_cache_key(
+        backend, query, page, await _aget_version(POSTS_VERSION_KEY)
+    )
+
+
+def _search_cache_key(backend, query, page, version):
+    digest = hashlib.sha256(f"{backend}\0{query}\0{page}".encode("utf-8"))
+    return f"blog:search:{version}:{digest.hexdigest()}"
@@ -0,0 +1,34 @@
+"""
+Visibility into the psycopg connection pool (``DB_POOL``).
+
+The pool lives per process, so these numbers describe the worker that
+served the request. ``requests_wait_ms / requests_num`` is the mean time a
+request waited for a connection: if it climbs under load, or
+``requests_waiting`` stays above zero, raise ``DB_POOL_MAX_SIZE`` (keeping
+workers × max size below the server's ``max_connections``).
+"""
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+
+
+def pool_stats(alias="default"):
+    """Counters for ``alias``'s pool, or None when it isn't pooled."""
+    pool = getattr(connections[alias], "pool", None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    checkouts = stats.get("requests_num", 0)
+    stats["requests_wait_ms_avg"] = (
+        round(stats.get("requests_wait_ms", 0) / checkouts, 2) if checkouts else 0.0
+    )
+    return stats
+
+
+@staff_member_required
+def db_pool_stats(request):
+    return JsonResponse(
+        {alias: pool_stats(alias) for alias in connections},
+        json_dumps_params={"indent": 2},
+    )
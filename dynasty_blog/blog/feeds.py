@@ -1,26 +1,65 @@
+from django.conf import settings
 from django.contrib.syndication.views import Feed
-from django.template.defaultfilters import truncatewords_html
-from django.urls import reverse_lazy
-import markdown
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from taggit.models import Tag
 
+from . import metrics
+from .cache import feed_cache_key
 from .models import Post
+from .routers import pin_primary
 
 
-class LatestPostsFeed(Feed):
+class CachedFeedMixin:
+    """
+    Serve the serialized feed XML from the cache. The key includes the feed
+    version, which signals bump only when a published post is created,
+    edited, unpublished or re-tagged, so polling feed readers cost one cache
+    lookup and the item count doesn't change the per-request cost.
+    """
+
+    def __call__(self, request, *args, **kwargs):
+        key = feed_cache_key(request)
+        cached = cache.get(key)
+        metrics.cache_lookup("feed", cached is not None)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        # Cached under the current feed version, so read what that version
+        # describes from the primary, not a lagging replica.
+        with pin_primary():
+            response = super().__call__(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(
+                key,
+                (response.content, response["Content-Type"]),
+                settings.BLOG_FEED_CACHE_TIMEOUT,
+            )
+        return response
+
+
+class LatestPostsFeed(CachedFeedMixin, Feed):
     title = "Dynasty Blog"
     link = reverse_lazy("blog:post_list")
     description = "New posts from Dynasty Blog"
 
-    def items(self):
-        # Only published posts; adjust slice if you want more
-        return Post.published_posts.order_by("-published")[:5]
+    def get_queryset(self, obj=None):
+        return Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS)
+
+    def items(self, obj=None):
+        # Only published posts; BLOG_FEED_ITEMS sets how many
+        return self.get_queryset(obj).order_by("-published")[
+            : settings.BLOG_FEED_ITEMS
+        ]
 
     def item_title(self, item):
         return item.title
 
     def item_description(self, item):
-        html_content = markdown.markdown(item.body)
-        return truncatewords_html(html_content, 30)
+        return item.excerpt_html
 
     def item_link(self, item):
         # Optional (Feed will fall back to item.get_absolute_url if omitted)
@@ -33,3 +72,22 @@ class LatestPostsFeed(Feed):
     def item_updateddate(self, item):
         # Optional but nice for feed readers
         return item.updated_at
+
+
+class TagPostsFeed(LatestPostsFeed):
+    """Latest published posts with one tag (``/tag/<slug>/feed/``)."""
+
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def get_queryset(self, obj=None):
+        return super().get_queryset(obj).filter(tags__in=[obj])
+
+    def title(self, obj):
+        return f"Dynasty Blog: posts tagged “{obj.name}”"
+
+    def link(self, obj):
+        return reverse("blog:post_list_by_tag", args=[obj.slug])
+
+    def description(self, obj):
+        return f"New posts tagged “{obj.name}” from Dynasty Blog"
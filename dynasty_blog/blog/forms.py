@@ -16,4 +16,8 @@ class CommentForm(forms.ModelForm):
 
 
 class SearchForm(forms.Form):
-    query = forms.CharField()
+    query = forms.CharField(
+        widget=forms.TextInput(
+            attrs={"list": "title-suggestions", "autocomplete": "off"}
+        )
+    )
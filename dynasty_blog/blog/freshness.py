@@ -0,0 +1,98 @@
+"""
+Cheap validators for conditional GET (ETag / Last-Modified / 304).
+
+Each function takes the view's ``(request, *args, **kwargs)`` so it can be
+passed straight to ``django.views.decorators.http.condition``. Results are
+memoised on the request, so the ETag and Last-Modified callbacks share a
+single indexed query and a matching request is answered without running
+the view or rendering anything.
+"""
+
+import hashlib
+
+from django.db.models import Max, Q
+
+from .cache import feed_version, posts_version, sidebar_version
+from .models import Post
+
+
+def _etag(*parts):
+    return hashlib.md5(
+        ":".join(str(p) for p in parts).encode("utf-8"), usedforsecurity=False
+    ).hexdigest()
+
+
+def _latest_published_update(request):
+    if not hasattr(request, "_blog_latest_update"):
+        request._blog_latest_update = Post.published_posts.aggregate(
+            latest=Max("updated_at")
+        )["latest"]
+    return request._blog_latest_update
+
+
+def _post_freshness(request, year, month, day, post):
+    """``(updated_at, newest active comment, comment_count)`` or None (404)."""
+    if not hasattr(request, "_blog_post_freshness"):
+        request._blog_post_freshness = (
+            Post.published_posts.filter(
+                slug=post,
+                published__year=year,
+                published__month=month,
+                published__day=day,
+            )
+            .annotate(
+                last_comment=Max("comments__updated", filter=Q(comments__active=True))
+            )
+            .values_list("updated_at", "last_comment", "comment_count")
+            .first()
+        )
+    return request._blog_post_freshness
+
+
+# --- post_list / post_list_by_tag -------------------------------------
+def list_last_modified(request, *args, **kwargs):
+    return _latest_published_update(request)
+
+
+def list_etag(request, *args, **kwargs):
+    latest = _latest_published_update(request)
+    if latest is None:
+        return None
+    # The posts version catches deletions, which don't move max(updated_at);
+    # the sidebar version covers the sidebar rendered into every page.
+    return _etag("list", latest.isoformat(), posts_version(), sidebar_version())
+
+
+# --- post_detail -------------------------------------------------------
+def detail_last_modified(request, year, month, day, post):
+    freshness = _post_freshness(request, year, month, day, post)
+    if freshness is None:
+        return None
+    updated_at, last_comment, _ = freshness
+    return max(updated_at, last_comment) if last_comment else updated_at
+
+
+def detail_etag(request, year, month, day, post):
+    freshness = _post_freshness(request, year, month, day, post)
+    if freshness is None:
+        return None
+    updated_at, last_comment, comment_count = freshness
+    return _etag(
+        "detail",
+        updated_at.isoformat(),
+        last_comment.isoformat() if last_comment else "",
+        comment_count,
+        sidebar_version(),
+    )
+
+
+# --- feeds -------------------------------------------------------------
+def feed_last_modified(request, *args, **kwargs):
+    return _latest_published_update(request)
+
+
+def feed_etag(request, *args, **kwargs):
+    latest = _latest_published_update(request)
+    if latest is None:
+        return None
+    return _etag("feed", latest.isoformat(), feed_version())
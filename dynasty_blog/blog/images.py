@@ -0,0 +1,214 @@
+"""
+Responsive derivatives for ``Post.image``.
+
+Uploads are shown at many sizes (list, detail, video poster, the 40px admin
+thumbnail), so each image is resized with Pillow to ``BLOG_IMAGE_WIDTHS`` in
+AVIF/WebP (when this Pillow build supports them) plus JPEG as a universal
+fallback. Files are content-addressed (``<source sha256>/<width>.<ext>``),
+so they never change once written and can be cached forever.
+
+Generation runs off the request path: after an upload commits, the post is
+queued on a small in-process worker pool; ``generate_image_derivatives``
+backfills existing images across a process pool.
+"""
+
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_feed_version, bump_posts_version
+from .models import Post
+from .routers import pin_primary
+
+logger = logging.getLogger(__name__)
+
+DERIVED_PREFIX = "blog_images/derived"
+
+# Pillow save() arguments per output format
+FORMATS = {
+    "avif": {"format": "AVIF", "quality": 55},
+    "webp": {"format": "WEBP", "quality": 78, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+_executor = None
+
+
+def image_widths():
+    return sorted(
+        getattr(settings, "BLOG_IMAGE_WIDTHS", (160, 320, 640, 960, 1280, 1920))
+    )
+
+
+def available_formats():
+    """Output formats this Pillow build can write, best first."""
+    extensions = Image.registered_extensions()
+    wanted = [(".avif", "avif"), (".webp", "webp"), (".jpg", "jpeg")]
+    return [name for ext, name in wanted if ext in extensions]
+
+
+def _prepare_mode(image, fmt, has_alpha):
+    if has_alpha and fmt != "jpeg":
+        return image.convert("RGBA")
+    if has_alpha:
+        # JPEG has no alpha channel: flatten onto white rather than black.
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image.convert("RGBA"), mask=image.convert("RGBA"))
+        return background
+    return image.convert("RGB")
+
+
+def build_derivatives(image_name):
+    """
+    Create (or reuse) all derivatives for the stored image ``image_name``.
+    Returns the JSON stored in ``Post.image_derivatives``. Touches only the
+    storage, never the database, so it's safe to run in worker processes.
+    """
+    with default_storage.open(image_name, "rb") as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+
+    with Image.open(io.BytesIO(data)) as original:
+        original = ImageOps.exif_transpose(original)
+        width, height = original.size
+        has_alpha = original.mode in ("RGBA", "LA", "P")
+
+        # Never upscale; small originals get one derivative at native width.
+        widths = [w for w in image_widths() if w < width]
+        if not widths or width <= image_widths()[-1]:
+            widths.append(width)
+
+        variants = {}
+        for fmt in available_formats():
+            entries = []
+            for target in widths:
+                name = f"{DERIVED_PREFIX}/{digest}/{target}.{fmt}"
+                if not default_storage.exists(name):
+                    resized = original.copy()
+                    resized.thumbnail((target, height), Image.LANCZOS)
+                    resized = _prepare_mode(resized, fmt, has_alpha)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, **FORMATS[fmt])
+                    default_storage.save(name, ContentFile(buffer.getvalue()))
+                entries.append([target, name])
+            variants[fmt] = entries
+
+    return {
+        "name": image_name,
+        "source": digest,
+        "width": width,
+        "height": height,
+        "variants": variants,
+    }
+
+
+def needs_derivatives(post):
+    if not post.image:
+        return False
+    return (post.image_derivatives or {}).get("name") != post.image.name
+
+
+def generate_for_post(post_id):
+    """Build derivatives for one post and store them without re-saving it."""
+    post = Post.objects.only("id", "image", "image_derivatives").get(pk=post_id)
+    if not post.image:
+        derivatives = {}
+    else:
+        derivatives = build_derivatives(post.image.name)
+    # update() skips auto_now; moving updated_at changes the post's ETag
+    # and Last-Modified so clients pick up the new <picture> markup.
+    Post.objects.filter(pk=post_id).update(
+        image_derivatives=derivatives, updated_at=timezone.now()
+    )
+    bump_posts_version()
+    bump_feed_version()
+    return derivatives
+
+
+def _run_safely(post_id):
+    try:
+        # Runs right after the upload commits: don't read a lagging replica.
+        with pin_primary():
+            generate_for_post(post_id)
+    except Exception:
+        logger.exception("Could not generate image derivatives for post %s", post_id)
+
+
+def _run_in_worker(post_id):
+    try:
+        _run_safely(post_id)
+    finally:
+        # Worker threads get their own DB connection; don't leak it.
+        connection.close()
+
+
+def schedule_derivatives(post):
+    """Queue derivative generation for ``post`` once the transaction commits."""
+    global _executor
+    post_id = post.pk
+    if not getattr(settings, "BLOG_IMAGE_DERIVATIVES_ASYNC", True):
+        transaction.on_commit(lambda: _run_safely(post_id))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "BLOG_IMAGE_WORKERS", 2),
+            thread_name_prefix="blog-images",
+        )
+    transaction.on_commit(lambda: _executor.submit(_run_in_worker, post_id))
+
+
+def picture_sources(post):
+    """
+    ``(srcsets_by_format, fallback)`` for a ``<picture>``, or None while
+    derivatives aren't ready. ``srcsets_by_format`` maps a MIME type to a
+    srcset string; ``fallback`` is the JPEG ``(srcset, src, width, height)``.
+    """
+    if not post.image or needs_derivatives(post):
+        return None
+    derived = post.image_derivatives
+    variants = derived.get("variants", {})
+
+    def srcset(entries):
+        return ", ".join(f"{default_storage.url(name)} {w}w" for w, name in entries)
+
+    sources = {
+        f"image/{fmt}": srcset(variants[fmt])
+        for fmt in ("avif", "webp")
+        if variants.get(fmt)
+    }
+    jpeg = variants.get("jpeg")
+    if not jpeg:
+        return None
+    fallback = (
+        srcset(jpeg),
+        default_storage.url(jpeg[len(jpeg) // 2][1]),
+        derived.get("width"),
+        derived.get("height"),
+    )
+    return sources, fallback
+
+
+def derivative_url(post, min_width, fmt="jpeg"):
+    """
+    URL of the smallest ``fmt`` derivative at least ``min_width`` wide (or
+    the largest one), falling back to the original upload.
+    """
+    if not post.image:
+        return ""
+    entries = None
+    if not needs_derivatives(post):
+        entries = post.image_derivatives.get("variants", {}).get(fmt)
+    if not entries:
+        return post.image.url
+    for width, name in entries:
+        if width >= min_width:
+            return default_storage.url(name)
+    return default_storage.url(entries[-1][1])
@@ -0,0 +1,85 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import benchmarks
+
+COLUMNS = ("p50_ms", "p95_ms", "p99_ms", "max_ms", "queries")
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the public views against the current database and compare with "
+        "a stored baseline; exits non-zero on a regression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request.",
+        )
+        parser.add_argument(
+            "--only", nargs="+", metavar="SCENARIO", help="Run only these scenarios."
+        )
+        parser.add_argument(
+            "--baseline",
+            default=str(settings.BASE_DIR / "benchmarks" / "baseline.json"),
+        )
+        parser.add_argument(
+            "--save-baseline",
+            action="store_true",
+            help="Write the results to --baseline instead of comparing.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.25,
+            help="Allowed p95 slowdown factor (default: 1.25).",
+        )
+
+    def _row(self, name, result):
+        cells = "".join(f"{result[column]:>10}" for column in COLUMNS)
+        self.stdout.write(f"{name:<24}{cells}")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        self.stdout.write(f"{'scenario':<24}" + "".join(f"{c:>10}" for c in COLUMNS))
+        report = benchmarks.run(
+            iterations=options["iterations"],
+            cold=options["cold"],
+            only=options["only"],
+            progress=self._row,
+        )
+        if not report["results"]:
+            raise CommandError("Nothing to benchmark: no published posts.")
+        path = options["baseline"]
+
+        if options["save_baseline"]:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            benchmarks.save(report, path)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}."))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(f"No baseline at {path}; use --save-baseline.")
+            return
+        baseline = benchmarks.load(path)
+        changed = {
+            key: (value, report["meta"].get(key))
+            for key, value in baseline.get("meta", {}).items()
+            if key != "python" and report["meta"].get(key) != value
+        }
+        for key, (old, new) in changed.items():
+            self.stdout.write(
+                self.style.WARNING(f"Dataset differs from baseline: {key} {old} -> {new}")
+            )
+        regressions = benchmarks.compare(report, baseline, options["tolerance"])
+        if regressions:
+            for name, problem in regressions:
+                self.stderr.write(f"{name}: {problem}")
+            raise CommandError(f"{len(regressions)} regression(s) against {path}.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
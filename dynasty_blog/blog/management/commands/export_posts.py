@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import archive
+from blog.models import Post
+from blog.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Export posts with their tags and comments as JSONL or as a directory "
+        "of Markdown files with front matter (the formats import_posts reads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=["jsonl", "markdown"], default="jsonl"
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            default="-",
+            help=(
+                "JSONL file ('-' for stdout) or directory for --format markdown "
+                "(.md and comments files there from earlier exports are replaced)."
+            ),
+        )
+        parser.add_argument(
+            "--published-only",
+            action="store_true",
+            help="Skip drafts.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Posts fetched per query (default: 500).",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        manager = Post.published_posts if options["published_only"] else Post.objects
+        records = archive.export_records(
+            manager.all(), chunk_size=max(1, options["batch_size"])
+        )
+        output = options["output"]
+        start = time.monotonic()
+
+        if options["format"] == "markdown":
+            if output == "-":
+                raise CommandError("--format markdown needs --output DIRECTORY.")
+            count = archive.write_markdown_dir(records, output)
+        elif output == "-":
+            count = archive.write_jsonl(records, self.stdout)
+            return
+        else:
+            with open(output, "w", encoding="utf-8") as fh:
+                count = archive.write_jsonl(records, fh)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {count} post(s) to {output} "
+                f"in {time.monotonic() - start:.1f}s."
+            )
+        )
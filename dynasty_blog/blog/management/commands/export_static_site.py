@@ -0,0 +1,84 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blog import static_site
+from blog.routers import pin_primary
+
+
+def _init_worker():
+    # Needed when the pool doesn't fork (spawn/forkserver start methods).
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every published post, list and tag page, the feed and the "
+        "sitemaps to static files. Re-runs only re-render pages whose posts, "
+        "comments or tags changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Directory to write the site to.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Rendering processes (default: CPU count).",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Re-render every page."
+        )
+        parser.add_argument(
+            "--host",
+            help="Host the pages are rendered for (default: first ALLOWED_HOSTS).",
+        )
+        parser.add_argument(
+            "--insecure",
+            action="store_false",
+            dest="secure",
+            help="Render over http:// instead of https://.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Pages per worker task (default: 50).",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        kwargs = dict(
+            host=options["host"],
+            secure=options["secure"],
+            force=options["force"],
+            batch_size=max(1, options["batch_size"]),
+            log=self.stdout.write if options["verbosity"] > 1 else lambda m: None,
+        )
+        output = os.path.abspath(options["output"])
+        if options["workers"] > 1:
+            # Forked workers must not share the parent's database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=_init_worker
+            ) as pool:
+                result = static_site.build(
+                    output, map_fn=partial(pool.map, chunksize=1), **kwargs
+                )
+        else:
+            result = static_site.build(output, **kwargs)
+
+        for path, error in sorted(result["failed"].items()):
+            self.stderr.write(f"{path}: {error}")
+        summary = (
+            f"Rendered {result['rendered']} file(s) for {result['pages']} "
+            f"page(s); removed {result['removed']}"
+        )
+        if result["failed"]:
+            # Failed pages stay out of the manifest and are retried next run.
+            raise CommandError(f"{summary}; {len(result['failed'])} failed.")
+        self.stdout.write(self.style.SUCCESS(f"{summary}."))
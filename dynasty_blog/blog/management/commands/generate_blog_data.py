@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blog import synthetic
+from blog.routers import pin_primary
+
+
+def _init_worker():
+    # Needed when the pool doesn't fork (spawn/forkserver start methods).
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic archive (posts, comments, tags) with bulk_create "
+        "for benchmarking. Use --clear to remove it again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=200)
+        parser.add_argument("--authors", type=int, default=5)
+        parser.add_argument(
+            "--years", type=int, default=10, help="Spread publish dates over this."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes rendering Markdown (default: CPU count).",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete previously generated posts instead of adding more.",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted = synthetic.clear()
+            self.stdout.write(
+                self.style.SUCCESS(f"Deleted {deleted} synthetic post(s).")
+            )
+            return
+
+        if not 0 <= options["posts"] <= 100_000:
+            raise CommandError("--posts must be between 0 and 100,000.")
+        if not 0 <= options["comments"] <= 1_000_000:
+            raise CommandError("--comments must be between 0 and 1,000,000.")
+
+        kwargs = dict(
+            posts=options["posts"],
+            comments=options["comments"],
+            tags=max(1, options["tags"]),
+            authors=max(1, options["authors"]),
+            years=max(1, options["years"]),
+            batch_size=max(1, options["batch_size"]),
+            seed=options["seed"],
+            log=self.stdout.write if options["verbosity"] > 1 else lambda m: None,
+        )
+        if options["workers"] > 1:
+            # Forked workers must not share the parent's database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=_init_worker
+            ) as pool:
+                created = synthetic.generate(
+                    map_fn=partial(pool.map, chunksize=25), **kwargs
+                )
+        else:
+            created = synthetic.generate(**kwargs)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Generated {posts} post(s), {comments} comment(s) "
+                "across {tags} tag(s).".format(**created)
+            )
+        )
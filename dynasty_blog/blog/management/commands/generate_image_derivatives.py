@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from blog.cache import bump_feed_version, bump_posts_version
+from blog.images import build_derivatives, needs_derivatives
+from blog.models import Post
+from blog.routers import pin_primary
+
+
+def _init_worker():
+    # Needed when the pool doesn't fork (spawn/forkserver start methods).
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate responsive image derivatives for existing posts, in parallel "
+        "across a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: CPU count).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild derivative metadata even for posts that look current.",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True).only(
+            "id", "image", "image_derivatives"
+        )
+        todo = [
+            (post.pk, post.image.name)
+            for post in posts.iterator()
+            if options["force"] or needs_derivatives(post)
+        ]
+        if not todo:
+            self.stdout.write("All post images already have derivatives.")
+            return
+
+        # Forked workers must not share the parent's database connections.
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=max(1, options["workers"]), initializer=_init_worker
+        ) as pool:
+            futures = {pool.submit(build_derivatives, name): pk for pk, name in todo}
+            for future in as_completed(futures):
+                pk = futures[future]
+                try:
+                    derivatives = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Post {pk}: {exc}")
+                    continue
+                # As in images.generate_for_post: move updated_at so the
+                # post's validators change with its <picture> markup.
+                Post.objects.filter(pk=pk).update(
+                    image_derivatives=derivatives, updated_at=timezone.now()
+                )
+                done += 1
+
+        bump_posts_version()
+        bump_feed_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated derivatives for {done} post(s); {failed} failed."
+            )
+        )
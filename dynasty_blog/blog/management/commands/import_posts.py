@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import archive
+from blog.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts with their tags and comments from a JSONL file ('-' for "
+        "stdin) or a directory of Markdown files with front matter, in batched "
+        "bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="JSONL file, '-' or a directory.")
+        parser.add_argument(
+            "--format",
+            choices=["auto", "jsonl", "markdown"],
+            default="auto",
+            help="Default: markdown for a directory, jsonl otherwise.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Posts per chunk and transaction (default: 500).",
+        )
+        parser.add_argument(
+            "--author", help="Username for records that don't name an author."
+        )
+        parser.add_argument(
+            "--no-create-authors",
+            action="store_false",
+            dest="create_authors",
+            help="Fail on unknown authors instead of creating them.",
+        )
+
+    def _records(self, source, fmt):
+        if fmt == "auto":
+            fmt = "markdown" if os.path.isdir(source) else "jsonl"
+        if fmt == "markdown":
+            if not os.path.isdir(source):
+                raise CommandError(f"{source} is not a directory.")
+            yield from archive.read_markdown_dir(source)
+        elif source == "-":
+            yield from archive.read_jsonl(sys.stdin, "<stdin>")
+        else:
+            if not os.path.isfile(source):
+                raise CommandError(f"{source} does not exist.")
+            with open(source, encoding="utf-8") as fh:
+                yield from archive.read_jsonl(fh, source)
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        importer = archive.Importer(
+            batch_size=max(1, options["batch_size"]),
+            default_author=options["author"],
+            create_authors=options["create_authors"],
+        )
+        start = time.monotonic()
+
+        def progress(stats):
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                f"{stats['posts']} posts, {stats['comments']} comments "
+                f"({stats['posts'] / max(elapsed, 1e-6):.0f} posts/s)"
+            )
+
+        try:
+            stats = importer.run(
+                self._records(options["source"], options["format"]),
+                progress=progress if options["verbosity"] > 0 else lambda s: None,
+            )
+        except archive.ArchiveError as exc:
+            # Chunks before the failing one are committed.
+            raise CommandError(
+                f"{exc} ({importer.stats['posts']} posts imported before the error)"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported {posts} post(s) and {comments} comment(s); created "
+                "{tags} tag(s) and {authors} author(s); renamed {renamed} "
+                "duplicate slug(s).".format(**stats)
+                + f" {time.monotonic() - start:.1f}s."
+            )
+        )
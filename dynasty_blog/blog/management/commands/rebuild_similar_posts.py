@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post, SimilarPost
+from blog.routers import pin_primary
+from blog.similar import rebuild_similar_posts
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed similar-posts table for every published post."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of posts recomputed per statement (default: 500).",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+
+        # Drafts never show similar posts; drop any stale rows they have.
+        SimilarPost.objects.exclude(post__status=Post.Status.PUBLISHED).delete()
+
+        batch = []
+        total = 0
+        ids = Post.published_posts.order_by("id").values_list("id", flat=True)
+        for post_id in ids.iterator(chunk_size=batch_size):
+            batch.append(post_id)
+            if len(batch) >= batch_size:
+                rebuild_similar_posts(batch, batch_size)
+                total += len(batch)
+                batch = []
+        if batch:
+            rebuild_similar_posts(batch, batch_size)
+            total += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt similar posts for {total} post(s).")
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.comment_count (active comments) for every post in bulk."
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        updated = Post.recount_comments()
+        self.stdout.write(
+            self.style.SUCCESS(f"Recounted comments for {updated} post(s).")
+        )
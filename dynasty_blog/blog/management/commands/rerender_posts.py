@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.cache import bump_feed_version, bump_posts_version, bump_sidebar_version
+from blog.models import Post
+from blog.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render stored Markdown HTML, excerpts and reading times for posts. "
+        "Only posts whose source or renderer version changed are rebuilt "
+        "unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-render every post, even if its stored HTML looks current.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of posts written per bulk update (default: 500).",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        force = options["force"]
+        batch_size = max(1, options["batch_size"])
+        # bulk_update skips auto_now: move updated_at ourselves so ETags and
+        # Last-Modified (blog/freshness.py) change with the HTML.
+        fields = [*Post.RENDERED_FIELDS, "updated_at"]
+
+        batch = []
+        seen = rendered = 0
+        queryset = Post.objects.only("id", "body", "body_html_hash").order_by("id")
+        for post in queryset.iterator(chunk_size=batch_size):
+            seen += 1
+            if post.refresh_body_html(force=force):
+                post.updated_at = timezone.now()
+                batch.append(post)
+            if len(batch) >= batch_size:
+                Post.objects.bulk_update(batch, fields)
+                rendered += len(batch)
+                batch = []
+        if batch:
+            Post.objects.bulk_update(batch, fields)
+            rendered += len(batch)
+        if rendered:
+            bump_posts_version()
+            bump_feed_version()
+            bump_sidebar_version()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Re-rendered {rendered} of {seen} post(s).")
+        )
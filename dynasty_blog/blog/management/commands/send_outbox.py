@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import metrics
+from blog.outbox import OutboxSender
+from blog.routers import pin_primary
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbox emails over one reused mail connection, "
+        "retrying failures with backoff. Runs until stopped unless --once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send what is due now and exit (e.g. from cron).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.BLOG_OUTBOX_BATCH_SIZE,
+            help="Rows claimed per batch (default: BLOG_OUTBOX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.BLOG_OUTBOX_RATE,
+            help="Maximum messages per second, 0 = unlimited "
+            "(default: BLOG_OUTBOX_RATE).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.BLOG_OUTBOX_POLL_INTERVAL,
+            help="Seconds to sleep when the outbox is empty.",
+        )
+
+    @pin_primary()
+    def handle(self, *args, **options):
+        batch_size = max(1, options["batch_size"])
+        sender = OutboxSender(rate=max(0.0, options["rate"]))
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = sender.send_batch(batch_size)
+                total_sent += sent
+                total_failed += failed
+                # Publish outcome counters for /metrics (BLOG_METRICS_DIR).
+                metrics.maybe_flush()
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}.")
+                if options["once"]:
+                    if sent + failed < batch_size:
+                        break
+                elif not (sent or failed):
+                    # Idle: let the relay drop the connection rather than
+                    # holding it open indefinitely.
+                    sender.close()
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Outbox: {total_sent} sent, {total_failed} failed attempt(s)."
+            )
+        )
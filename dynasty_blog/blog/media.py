@@ -0,0 +1,139 @@
+"""
+Media delivery with HTTP Range support.
+
+Audio and video uploads can be up to ``MAX_UPLOAD_MB``; players seek with
+``Range`` requests, so this view answers them with ``206 Partial Content``.
+Whole files go out through ``FileResponse`` (which WSGI servers such as
+gunicorn turn into ``os.sendfile``). Responses carry a strong ETag and
+long-lived cache headers, since uploads are never rewritten in place.
+
+With ``BLOG_MEDIA_OFFLOAD`` set, the view only checks the path and returns
+an ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache/lighttpd) header;
+the front proxy then streams the bytes and handles ranges itself, so no
+Python worker is tied up pushing a video.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(path, stat):
+    raw = f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")
+    return '"%s"' % hashlib.sha1(raw, usedforsecurity=False).hexdigest()
+
+
+def _parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single ``bytes=`` range, None when
+    there's no usable Range header, or "invalid" when it can't be satisfied.
+    Multi-range requests are answered with the whole file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, length):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(response, etag, stat):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = (
+        f"public, max-age={settings.BLOG_MEDIA_MAX_AGE}, immutable"
+    )
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except Exception:  # SuspiciousFileOperation: path escapes MEDIA_ROOT
+        raise Http404("Not found.")
+    if not os.path.isfile(fullpath):
+        raise Http404("Not found.")
+
+    stat = os.stat(fullpath)
+    etag = _etag(path, stat)
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or "application/octet-stream"
+
+    offload = getattr(settings, "BLOG_MEDIA_OFFLOAD", "")
+    if offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == "nginx":
+            prefix = settings.BLOG_MEDIA_ACCEL_PREFIX.rstrip("/")
+            response["X-Accel-Redirect"] = f"{prefix}/{path}"
+        else:
+            response["X-Sendfile"] = fullpath
+        return _cache_headers(response, etag, stat)
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return _cache_headers(HttpResponseNotModified(), etag, stat)
+
+    byte_range = _parse_range(request.headers.get("Range"), stat.st_size)
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag:
+        byte_range = None  # the client's partial copy is stale: send it all
+
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return _cache_headers(response, etag, stat)
+
+    if byte_range is None:
+        response = FileResponse(open(fullpath, "rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_range(fullpath, start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return _cache_headers(response, etag, stat)
@@ -0,0 +1,415 @@
+"""
+In-process metrics in the Prometheus text format, served at ``/metrics``.
+
+Recording is lock-free: each thread adds to its own dict (a *shard*), and
+a scrape sums the shards. Only creating a thread's shard, once, takes a
+lock. When a thread exits, its shard is folded into one process-wide
+*retired* total, so thread-per-request servers don't pile up shards. The
+request metrics are recorded by ``RequestTimingMiddleware`` (blog/timing.py)
+from the numbers it already collects.
+
+Several worker processes (gunicorn, the ``send_outbox`` worker): set
+``BLOG_METRICS_DIR`` to a directory shared by all of them. Each process
+writes a snapshot of its totals there (``metrics-<host>-<pid>-<random>.json``,
+atomically replaced; the random part stops a restarted container that
+reuses a PID from overwriting the dead process's totals) at most every
+``BLOG_METRICS_FLUSH_INTERVAL`` seconds, from whichever request or batch
+finishes next, and at exit. A scrape of any worker merges every file with
+its own live values, so totals survive restarts too; clear the directory
+when deploying if they shouldn't.
+
+So the directory doesn't grow with every restart, the scraping process
+adopts the files of processes that have exited: their totals are folded
+into its own retired totals, and the file is removed. An exited process
+is one from this host whose PID is gone, or, since PIDs on other hosts
+can't be checked, one whose file hasn't been rewritten for
+``BLOG_METRICS_RETENTION`` seconds.
+"""
+
+import atexit
+import json
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = {}  # name -> metric, in registration order
+
+_local = threading.local()
+_shards = {}  # id(shard) -> shard, for every live thread in this process
+_retired = {}  # summed shards of threads that have exited
+_retiring = deque()  # shards of exited threads, not yet in _retired
+_shards_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_host = socket.gethostname().replace(os.sep, "_") or "localhost"
+
+
+def _new_process_id():
+    return f"{_host}-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+_process_id = _new_process_id()
+
+
+class _ShardOwner:
+    """Lives only in the thread-local, so it's freed when the thread exits."""
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        _local.owner = _ShardOwner()
+        # Runs wherever the thread-local is torn down: no locks, just queue.
+        weakref.finalize(_local.owner, _retiring.append, shard)
+        with _shards_lock:
+            _retire_exited()
+            _shards[id(shard)] = shard
+    return shard
+
+
+def _retire_exited():
+    """Fold exited threads' shards into ``_retired``. Caller holds the lock."""
+    while _retiring:
+        shard = _retiring.popleft()
+        if _shards.pop(id(shard), None) is None:
+            continue  # dropped by _reset_after_fork
+        for key, value in shard.items():
+            _retired[key] = REGISTRY[key[0]]._merge(_retired.get(key), value)
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero (the parent's counts are its own),
+    # with fresh locks in case another thread held one during the fork.
+    global _local, _shards_lock, _flush_lock, _last_flush, _process_id
+    _local = threading.local()
+    _shards.clear()
+    _retired.clear()
+    _retiring.clear()
+    _shards_lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _last_flush = 0.0
+    _process_id = _new_process_id()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        REGISTRY[name] = self
+
+    def inc(self, *labels, amount=1):
+        shard = _shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def _samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram:
+    """Stored per label set as ``[count per bucket..., +Inf, sum]``."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        REGISTRY[name] = self
+
+    def observe(self, value, *labels):
+        shard = _shard()
+        key = (self.name, labels)
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * (len(self.buckets) + 2)
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        values[index] += 1
+        values[-1] += value
+
+    def _merge(self, total, values):
+        if total is None:
+            return list(values)
+        return [a + b for a, b in zip(total, values)]
+
+    def _samples(self, labels, values):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), values):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            yield f"{self.name}_bucket", labels + (("le", le),), cumulative
+        yield f"{self.name}_sum", labels, values[-1]
+        yield f"{self.name}_count", labels, cumulative
+
+
+# ---------------------------------------------------------------------
+# The blog's metrics
+# ---------------------------------------------------------------------
+REQUEST_DURATION = Histogram(
+    "blog_request_duration_seconds", "Time to respond, per blog view.", ["view"]
+)
+RESPONSES = Counter(
+    "blog_responses_total",
+    "Responses per blog view and status code.",
+    ["view", "status"],
+)
+DB_QUERIES = Counter(
+    "blog_db_queries_total", "SQL queries run, per blog view.", ["view"]
+)
+DB_SECONDS = Counter(
+    "blog_db_query_seconds_total", "Time spent in SQL, per blog view.", ["view"]
+)
+CACHE_LOOKUPS = Counter(
+    "blog_cache_lookups_total", "Lookups in the blog's caches.", ["cache"]
+)
+CACHE_MISSES = Counter(
+    "blog_cache_misses_total", "Lookups that missed, per cache.", ["cache"]
+)
+EMAILS = Counter(
+    "blog_emails_total",
+    "Share emails by outcome: queued, sent, retry, failed.",
+    ["outcome"],
+)
+COMMENTS = Counter(
+    "blog_comments_total",
+    "Comment submissions by outcome: accepted, invalid, duplicate.",
+    ["outcome"],
+)
+RATE_LIMITED = Counter(
+    "blog_rate_limited_total", "Requests rejected with 429, per scope.", ["scope"]
+)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache)
+    if not hit:
+        CACHE_MISSES.inc(cache)
+
+
+def observe_request(request, response, timing, duration):
+    match = getattr(request, "resolver_match", None)
+    if match is None or match.namespace != "blog":
+        return
+    view = match.view_name
+    REQUEST_DURATION.observe(duration, view)
+    RESPONSES.inc(view, str(response.status_code))
+    count, seconds = timing.metrics.get("db", (0, 0.0))
+    if count:
+        DB_QUERIES.inc(view, amount=count)
+        DB_SECONDS.inc(view, amount=seconds)
+
+
+# ---------------------------------------------------------------------
+# Collection, multiprocess files and exposition
+# ---------------------------------------------------------------------
+def snapshot():
+    """This process's totals: ``{(name, labels): value}``."""
+    with _shards_lock:
+        _retire_exited()
+        shards = list(_shards.values())
+        # Merges replace values rather than mutating them: a shallow copy
+        # is a consistent view.
+        totals = dict(_retired)
+    for shard in shards:
+        for key, value in shard.copy().items():
+            totals[key] = REGISTRY[key[0]]._merge(totals.get(key), value)
+    return totals
+
+
+def _directory():
+    return getattr(settings, "BLOG_METRICS_DIR", "")
+
+
+def _own_file(directory):
+    return os.path.join(directory, f"metrics-{_process_id}.json")
+
+
+def flush():
+    """Write this process's snapshot to ``BLOG_METRICS_DIR`` (if set)."""
+    global _last_flush
+    directory = _directory()
+    if not directory:
+        return
+    _last_flush = time.monotonic()
+    rows = [
+        [name, list(labels), value] for (name, labels), value in snapshot().items()
+    ]
+    os.makedirs(directory, exist_ok=True)
+    path = _own_file(directory)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(rows, fh)
+    os.replace(tmp, path)
+
+
+def maybe_flush():
+    """:func:`flush` if the interval has passed. Never waits for another thread."""
+    if not _directory():
+        return
+    interval = getattr(settings, "BLOG_METRICS_FLUSH_INTERVAL", 5)
+    if time.monotonic() - _last_flush < interval:
+        return
+    if _flush_lock.acquire(blocking=False):
+        try:
+            flush()
+        finally:
+            _flush_lock.release()
+
+
+@atexit.register
+def _flush_at_exit():
+    if _directory():
+        flush()
+
+
+def _has_exited(entry):
+    """Whether the process that wrote ``entry`` is gone (see the module docs)."""
+    parts = entry.name[len("metrics-") : -len(".json")].rsplit("-", 2)
+    if len(parts) == 3 and parts[0] == _host and parts[1].isdigit():
+        if os.name != "posix":
+            return False  # os.kill(pid, 0) would terminate it on Windows
+        try:
+            os.kill(int(parts[1]), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # alive, but not ours to signal
+        return False
+    retention = getattr(settings, "BLOG_METRICS_RETENTION", 86400)
+    try:
+        return time.time() - entry.stat().st_mtime > retention
+    except OSError:
+        return False  # already adopted by another process
+
+
+def _merge_rows(totals, rows):
+    """Add a snapshot file's ``[name, labels, value]`` rows to ``totals``."""
+    for name, labels, value in rows:
+        metric = REGISTRY.get(name)
+        if metric is not None:
+            key = (name, tuple(labels))
+            totals[key] = metric._merge(totals.get(key), value)
+
+
+def _adopt(path):
+    """Fold an exited process's file into our retired totals and remove it."""
+    # Renaming claims the file: only one process's rename succeeds.
+    claimed = f"{path}.{_process_id}.adopting"
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return
+    try:
+        with open(claimed, encoding="utf-8") as fh:
+            rows = json.load(fh)
+    except (OSError, ValueError):
+        rows = []
+    with _shards_lock:
+        _merge_rows(_retired, rows)
+    # Written to our own file before the adopted one goes away.
+    with _flush_lock:
+        flush()
+    os.remove(claimed)
+
+
+def collect():
+    """Totals across every process writing to ``BLOG_METRICS_DIR``."""
+    directory = _directory()
+    if not directory or not os.path.isdir(directory):
+        return snapshot()
+    own = os.path.basename(_own_file(directory))
+    others = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json") or entry.name == own:
+            continue
+        if _has_exited(entry):
+            _adopt(entry.path)
+        else:
+            others.append(entry.path)
+    totals = snapshot()
+    for path in others:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                rows = json.load(fh)
+        except (OSError, ValueError):
+            continue  # being replaced or adopted right now
+        _merge_rows(totals, rows)
+    return totals
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def exposition(totals=None):
+    """The text exposition format for ``totals`` (default: :func:`collect`)."""
+    totals = collect() if totals is None else totals
+    by_metric = {}
+    for (name, labels), value in totals.items():
+        by_metric.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(by_metric.get(name, ())):
+            pairs = tuple(zip(metric.labels, labels))
+            for sample, sample_labels, sample_value in metric._samples(pairs, value):
+                lines.append(
+                    f"{sample}{_format_labels(sample_labels)} "
+                    f"{_format_value(sample_value)}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    ``/metrics`` for Prometheus. 404 unless ``BLOG_METRICS``; with
+    ``BLOG_METRICS_TOKEN`` set, scrapers must send it as a bearer token.
+    """
+    if not settings.BLOG_METRICS:
+        raise Http404("Metrics are disabled.")
+    token = settings.BLOG_METRICS_TOKEN
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not constant_time_compare(supplied, token):
+            return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:30
+
+import markdown
+from django.conf import settings
+from django.db import migrations, models
+
+
+def render_existing_posts(apps, schema_editor):
+    # A frozen copy of blog.rendering.render_markdown, so later changes to
+    # the renderer can't break this migration. body_html_hash is left blank:
+    # `rerender_posts` (or the next save) re-renders with the live renderer.
+    extensions = list(getattr(settings, "BLOG_MARKDOWN_EXTENSIONS", []))
+    Post = apps.get_model("blog", "Post")
+    batch = []
+    for post in Post.objects.only("id", "body").iterator(chunk_size=500):
+        post.body_html = markdown.markdown(post.body or "", extensions=extensions)
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ["body_html"])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ["body_html"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_audio_post_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='body_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='body_html_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
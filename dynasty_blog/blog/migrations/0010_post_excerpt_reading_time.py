@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:31
+
+import math
+
+import markdown
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+FIELDS = ["body_html", "excerpt_html", "word_count", "reading_time"]
+
+
+def fill_rendered_fields(apps, schema_editor):
+    # Frozen copies of the blog.rendering helpers as of this migration.
+    # body_html_hash is left as it was, so `rerender_posts` (or the next
+    # save) brings these fields in line with the live renderer.
+    extensions = list(getattr(settings, "BLOG_MARKDOWN_EXTENSIONS", []))
+    excerpt_words = int(getattr(settings, "BLOG_EXCERPT_WORDS", 30))
+    words_per_minute = max(1, int(getattr(settings, "BLOG_WORDS_PER_MINUTE", 200)))
+    Post = apps.get_model("blog", "Post")
+    batch = []
+    for post in Post.objects.only("id", "body").iterator(chunk_size=500):
+        post.body_html = markdown.markdown(post.body or "", extensions=extensions)
+        post.excerpt_html = Truncator(post.body_html).words(
+            excerpt_words, html=True, truncate=" …"
+        )
+        post.word_count = len(strip_tags(post.body_html).split())
+        post.reading_time = max(1, math.ceil(post.word_count / words_per_minute))
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, FIELDS)
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_body_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rendered_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:35
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Same weighting post_search used to compute per query: title A, body B.
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION blog_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector(coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector(coalesce(NEW.body, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS blog_post_search_vector_trigger ON blog_post;
+CREATE TRIGGER blog_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, body ON blog_post
+    FOR EACH ROW EXECUTE FUNCTION blog_post_search_vector_update();
+
+UPDATE blog_post SET search_vector =
+    setweight(to_tsvector(coalesce(title, '')), 'A') ||
+    setweight(to_tsvector(coalesce(body, '')), 'B');
+
+CREATE INDEX IF NOT EXISTS blog_post_search_vector_gin
+    ON blog_post USING gin (search_vector);
+"""
+
+DROP_TRIGGER = """
+DROP INDEX IF EXISTS blog_post_search_vector_gin;
+DROP TRIGGER IF EXISTS blog_post_search_vector_trigger ON blog_post;
+DROP FUNCTION IF EXISTS blog_post_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    # Only run on PostgreSQL
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_TRIGGER, params=None)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_TRIGGER, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, reverse_code=drop_search_trigger),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    # Only run on PostgreSQL (pg_trgm is installed by 0007_trigram_ext)
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS blog_post_title_trgm "
+            "ON blog_post USING gin (title gin_trgm_ops);"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS blog_post_title_trgm;")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0012_post_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, reverse_code=drop_trigram_index),
+    ]
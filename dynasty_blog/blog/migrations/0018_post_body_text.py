@@ -0,0 +1,95 @@
+from html import unescape
+
+from django.db import OperationalError, migrations, models
+from django.utils.html import strip_tags
+
+# Frozen copies of blog.rendering.plain_text and the blog.search FTS5
+# statements as of this migration, so later changes there can't alter it.
+FTS_TABLE = "blog_post_fts"
+FTS_TRIGGERS = [f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"]
+
+STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, body_text, content='blog_post', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body_text)
+        VALUES (new.id, new.title, new.body_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body_text)
+        VALUES ('delete', old.id, old.title, old.body_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, body_text ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body_text)
+        VALUES ('delete', old.id, old.title, old.body_text);
+        INSERT INTO {FTS_TABLE}(rowid, title, body_text)
+        VALUES (new.id, new.title, new.body_text);
+    END
+    """,
+]
+
+
+def fill_body_text(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    batch = []
+    for post in Post.objects.only("id", "body_html").iterator(chunk_size=500):
+        post.body_text = unescape(strip_tags(post.body_html or ""))
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ["body_text"])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ["body_text"])
+
+
+def _drop(schema_editor):
+    for trigger in FTS_TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE};")
+
+
+def reindex_fts(apps, schema_editor):
+    # The FTS5 table now indexes body_text instead of the Markdown source,
+    # so snippets are cut from plain text.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    _drop(schema_editor)
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            for statement in STATEMENTS:
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError:
+        pass  # this SQLite build has no FTS5; search falls back to the ORM
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        _drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='body_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_body_text, migrations.RunPython.noop),
+        migrations.RunPython(reindex_fts, reverse_code=drop_fts),
+    ]
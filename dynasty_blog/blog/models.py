@@ -1,13 +1,24 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils import timezone
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
 from taggit.managers import TaggableManager
 
+from .rendering import (
+    count_words,
+    make_excerpt,
+    plain_text,
+    reading_time,
+    render_markdown,
+    source_hash,
+)
+
 
 # --- Make User objects display as full name in Admin & ForeignKey widgets ---
 def _patch_user_str():
@@ -77,8 +88,29 @@ class Post(models.Model):
     )
     body = models.TextField()
 
+    # Pre-rendered Markdown (rebuilt on save, see refresh_body_html)
+    body_html = models.TextField(blank=True, default="", editable=False)
+    body_html_hash = models.CharField(
+        max_length=64, blank=True, default="", editable=False
+    )
+    # Derived from body_html so list/search/feed pages never need the body
+    excerpt_html = models.TextField(blank=True, default="", editable=False)
+    # Tag-free text of body_html; search snippets are cut from this
+    body_text = models.TextField(blank=True, default="", editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False)
+
+    # Number of active comments, maintained with F() updates (see signals.py)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Weighted title/body tsvector, filled by a database trigger on
+    # PostgreSQL (migration 0012) and GIN-indexed there; unused elsewhere.
+    search_vector = SearchVectorField(null=True, editable=False)
+
     # Media fields (all optional)
     image = models.ImageField(upload_to="blog_images/", blank=True, null=True)
+    # Resized AVIF/WebP/JPEG variants of ``image`` (see blog/images.py)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     audio = models.FileField(
         upload_to="blog_audio/",
         blank=True,
@@ -114,6 +146,21 @@ class Post(models.Model):
         default=Status.DRAFT,
     )
 
+    # Columns rebuilt together by refresh_body_html()
+    RENDERED_FIELDS = (
+        "body_html",
+        "body_html_hash",
+        "excerpt_html",
+        "body_text",
+        "word_count",
+        "reading_time",
+    )
+    # Columns not needed to render a post summary (lists, search, feed)
+    LIST_DEFERRED_FIELDS = ("body", "body_html", "body_text", "search_vector")
+    # Columns only ever written by the database or atomic updates; a full
+    # save() of a possibly stale instance must not write them back.
+    DB_MANAGED_FIELDS = ("comment_count", "search_vector", "image_derivatives")
+
     # Managers
     objects = models.Manager()  # Default manager
     published_posts = PublishedManager()  # Custom manager for published posts
@@ -125,6 +172,7 @@ class Post(models.Model):
         ordering = ["-published"]
         indexes = [
             models.Index(fields=["-published"]),
+            models.Index(fields=["status", "-comment_count", "-published"]),
         ]
         verbose_name = "Post"
         verbose_name_plural = "Posts"
@@ -132,6 +180,69 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signals notice publish/unpublish (see blog/similar.py).
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def refresh_body_html(self, force=False) -> bool:
+        """
+        Re-render ``body`` into ``body_html`` (plus excerpt, plain text, word
+        count and reading time) if the source or the renderer changed since the last
+        render. Returns True when the fields were rebuilt.
+        """
+        current = source_hash(self.body)
+        if not force and current == self.body_html_hash:
+            return False
+        self.body_html = render_markdown(self.body)
+        self.body_html_hash = current
+        self.excerpt_html = make_excerpt(self.body_html)
+        self.body_text = plain_text(self.body_html)
+        self.word_count = count_words(self.body_html)
+        self.reading_time = reading_time(self.word_count)
+        return True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Never write back (possibly stale) DB-managed columns.
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DB_MANAGED_FIELDS
+            ]
+        if self.refresh_body_html():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | set(
+                    self.RENDERED_FIELDS
+                )
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def adjust_comment_count(cls, post_id, delta):
+        """Atomically add ``delta`` to a post's comment_count."""
+        if delta:
+            cls.objects.filter(pk=post_id).update(
+                comment_count=models.F("comment_count") + delta
+            )
+
+    @classmethod
+    def recount_comments(cls, queryset=None):
+        """Recompute comment_count from the comments table in one UPDATE."""
+        active = (
+            Comment.objects.filter(post=models.OuterRef("pk"), active=True)
+            .order_by()
+            .values("post")
+            .annotate(total=models.Count("pk"))
+            .values("total")
+        )
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            comment_count=Coalesce(models.Subquery(active), 0)
+        )
+
     @property
     def author_display(self) -> str:
         """
@@ -151,12 +262,15 @@ class Post(models.Model):
 
     def get_absolute_url(self):
         """Return canonical URL for a post."""
+        # post_detail matches published__year/month/day in the current time
+        # zone, so the date in the URL must be the local one too.
+        published = timezone.localtime(self.published)
         return reverse(
             "blog:post_detail",
             kwargs={
-                "year": self.published.year,
-                "month": self.published.month,
-                "day": self.published.day,
+                "year": published.year,
+                "month": published.month,
+                "day": published.day,
                 "post": self.slug,
             },
         )
@@ -188,3 +302,93 @@ class Comment(models.Model):
 
     def __str__(self):
         return f"Comment by {self.name} on {self.post}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what's stored so signals can adjust Post.comment_count
+        # by the right delta when the comment is saved or deleted.
+        instance._loaded_state = (
+            instance.__dict__.get("post_id"),
+            instance.__dict__.get("active"),
+        )
+        return instance
+
+
+# ---------------------------------------------------------------------
+# Similar posts (precomputed, see blog/similar.py)
+# ---------------------------------------------------------------------
+class SimilarPost(models.Model):
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="similar_posts",
+    )
+    similar = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+    )
+    score = models.PositiveIntegerField()  # number of shared tags
+    rank = models.PositiveSmallIntegerField()  # 1 = most similar
+
+    class Meta:
+        ordering = ["post", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "rank"], name="blog_similarpost_post_rank"
+            ),
+        ]
+        verbose_name = "Similar post"
+        verbose_name_plural = "Similar posts"
+
+    def __str__(self):
+        return f"{self.similar} (similar to {self.post}, #{self.rank})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Durable outbox row for mail sent on a visitor's behalf (post_share).
+    The request only inserts a row; ``python manage.py send_outbox`` delivers
+    queued rows over one reused SMTP connection, retrying with backoff.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="outbound_emails",
+    )
+    subject = models.CharField(max_length=300)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Earliest time a worker may (re)try the row; also the lease while sending.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"],
+                name="blog_outbox_due_idx",
+            ),
+        ]
+        verbose_name = "Outbound email"
+        verbose_name_plural = "Outbound emails"
+
+    def __str__(self):
+        return f"{self.subject} → {self.to} ({self.status})"
@@ -0,0 +1,186 @@
+"""
+Durable email outbox.
+
+``post_share`` used to call ``send_mail`` inline, holding a web worker for
+a fresh TLS handshake with the relay on every submission. Now the view
+inserts an :class:`~blog.models.OutboundEmail` row and returns; the
+``send_outbox`` worker delivers due rows in batches over one SMTP
+connection that stays open between batches, retries failures with
+exponential backoff and paces itself to ``BLOG_OUTBOX_RATE`` messages per
+second.
+
+Rows are claimed with a lease (``next_attempt_at`` pushed into the future
+under ``SELECT ... FOR UPDATE SKIP LOCKED``) long enough to send the batch
+at the configured rate, so several workers can run side by side and a
+worker that dies mid-batch only delays its rows. A worker that outlives
+its lease anyway (a slow relay) stops before sending rows another worker
+may have reclaimed, and hands back the attempt it counted for them at
+claim time. Delivery is at-least-once.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Slack on top of the time a batch needs at the configured rate before
+# its rows become visible to other workers again.
+LEASE_MARGIN = timedelta(minutes=5)
+
+
+def enqueue(subject, body, to, from_email=None, post=None):
+    """Queue one message; it's sent once the surrounding transaction commits."""
+    email = OutboundEmail.objects.create(
+        subject=subject[:300],
+        body=body,
+        to=to,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        post=post,
+    )
+    transaction.on_commit(lambda: metrics.EMAILS.inc("queued"))
+    return email
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2×base, 4×base, … capped at one hour."""
+    base = settings.BLOG_OUTBOX_RETRY_BASE
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 3600))
+
+
+def lease_for(batch_size, rate):
+    """How long to lease a batch: its send time at ``rate``/s plus a margin."""
+    seconds = batch_size / rate if rate > 0 else 0
+    return timedelta(seconds=seconds) + LEASE_MARGIN
+
+
+def claim_batch(batch_size, lease=None):
+    """Lease up to ``batch_size`` due rows to this worker and return them."""
+    if lease is None:
+        lease = LEASE_MARGIN
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboundEmail.objects.filter(
+            status=OutboundEmail.Status.QUEUED, next_attempt_at__lte=now
+        ).order_by("next_attempt_at")
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return []
+        OutboundEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + lease, attempts=F("attempts") + 1
+        )
+    return list(OutboundEmail.objects.filter(id__in=ids).order_by("id"))
+
+
+class OutboxSender:
+    """
+    Sends outbox rows over a single mail connection, opened lazily and
+    reopened only after a failure, and limited to ``rate`` messages/second
+    (0 = unlimited).
+    """
+
+    def __init__(self, rate=None, max_attempts=None):
+        self.rate = settings.BLOG_OUTBOX_RATE if rate is None else rate
+        self.max_attempts = max_attempts or settings.BLOG_OUTBOX_MAX_ATTEMPTS
+        self.connection = None
+        self._last_send = 0.0
+
+    def _connection(self):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+            self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _throttle(self):
+        if self.rate > 0:
+            wait = self._last_send + 1.0 / self.rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self._last_send = time.monotonic()
+
+    def send(self, email):
+        """Deliver one claimed row and record the outcome. Returns True if sent."""
+        self._throttle()
+        try:
+            EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=[email.to],
+                connection=self._connection(),
+            ).send()
+        except Exception as exc:
+            # The session may be half-dead; start a fresh one next time.
+            self.close()
+            self._record_failure(email, exc)
+            return False
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=OutboundEmail.Status.SENT, sent_at=timezone.now(), last_error=""
+        )
+        metrics.EMAILS.inc("sent")
+        return True
+
+    def _record_failure(self, email, exc):
+        error = f"{type(exc).__name__}: {exc}"
+        if email.attempts >= self.max_attempts:
+            logger.error("Giving up on outbound email %s: %s", email.pk, error)
+            metrics.EMAILS.inc("failed")
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                status=OutboundEmail.Status.FAILED, last_error=error
+            )
+        else:
+            logger.warning("Outbound email %s failed, will retry: %s", email.pk, error)
+            metrics.EMAILS.inc("retry")
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                next_attempt_at=timezone.now() + retry_delay(email.attempts),
+                last_error=error,
+            )
+
+    def send_batch(self, batch_size=None):
+        """Claim and send one batch. Returns ``(sent, failed)``."""
+        batch_size = batch_size or settings.BLOG_OUTBOX_BATCH_SIZE
+        batch = claim_batch(batch_size, lease_for(batch_size, self.rate))
+        sent = failed = 0
+        for email in batch:
+            # ``next_attempt_at`` holds the end of our lease on the row.
+            if timezone.now() >= email.next_attempt_at:
+                untried = [e.pk for e in batch[sent + failed :]]
+                logger.warning(
+                    "Outbox lease expired with %s email(s) unsent; leaving them "
+                    "to the next claim",
+                    len(untried),
+                )
+                # They were never tried: refund the attempt claim_batch
+                # counted, unless another worker has reclaimed them since
+                # (which moved ``next_attempt_at`` off our lease).
+                OutboundEmail.objects.filter(
+                    pk__in=untried,
+                    status=OutboundEmail.Status.QUEUED,
+                    next_attempt_at=email.next_attempt_at,
+                    attempts__gt=0,
+                ).update(attempts=F("attempts") - 1)
+                break
+            if self.send(email):
+                sent += 1
+            else:
+                failed += 1
+        return sent, failed
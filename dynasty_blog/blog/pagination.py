@@ -0,0 +1,136 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import metrics
+from .routers import pin_primary
+
+CURSOR_SALT = "blog.pagination.cursor"
+
+
+def pagination_mode() -> str:
+    """Either "page" (numbered, COUNT + OFFSET) or "cursor" (keyset)."""
+    return getattr(settings, "BLOG_PAGINATION_MODE", "page")
+
+
+def cached_count(queryset, key, timeout=None):
+    """
+    COUNT(*) for ``queryset`` served from the cache for a while, so cursor
+    pages don't pay for a full count on every request.
+    """
+    if timeout is None:
+        timeout = getattr(settings, "BLOG_PAGINATION_COUNT_TIMEOUT", 300)
+    cache_key = f"blog:count:{key}"
+    total = cache.get(cache_key)
+    metrics.cache_lookup("count", total is not None)
+    if total is None:
+        with pin_primary():
+            total = queryset.count()
+        cache.set(cache_key, total, timeout)
+    return total
+
+
+def encode_cursor(post, direction):
+    """Opaque, signed token pointing just past ``post`` in ``direction``."""
+    return signing.dumps(
+        [post.published.isoformat(), post.pk, direction], salt=CURSOR_SALT
+    )
+
+
+def decode_cursor(token):
+    """Return ``(published, pk, direction)``, or None for a missing/bad token."""
+    if not token:
+        return None
+    try:
+        published, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+        return datetime.fromisoformat(published), int(pk), direction
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+
+class CursorPage:
+    """
+    One page of a keyset-paginated queryset. Quacks enough like
+    ``django.core.paginator.Page`` for list.html and pagination.html.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous, count=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], "next")
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], "prev")
+        return None
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over ``(published, id)``, newest first.
+
+    Each page is a single indexed range scan with LIMIT, so page 500 costs
+    the same as page 1; there is no COUNT and no OFFSET. The total is
+    optional and, when requested, comes from ``cached_count``.
+    """
+
+    def __init__(self, queryset, per_page, count_key=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_key = count_key
+
+    def get_page(self, token):
+        cursor = decode_cursor(token)
+        queryset = self.queryset
+        if cursor is None:
+            rows = list(queryset.order_by("-published", "-id")[: self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+        else:
+            published, pk, direction = cursor
+            if direction == "prev":
+                rows = list(
+                    queryset.filter(
+                        Q(published__gt=published) | Q(published=published, id__gt=pk)
+                    ).order_by("published", "id")[: self.per_page + 1]
+                )
+                has_previous, has_next = len(rows) > self.per_page, True
+                rows = rows[: self.per_page][::-1]
+            else:
+                rows = list(
+                    queryset.filter(
+                        Q(published__lt=published) | Q(published=published, id__lt=pk)
+                    ).order_by("-published", "-id")[: self.per_page + 1]
+                )
+                has_next, has_previous = len(rows) > self.per_page, True
+        count = None
+        if self.count_key is not None:
+            count = cached_count(self.queryset, self.count_key)
+        return CursorPage(rows[: self.per_page], has_next, has_previous, count)
@@ -0,0 +1,166 @@
+"""
+Throttling for the write endpoints (``post_comment``, ``post_share``).
+
+Limits live in the Django cache so every worker shares them. Each scope has
+rates per client IP, per submitted email address and per post
+(``BLOG_RATE_LIMITS``); the :func:`ratelimit` decorator checks them before
+the view runs, so a throttled request is answered with a bare 429 and
+never touches the ORM or a template. The counting strategy is pluggable
+through ``BLOG_RATE_LIMITER`` (a dotted path to a class with the same
+``hit()`` signature as :class:`SlidingWindowLimiter`).
+
+Comments whose normalised body was already posted on the same post within
+``BLOG_COMMENT_DUPLICATE_WINDOW`` seconds are rejected the same way.
+"""
+
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+RATE_RE = re.compile(r"^(\d+)/(\d*)([smhd])$")
+
+
+def parse_rate(rate):
+    """``"5/10m"`` -> ``(5, 600)``: at most 5 hits per 10 minutes."""
+    match = RATE_RE.match(rate.strip())
+    if not match:
+        raise ValueError(f"Invalid rate {rate!r}; expected e.g. '5/m' or '20/10m'.")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+def _digest(value):
+    # Keys can carry email addresses: hash them (and keep memcached happy).
+    return hashlib.sha1(value.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: the previous fixed window's count is weighted
+    by how much of it still overlaps the last ``period`` seconds. Two cache
+    keys per limit and an atomic ``incr``, so it's exact enough across
+    workers without locks.
+    """
+
+    def hit(self, key, limit, period):
+        """Record a hit; returns ``(allowed, retry_after_seconds)``."""
+        now = time.time()
+        window = int(now // period)
+        current = f"blog:rl:{key}:{period}:{window}"
+        cache.add(current, 0, period * 2)
+        try:
+            count = cache.incr(current)
+        except ValueError:  # evicted between add() and incr()
+            cache.set(current, 1, period * 2)
+            count = 1
+        previous = cache.get(f"blog:rl:{key}:{period}:{window - 1}", 0)
+        elapsed = now - window * period
+        estimate = previous * (1 - elapsed / period) + count
+        if estimate <= limit:
+            return True, 0
+        return False, max(1, int(period - elapsed))
+
+
+_limiter = None
+
+
+def get_limiter():
+    global _limiter
+    path = getattr(settings, "BLOG_RATE_LIMITER", "blog.ratelimit.SlidingWindowLimiter")
+    if _limiter is None or _limiter[0] != path:
+        _limiter = (path, import_string(path)())
+    return _limiter[1]
+
+
+def client_ip(request):
+    """
+    The address the nearest trusted proxy saw. Each proxy appends the peer
+    it received the request from, so X-Forwarded-For is read from the right:
+    with ``BLOG_TRUSTED_PROXY_COUNT`` proxies in front of the app, the
+    client is that many entries from the end. Anything further left came
+    from the client and can be forged.
+    """
+    header = getattr(settings, "BLOG_CLIENT_IP_HEADER", "")
+    if header and request.META.get(header):
+        # e.g. X-Forwarded-For: "spoofed, client, proxy1" with 2 proxies
+        entries = [e.strip() for e in request.META[header].split(",")]
+        trusted = max(int(getattr(settings, "BLOG_TRUSTED_PROXY_COUNT", 1)), 1)
+        return entries[max(len(entries) - trusted, 0)]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _identities(request, kwargs):
+    yield "ip", client_ip(request)
+    email = request.POST.get("email", "").strip().lower()
+    if email:
+        yield "email", email
+    if "post_id" in kwargs:
+        yield "post", str(kwargs["post_id"])
+
+
+def too_many_requests(retry_after, reason="Too many requests."):
+    response = HttpResponse(reason, status=429, content_type="text/plain")
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def ratelimit(scope):
+    """
+    Throttle POSTs to the decorated view using ``BLOG_RATE_LIMITS[scope]``,
+    a mapping of ``"ip"`` / ``"email"`` / ``"post"`` to rates like ``"5/10m"``.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rates = getattr(settings, "BLOG_RATE_LIMITS", {}).get(scope)
+            if request.method == "POST" and rates:
+                limiter = get_limiter()
+                for kind, value in _identities(request, kwargs):
+                    if kind not in rates:
+                        continue
+                    limit, period = parse_rate(rates[kind])
+                    allowed, retry_after = limiter.hit(
+                        f"{scope}:{kind}:{_digest(value)}", limit, period
+                    )
+                    if not allowed:
+                        metrics.RATE_LIMITED.inc(scope)
+                        return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def normalize_body(body):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[\W_]+", " ", body.lower()).split())
+
+
+def _body_key(post_id, body):
+    return f"blog:comment-body:{post_id}:{_digest(normalize_body(body))}"
+
+
+def claim_comment_body(post_id, body):
+    """
+    Reserve ``body`` for ``post_id``; False if a near-identical comment was
+    already posted there recently. Atomic across workers (``cache.add``).
+    """
+    return cache.add(
+        _body_key(post_id, body), 1, settings.BLOG_COMMENT_DUPLICATE_WINDOW
+    )
+
+
+def release_comment_body(post_id, body):
+    """Undo :func:`claim_comment_body` when the comment wasn't saved."""
+    cache.delete(_body_key(post_id, body))
@@ -0,0 +1,73 @@
+import hashlib
+import math
+from html import unescape
+
+import markdown
+from django.conf import settings
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+from .timing import timed
+
+# Bump this whenever the way we turn Markdown into HTML changes in a way
+# that isn't captured by the Markdown version or the extension list.
+RENDERER_REVISION = 1
+
+
+def markdown_extensions():
+    """Extensions passed to python-markdown (configurable in settings)."""
+    return list(getattr(settings, "BLOG_MARKDOWN_EXTENSIONS", []))
+
+
+def excerpt_words() -> int:
+    """Number of words kept in the stored excerpt (configurable in settings)."""
+    return int(getattr(settings, "BLOG_EXCERPT_WORDS", 30))
+
+
+def words_per_minute() -> int:
+    """Reading speed used for the stored reading time."""
+    return max(1, int(getattr(settings, "BLOG_WORDS_PER_MINUTE", 200)))
+
+
+def renderer_version() -> str:
+    """Identify the renderer so stored HTML can be invalidated when it changes."""
+    extensions = ",".join(sorted(str(ext) for ext in markdown_extensions()))
+    return (
+        f"{RENDERER_REVISION}:{markdown.__version__}:{extensions}"
+        f":{excerpt_words()}:{words_per_minute()}"
+    )
+
+
+@timed("markdown")
+def render_markdown(text: str) -> str:
+    """Convert Markdown source to HTML using the configured extensions."""
+    return markdown.markdown(text or "", extensions=markdown_extensions())
+
+
+def source_hash(text: str) -> str:
+    """Hash of the Markdown source plus the renderer version."""
+    digest = hashlib.sha256()
+    digest.update(renderer_version().encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((text or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def make_excerpt(html: str) -> str:
+    """Truncate rendered HTML to the configured number of words."""
+    return Truncator(html or "").words(excerpt_words(), html=True, truncate=" …")
+
+
+def plain_text(html: str) -> str:
+    """Rendered HTML as unescaped plain text (for search snippets)."""
+    return unescape(strip_tags(html or ""))
+
+
+def count_words(html: str) -> int:
+    """Count words in rendered HTML, ignoring markup."""
+    return len(strip_tags(html or "").split())
+
+
+def reading_time(word_count: int) -> int:
+    """Estimated reading time in whole minutes (at least one)."""
+    return max(1, math.ceil(word_count / words_per_minute()))
@@ -0,0 +1,138 @@
+"""
+Read-replica routing (``REPLICA_DATABASE_URLS``).
+
+Reads of the public content models (posts, comments, tags and the tables
+joined with them) go to the replicas, round-robin. Everything else, every
+write, and every read made while the request is *pinned* goes to
+``default``. :class:`PrimaryPinMiddleware` pins:
+
+* requests that change something (POST etc.), so ``post_comment`` renders
+  from the primary that just stored the comment;
+* admin requests;
+* a client's requests for ``BLOG_REPLICA_PIN_SECONDS`` after it wrote
+  something (a short-lived cookie), so the page it is redirected to shows
+  its own comment despite replication lag.
+
+Reads inside a transaction on the primary, and related lookups on objects
+that came from it (``post.tags`` in a signal handler), stay there as well.
+
+Code that fills a cache keyed by one of the version counters in
+``blog/cache.py`` (the sidebar fragment, feed XML, search results, the
+sitemap index, the autocomplete index) wraps its reads in
+:func:`pin_primary`: the version is bumped as soon as the primary commits,
+so a lagging replica would otherwise cache stale data under the new
+version until the next bump. Management commands pin themselves too.
+"""
+
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY = "default"
+PIN_COOKIE = "blog_primary"
+
+# (app_label, model_name) of models whose reads may be served by a replica.
+REPLICATED_MODELS = {
+    ("blog", "post"),
+    ("blog", "comment"),
+    ("blog", "similarpost"),
+    ("taggit", "tag"),
+    ("taggit", "taggeditem"),
+}
+
+_pinned = ContextVar("blog_primary_pinned", default=False)
+
+
+@contextmanager
+def pin_primary():
+    """Send every read in this block (and this context) to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = list(getattr(settings, "REPLICA_DATABASES", []))
+        self._cycle = itertools.cycle(self.replicas)
+        self._lock = threading.Lock()
+
+    def _next_replica(self):
+        with self._lock:
+            return next(self._cycle)
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or _pinned.get():
+            return PRIMARY
+        if (model._meta.app_label, model._meta.model_name) not in REPLICATED_MODELS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        # Related lookups on an object that came from (or was just saved
+        # to) the primary, e.g. post.tags in a post_save handler.
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db == PRIMARY:
+            return PRIMARY
+        return self._next_replica()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any of them relate.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def _should_pin(request):
+    return (
+        request.method not in ("GET", "HEAD", "OPTIONS")
+        or request.path.startswith(reverse("admin:index"))
+        or PIN_COOKIE in request.COOKIES
+    )
+
+
+def _after_write(request, response):
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        response.set_cookie(
+            PIN_COOKIE,
+            "1",
+            max_age=settings.BLOG_REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@sync_and_async_middleware
+def PrimaryPinMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            if not _should_pin(request):
+                return await get_response(request)
+            with pin_primary():
+                response = await get_response(request)
+            return _after_write(request, response)
+
+    else:
+
+        def middleware(request):
+            if not _should_pin(request):
+                return get_response(request)
+            with pin_primary():
+                response = get_response(request)
+            return _after_write(request, response)
+
+    return middleware
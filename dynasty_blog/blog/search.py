@@ -0,0 +1,350 @@
+"""
+Pluggable post search backends.
+
+Every backend returns one page of results in the same shape (see
+``SearchBackend.search``), so views and templates don't care which
+database is underneath:
+
+* ``PostgresSearchBackend`` - stored, GIN-indexed tsvector with a pg_trgm
+  fallback for misspellings.
+* ``SQLiteFTSSearchBackend`` - an FTS5 external-content table kept in sync
+  by triggers, ranked with bm25.
+* ``ORMSearchBackend`` - plain ``icontains``; last resort for anything else.
+
+Set ``BLOG_SEARCH_BACKEND`` to a dotted path to force a backend; by default
+one is picked from the database vendor.
+"""
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    TrigramWordSimilarity,
+)
+from django.core.paginator import Paginator
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .timing import timed
+
+
+# Highlight markers passed to ts_headline/snippet(). Control characters
+# can't appear in the escaped text, so they are swapped for <mark> tags
+# only after everything else has been escaped.
+MARK_START = "\x02"
+MARK_STOP = "\x03"
+
+
+def highlight(snippet):
+    """Escape a sentinel-marked snippet and turn the markers into <mark>."""
+    return mark_safe(
+        escape(snippet or "")
+        .replace(MARK_START, "<mark>")
+        .replace(MARK_STOP, "</mark>")
+    )
+
+
+class SearchBackend:
+    """Base class: subclasses implement ``paginator(query)``."""
+
+    name = "base"
+
+    def paginator(self, query):
+        """Return ``(paginator, extra)`` for ``query``."""
+        raise NotImplementedError
+
+    def annotate_page(self, query, results, extra):
+        """Hook to add ``headline`` etc. to the posts on the shown page."""
+
+    @timed("search")
+    def search(self, query, page_number):
+        """
+        One page of results as a picklable dict (so it can be cached):
+        ``results`` (posts, optionally with ``headline``), ``count``,
+        ``number``, ``num_pages`` and ``fuzzy``.
+        """
+        paginator, extra = self.paginator(query)
+        page = paginator.get_page(page_number)
+        results = list(page.object_list)
+        if results:
+            self.annotate_page(query, results, extra)
+        return {
+            "results": results,
+            "count": paginator.count,
+            "number": page.number,
+            "num_pages": paginator.num_pages,
+            "fuzzy": bool(extra.get("fuzzy")),
+        }
+
+    @staticmethod
+    def per_page():
+        return settings.BLOG_SEARCH_RESULTS_PER_PAGE
+
+
+class ORMSearchBackend(SearchBackend):
+    """Case-insensitive substring search; works anywhere, indexes nothing."""
+
+    name = "orm"
+
+    def paginator(self, query):
+        queryset = (
+            (
+                Post.published_posts.filter(title__icontains=query)
+                | Post.published_posts.filter(body__icontains=query)
+            )
+            .defer(*Post.LIST_DEFERRED_FIELDS)
+            .distinct()
+            .order_by("-published")
+        )
+        return Paginator(queryset, self.per_page()), {}
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Full-text search over the trigger-maintained ``Post.search_vector``."""
+
+    name = "postgresql"
+
+    def paginator(self, query):
+        search_query = SearchQuery(query)
+        # The GIN-indexed search_vector column is kept current by a trigger,
+        # so rank is only computed for rows that actually match.
+        queryset = (
+            Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS)
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .filter(rank__gte=0.3)
+            .order_by("-rank", "-published")
+        )
+        paginator = Paginator(queryset, self.per_page())
+        if paginator.count:
+            return paginator, {"search_query": search_query}
+
+        # Nothing matched exactly (often a misspelling): try trigram word
+        # similarity on titles. The ``trigram_word_similar`` lookup (<%) can
+        # use the GIN trigram index created in migration 0013.
+        fuzzy = (
+            Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS)
+            .filter(title__trigram_word_similar=query)
+            .annotate(similarity=TrigramWordSimilarity(query, "title"))
+            .order_by("-similarity", "-published")
+        )
+        return Paginator(fuzzy, self.per_page()), {"fuzzy": True}
+
+    def annotate_page(self, query, results, extra):
+        search_query = extra.get("search_query")
+        if search_query is None:
+            return
+        # ts_headline is expensive: only run it for the posts on this page.
+        # It runs over the tag-free body_text and is escaped by highlight().
+        headlines = dict(
+            Post.objects.filter(pk__in=[p.pk for p in results])
+            .annotate(
+                headline=SearchHeadline(
+                    "body_text",
+                    search_query,
+                    start_sel=MARK_START,
+                    stop_sel=MARK_STOP,
+                    max_words=30,
+                    min_words=12,
+                )
+            )
+            .values_list("pk", "headline")
+        )
+        for post in results:
+            post.headline = highlight(headlines.get(post.pk, ""))
+
+
+# ---------------------------------------------------------------------
+# SQLite FTS5
+# ---------------------------------------------------------------------
+FTS_TABLE = "blog_post_fts"
+
+SQLITE_FTS_STATEMENTS = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, body_text, content='blog_post', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body_text)
+        VALUES (new.id, new.title, new.body_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body_text)
+        VALUES ('delete', old.id, old.title, old.body_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF title, body_text ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body_text)
+        VALUES ('delete', old.id, old.title, old.body_text);
+        INSERT INTO {FTS_TABLE}(rowid, title, body_text)
+        VALUES (new.id, new.title, new.body_text);
+    END
+    """,
+]
+
+FTS_TRIGGERS = {f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"}
+
+
+def sqlite_fts_installed(conn):
+    """True when the FTS table and all three sync triggers exist."""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = %s OR name IN (%s, %s, %s)",
+            [FTS_TABLE, *sorted(FTS_TRIGGERS)],
+        )
+        names = {row[0] for row in cursor.fetchall()}
+    return names == FTS_TRIGGERS | {FTS_TABLE}
+
+
+def install_sqlite_fts(conn, rebuild=False):
+    """
+    Create the FTS5 table and triggers if they're missing and (re)fill the
+    index. Idempotent. SQLite table rebuilds during migrations drop triggers,
+    so this also runs after every migrate (see signals.py). Returns False
+    when this SQLite build has no FTS5, or ``blog_post`` has no
+    ``body_text`` column yet (before migration 0018).
+    """
+    if conn.vendor != "sqlite" or "blog_post" not in conn.introspection.table_names():
+        return False
+    with conn.cursor() as cursor:
+        columns = {
+            column.name
+            for column in conn.introspection.get_table_description(cursor, "blog_post")
+        }
+    if "body_text" not in columns:
+        return False
+    if not rebuild and sqlite_fts_installed(conn):
+        return True
+    try:
+        with conn.cursor() as cursor:
+            for statement in SQLITE_FTS_STATEMENTS:
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError:
+        return False
+    return True
+
+
+def drop_sqlite_fts(conn):
+    """Remove the FTS5 table and its triggers."""
+    _auto_backend.pop(conn.vendor, None)  # stop routing searches to it
+    with conn.cursor() as cursor:
+        for trigger in sorted(FTS_TRIGGERS):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def fts_match_expression(query):
+    """Quote each word so user input can't inject FTS5 query syntax."""
+    words = query.split()
+    return " ".join('"{}"'.format(w.replace('"', '""')) for w in words)
+
+
+class _FTSMatches:
+    """
+    Lazy, sliceable list of FTS matches for ``Paginator``: ``count()`` and
+    one page are each a single indexed query against the FTS table.
+    """
+
+    # bm25 column weights, mirroring the Postgres A (title) / B (body) split.
+    RANK = f"bm25({FTS_TABLE}, 10.0, 4.0)"
+
+    def __init__(self, match):
+        self.match = match
+
+    def _fetch(self, sql, params):
+        if not self.match:
+            return []
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        except OperationalError:
+            # e.g. a query made only of characters the tokenizer drops
+            return []
+
+    def count(self):
+        rows = self._fetch(
+            f"SELECT COUNT(*) FROM {FTS_TABLE} f JOIN blog_post p ON p.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND p.status = %s",
+            [self.match, Post.Status.PUBLISHED],
+        )
+        return rows[0][0] if rows else 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index : index + 1][0]
+        start = index.start or 0
+        rows = self._fetch(
+            f"SELECT p.id, snippet({FTS_TABLE}, 1, %s, %s, '…', 24) "
+            f"FROM {FTS_TABLE} f JOIN blog_post p ON p.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND p.status = %s "
+            f"ORDER BY {self.RANK}, p.published DESC LIMIT %s OFFSET %s",
+            [
+                MARK_START,
+                MARK_STOP,
+                self.match,
+                Post.Status.PUBLISHED,
+                index.stop - start,
+                start,
+            ],
+        )
+        if not rows:
+            return []
+        posts = Post.objects.defer(*Post.LIST_DEFERRED_FIELDS).in_bulk(
+            [pk for pk, _ in rows]
+        )
+        results = []
+        for pk, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.headline = highlight(snippet)
+                results.append(post)
+        return results
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """SQLite FTS5 search with bm25 ranking and highlighted snippets."""
+
+    name = "sqlite-fts5"
+
+    def paginator(self, query):
+        return Paginator(_FTSMatches(fts_match_expression(query)), self.per_page()), {}
+
+
+_auto_backend = {}
+
+
+def get_search_backend():
+    """The configured backend, or one picked from the database vendor."""
+    path = getattr(settings, "BLOG_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    vendor = connection.vendor
+    if vendor not in _auto_backend:
+        if vendor == "postgresql":
+            backend = PostgresSearchBackend()
+        elif vendor == "sqlite" and sqlite_fts_installed(connection):
+            backend = SQLiteFTSSearchBackend()
+        else:
+            # Not remembered: FTS5 may be installed later (the next migrate,
+            # or a repaired trigger), and should be picked up without a
+            # restart. Costs one sqlite_master lookup per search until then.
+            return ORMSearchBackend()
+        _auto_backend[vendor] = backend
+    return _auto_backend[vendor]
@@ -0,0 +1,138 @@
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import bump_feed_version, bump_posts_version, bump_sidebar_version
+from .images import needs_derivatives, schedule_derivatives
+from .models import Comment, Post, SimilarPost
+from .search import install_sqlite_fts
+from .similar import rebuild_similar_posts, schedule_refresh
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def _invalidate_post_caches(sender, **kwargs):
+    bump_posts_version()
+
+
+@receiver(pre_save, sender=Post)
+def _remember_previous_status(sender, instance, **kwargs):
+    instance._previous_status = getattr(instance, "_loaded_status", None)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def _invalidate_feeds(sender, instance, **kwargs):
+    # Only published posts appear in feeds: rebuild when one is created,
+    # edited, unpublished or deleted; draft edits leave the feeds cached.
+    published = Post.Status.PUBLISHED
+    if published in (instance.status, getattr(instance, "_previous_status", None)):
+        bump_feed_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def _invalidate_sidebar(sender, **kwargs):
+    bump_sidebar_version()
+
+
+@receiver(post_save, sender=Comment)
+def _update_comment_count_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        Post.adjust_comment_count(instance.post_id, int(instance.active))
+    else:
+        old_post_id, old_active = getattr(instance, "_loaded_state", (None, None))
+        if old_post_id is None or old_active is None:
+            # Unknown previous state: recount just the affected post.
+            Post.recount_comments(Post.objects.filter(pk=instance.post_id))
+        elif old_post_id != instance.post_id:
+            Post.adjust_comment_count(old_post_id, -int(old_active))
+            Post.adjust_comment_count(instance.post_id, int(instance.active))
+        else:
+            Post.adjust_comment_count(
+                instance.post_id, int(instance.active) - int(old_active)
+            )
+    instance._loaded_state = (instance.post_id, instance.active)
+
+
+@receiver(post_delete, sender=Comment)
+def _update_comment_count_on_delete(sender, instance, **kwargs):
+    post_id, active = getattr(
+        instance, "_loaded_state", (instance.post_id, instance.active)
+    )
+    if active:
+        Post.adjust_comment_count(post_id, -1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def _invalidate_sidebar_on_tags(sender, instance, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_sidebar_version()
+        # Tag feeds list published posts by tag.
+        if getattr(instance, "status", None) == Post.Status.PUBLISHED:
+            bump_feed_version()
+
+
+@receiver(post_migrate)
+def _repair_sqlite_fts(sender, using="default", **kwargs):
+    # SQLite rebuilds tables for many schema changes, silently dropping the
+    # FTS sync triggers; put them back (and refill the index) if needed.
+    if sender.name == "blog":
+        install_sqlite_fts(connections[using])
+
+
+# --- Precomputed similar posts ---------------------------------------
+@receiver(m2m_changed, sender=Post.tags.through)
+def _refresh_similar_on_tags(sender, instance, action, reverse, **kwargs):
+    if reverse or not isinstance(instance, Post):
+        return
+    if action in ("post_add", "post_remove", "post_clear"):
+        schedule_refresh(instance)
+
+
+@receiver(post_save, sender=Post)
+def _refresh_similar_on_publish(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # New posts have no tags yet; m2m_changed handles them.
+    old_status = getattr(instance, "_loaded_status", instance.status)
+    if not created and old_status != instance.status:
+        schedule_refresh(instance)
+    instance._loaded_status = instance.status
+
+
+@receiver(pre_delete, sender=Post)
+def _remember_similar_referrers(sender, instance, **kwargs):
+    instance._similar_referrers = set(
+        SimilarPost.objects.filter(similar=instance).values_list("post_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def _refresh_similar_on_delete(sender, instance, **kwargs):
+    referrers = getattr(instance, "_similar_referrers", set())
+    if referrers:
+        transaction.on_commit(lambda: rebuild_similar_posts(referrers))
+
+
+# --- Responsive image derivatives ------------------------------------
+@receiver(post_save, sender=Post)
+def _generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if needs_derivatives(instance):
+        schedule_derivatives(instance)
+    elif not instance.image and instance.image_derivatives:
+        Post.objects.filter(pk=instance.pk).update(image_derivatives={})
+        instance.image_derivatives = {}
@@ -0,0 +1,234 @@
+"""
+Precomputed "similar posts" (by number of shared tags).
+
+``post_detail`` used to run a tag join + COUNT + DISTINCT over all published
+posts on every view. Instead the top ``BLOG_SIMILAR_POSTS`` matches for each
+post live in ``SimilarPost`` and are refreshed only for the lists a change
+can affect: the post's own, the lists it already appears in (recomputed),
+and the lists it now outranks an entry of (it's merged in, no tag join).
+Every rewrite of a post's rows holds that post's row lock.
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connection, transaction
+from taggit.models import TaggedItem
+
+from .models import Post, SimilarPost
+from .routers import pin_primary
+from .timing import timed
+
+logger = logging.getLogger(__name__)
+
+
+def similar_posts_limit() -> int:
+    return int(getattr(settings, "BLOG_SIMILAR_POSTS", 4))
+
+
+def _ranked_pairs(post_ids, limit):
+    """
+    ``(post_id, similar_id, score, rank)`` rows for the published posts in
+    ``post_ids``, computed in one statement with a window function
+    (PostgreSQL and SQLite >= 3.25). Drafts get no rows, so rebuilding a
+    draft clears its list, as ``rebuild_similar_posts`` does for all posts.
+    """
+    tagged = TaggedItem._meta.db_table
+    posts = Post._meta.db_table
+    placeholders = ", ".join(["%s"] * len(post_ids))
+    sql = f"""
+        WITH pairs AS (
+            SELECT a.object_id AS post_id, b.object_id AS similar_id,
+                   COUNT(*) AS score
+            FROM {tagged} a
+            JOIN {posts} ap ON ap.id = a.object_id AND ap.status = %s
+            JOIN {tagged} b
+              ON b.tag_id = a.tag_id
+             AND b.content_type_id = a.content_type_id
+             AND b.object_id <> a.object_id
+            WHERE a.content_type_id = %s AND a.object_id IN ({placeholders})
+            GROUP BY a.object_id, b.object_id
+        ),
+        ranked AS (
+            SELECT pairs.post_id, pairs.similar_id, pairs.score,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY pairs.post_id
+                       ORDER BY pairs.score DESC, p.published DESC, p.id DESC
+                   ) AS rn
+            FROM pairs
+            JOIN {posts} p ON p.id = pairs.similar_id AND p.status = %s
+        )
+        SELECT post_id, similar_id, score, rn FROM ranked WHERE rn <= %s
+    """
+    content_type = ContentType.objects.get_for_model(Post)
+    published = Post.Status.PUBLISHED
+    params = [published, content_type.pk, *post_ids, published, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _replace_rows(post_ids, compute_rows):
+    """
+    Swap the similar-post rows of ``post_ids`` for ``compute_rows()``, with
+    the posts' rows locked so overlapping rebuilds of the same post run one
+    after the other (SQLite serialises writers anyway). A clash that still
+    gets through, e.g. with a post deleted meanwhile, is logged rather than
+    raised: this runs after commit, where it would turn a save into a 500.
+    """
+    try:
+        with transaction.atomic():
+            list(
+                Post.objects.select_for_update()
+                .filter(pk__in=post_ids)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            rows = compute_rows()
+            SimilarPost.objects.filter(post_id__in=post_ids).delete()
+            SimilarPost.objects.bulk_create(
+                SimilarPost(post_id=p, similar_id=s, score=score, rank=rank)
+                for p, s, score, rank in rows
+            )
+    except IntegrityError:
+        logger.warning(
+            "Could not refresh similar posts for %s posts; "
+            "run `manage.py rebuild_similar_posts`",
+            len(post_ids),
+            exc_info=True,
+        )
+
+
+@timed("similar")
+@pin_primary()
+def rebuild_similar_posts(post_ids, batch_size=500):
+    """Recompute the similar-post rows for ``post_ids``, in batches."""
+    post_ids = sorted(set(post_ids))
+    limit = similar_posts_limit()
+    for start in range(0, len(post_ids), batch_size):
+        batch = post_ids[start : start + batch_size]
+        _replace_rows(batch, lambda: _ranked_pairs(batch, limit))
+
+
+def _displaced_by(post_id, published, limit):
+    """
+    ``{post_id: score}`` for the published posts whose list ``post_id``
+    (published at ``published``) now belongs in but isn't in yet: the list
+    is short, or its last entry scores lower, or ties and is older.
+    """
+    tagged = TaggedItem._meta.db_table
+    posts = Post._meta.db_table
+    similar = SimilarPost._meta.db_table
+    sql = f"""
+        WITH pairs AS (
+            SELECT b.object_id AS post_id, COUNT(*) AS score
+            FROM {tagged} a
+            JOIN {tagged} b
+              ON b.tag_id = a.tag_id
+             AND b.content_type_id = a.content_type_id
+             AND b.object_id <> a.object_id
+            WHERE a.content_type_id = %s AND a.object_id = %s
+            GROUP BY b.object_id
+        )
+        SELECT pairs.post_id, pairs.score
+        FROM pairs
+        JOIN {posts} p ON p.id = pairs.post_id AND p.status = %s
+        LEFT JOIN {similar} last ON last.post_id = pairs.post_id AND last.rank = %s
+        LEFT JOIN {posts} lp ON lp.id = last.similar_id
+        WHERE NOT EXISTS (
+                SELECT 1 FROM {similar} s
+                WHERE s.post_id = pairs.post_id AND s.similar_id = %s
+              )
+          AND (last.id IS NULL
+               OR pairs.score > last.score
+               OR (pairs.score = last.score
+                   AND (lp.published < %s OR (lp.published = %s AND lp.id < %s))))
+    """
+    content_type = ContentType.objects.get_for_model(Post)
+    params = [
+        content_type.pk,
+        post_id,
+        Post.Status.PUBLISHED,
+        limit,
+        post_id,
+        published,
+        published,
+        post_id,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _merge_into_lists(post_id, published, scores, batch_size=500):
+    """Insert ``post_id`` into the lists of ``scores``' posts, keeping the top N."""
+    limit = similar_posts_limit()
+    ids = sorted(scores)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start : start + batch_size]
+
+        def compute_rows(batch=batch):
+            lists = {pk: [(scores[pk], published, post_id)] for pk in batch}
+            existing = (
+                SimilarPost.objects.filter(post_id__in=batch)
+                .exclude(similar_id=post_id)
+                .values_list("post_id", "score", "similar__published", "similar_id")
+            )
+            for pk, score, similar_published, similar_id in existing:
+                lists[pk].append((score, similar_published, similar_id))
+            rows = []
+            for pk, entries in lists.items():
+                entries.sort(reverse=True)
+                for rank, (score, _, similar_id) in enumerate(entries[:limit], 1):
+                    rows.append((pk, similar_id, score, rank))
+            return rows
+
+        _replace_rows(batch, compute_rows)
+
+
+@timed("similar")
+@pin_primary()
+def refresh_similar_posts(post_id):
+    """
+    Bring every list ``post_id`` affects up to date after its tags or status
+    changed: its own, the ones it's already in, and the ones it now enters.
+    """
+    post = Post.objects.filter(pk=post_id).values("status", "published").first()
+    referrers = set(
+        SimilarPost.objects.filter(similar_id=post_id).values_list("post_id", flat=True)
+    )
+    rebuild_similar_posts(referrers | {post_id})
+    if post is not None and post["status"] == Post.Status.PUBLISHED:
+        displaced = _displaced_by(post_id, post["published"], similar_posts_limit())
+        for pk in referrers | {post_id}:
+            displaced.pop(pk, None)
+        if displaced:
+            _merge_into_lists(post_id, post["published"], displaced)
+
+
+def posts_sharing_tags(tag_ids):
+    """Ids of all posts tagged with any of ``tag_ids``."""
+    if not tag_ids:
+        return set()
+    return set(
+        TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post),
+            tag_id__in=tag_ids,
+        ).values_list("object_id", flat=True)
+    )
+
+
+def schedule_refresh(post):
+    """After the current transaction commits, refresh the lists ``post`` affects."""
+    post_id = post.pk
+    transaction.on_commit(lambda: refresh_similar_posts(post_id))
+
+
+def similar_posts_for(post):
+    """Precomputed similar posts for ``post``: one indexed query."""
+    return (
+        Post.published_posts.filter(similar_to__post=post)
+        .defer(*Post.LIST_DEFERRED_FIELDS)
+        .order_by("similar_to__rank")
+    )
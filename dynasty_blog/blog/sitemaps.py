@@ -1,13 +1,133 @@
-from django.contrib.sitemaps import Sitemap
+"""
+Sharded, streaming sitemap for published posts.
+
+``/sitemap.xml`` is a sitemap index pointing at fixed-size shards
+(``/sitemap-posts-<n>.xml``). Shard ``n`` covers post ids
+``n * size + 1 .. (n + 1) * size``, so a shard is a primary-key range scan
+rather than a COUNT + OFFSET page, and its contents stay put as the archive
+grows. Shards read only ``slug``/``published``/``updated_at`` through
+``.iterator()`` and stream their XML; each one is cached under a key built
+from its newest ``updated_at`` and post count, so unchanged shards are
+served straight from the cache.
+"""
+
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.html import escape
+
+from . import metrics
+from .cache import posts_version
 from .models import Post
+from .routers import pin_primary
+
+CHANGEFREQ = "weekly"
+PRIORITY = "0.9"
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def shard_size() -> int:
+    # The sitemap protocol caps a single file at 50,000 URLs.
+    return min(int(getattr(settings, "BLOG_SITEMAP_SHARD_SIZE", 5000)), 50000)
+
+
+def _base_url(request):
+    return f"{request.scheme}://{get_current_site(request).domain}"
+
+
+def _shard_bounds(shard):
+    size = shard_size()
+    return shard * size, (shard + 1) * size
+
+
+def _shards():
+    """``[(shard, lastmod)]`` for every shard holding a published post."""
+    key = f"blog:sitemap:index:{posts_version()}:{shard_size()}"
+    shards = cache.get(key)
+    metrics.cache_lookup("sitemap", shards is not None)
+    if shards is None:
+        # Keyed by the current posts version: a lagging replica could cache
+        # an index that misses the change behind that version.
+        with pin_primary():
+            shards = list(
+                Post.published_posts.order_by()
+                .annotate(shard=(F("id") - 1) / shard_size())
+                .values("shard")
+                .annotate(lastmod=Max("updated_at"))
+                .order_by("shard")
+                .values_list("shard", "lastmod")
+            )
+        cache.set(key, shards, settings.BLOG_SITEMAP_CACHE_TIMEOUT)
+    return shards
+
+
+def sitemap_index(request):
+    base = _base_url(request)
+    lines = [XML_HEADER, f'<sitemapindex xmlns="{SITEMAP_NS}">\n']
+    for shard, lastmod in _shards():
+        loc = base + reverse("sitemap_shard", args=[shard])
+        lines.append(
+            f"<sitemap><loc>{escape(loc)}</loc>"
+            f"<lastmod>{lastmod.date().isoformat()}</lastmod></sitemap>\n"
+        )
+    lines.append("</sitemapindex>\n")
+    return HttpResponse("".join(lines), content_type="application/xml")
+
+
+def _shard_urls(base, low, high):
+    yield XML_HEADER
+    yield f'<urlset xmlns="{SITEMAP_NS}">\n'
+    posts = (
+        Post.published_posts.filter(id__gt=low, id__lte=high)
+        .only("slug", "published", "updated_at")
+        .order_by("id")
+    )
+    for post in posts.iterator(chunk_size=1000):
+        yield (
+            f"<url><loc>{escape(base + post.get_absolute_url())}</loc>"
+            f"<lastmod>{post.updated_at.date().isoformat()}</lastmod>"
+            f"<changefreq>{CHANGEFREQ}</changefreq>"
+            f"<priority>{PRIORITY}</priority></url>\n"
+        )
+    yield "</urlset>\n"
+
+
+def sitemap_shard(request, shard):
+    low, high = _shard_bounds(shard)
+    stats = Post.published_posts.filter(id__gt=low, id__lte=high).aggregate(
+        lastmod=Max("updated_at"), total=Count("id")
+    )
+    if not stats["total"]:
+        raise Http404("No such sitemap shard.")
 
+    base = _base_url(request)
+    key = (
+        f"blog:sitemap:shard:{shard_size()}:{shard}:"
+        f"{stats['lastmod'].isoformat()}:{stats['total']}:{base}"
+    )
+    last_modified = http_date(stats["lastmod"].timestamp())
 
-class PostSitemap(Sitemap):
-    changefreq = "weekly"
-    priority = 0.9
+    cached = cache.get(key)
+    metrics.cache_lookup("sitemap", cached is not None)
+    if cached is not None:
+        response = HttpResponse(cached, content_type="application/xml")
+    else:
 
-    def items(self):
-        return Post.published_posts.all()
+        def stream():
+            # Shards are bounded in size, so collecting the chunks to cache
+            # them keeps memory flat however large the archive grows.
+            chunks = []
+            with pin_primary():
+                for chunk in _shard_urls(base, low, high):
+                    chunks.append(chunk)
+                    yield chunk
+            cache.set(key, "".join(chunks), settings.BLOG_SITEMAP_CACHE_TIMEOUT)
 
-    def lastmod(self, obj):
-        return obj.updated_at  # ✅ use the correct field name
+        response = StreamingHttpResponse(stream(), content_type="application/xml")
+    response["Last-Modified"] = last_modified
+    return response
@@ -0,0 +1,322 @@
+"""
+Static export of the public blog (``export_static_site``).
+
+Every page is rendered by the real views and templates through the test
+client and written under the output directory at its URL path:
+
+* ``<post.get_absolute_url()>index.html`` for each published post;
+* ``index.html`` and ``page/<n>/index.html`` for the post list, and
+  ``tag/<slug>/index.html`` / ``tag/<slug>/page/<n>/index.html`` per tag;
+* ``feed/index.xml``, ``sitemap.xml`` and ``sitemap-posts-<n>.xml``.
+
+The list templates link to ``?page=<n>``, so the web server maps that to
+the page directories, e.g. for nginx::
+
+    index index.html index.xml;
+    if ($arg_page ~ "^[0-9]+$") { rewrite ^(.*/)$ $1page/$arg_page/? last; }
+
+Comment, share and search forms still post to the dynamic app, which must
+serve the same origin. Pages are rendered with ``BLOG_STATIC_EXPORT`` set,
+so the forms carry no CSRF token (one baked into a file would be rejected
+for every visitor); instead ``{% csrf_field %}`` fetches a fresh token and
+cookie from ``blog:csrf_token`` when the form is submitted.
+
+**Incremental builds.** Each page gets a fingerprint of what it shows:
+for a post, its ``updated_at``, image variants, comment count and newest
+active comment, its tags and its similar posts; for a list page, its
+page number and count, plus the fingerprints of the posts on it. A
+manifest in the output directory remembers the fingerprints of the last
+build, and only pages whose fingerprint changed are rendered again. Pages
+that no longer exist are deleted. A change to the templates or the
+Markdown renderer changes every fingerprint, so everything is rebuilt.
+The sidebar (total, latest and most commented posts) is not part of the
+fingerprints: on unchanged pages it lags until their next rebuild or
+``--force``. The feed and sitemaps are cheap and always rebuilt.
+"""
+
+import hashlib
+import json
+import math
+import os
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Max, Q
+from django.template.utils import get_app_template_dirs
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from taggit.models import TaggedItem
+
+from .models import Post, SimilarPost
+from .rendering import renderer_version
+from .routers import pin_primary
+from .sitemaps import shard_size
+
+MANIFEST = ".static-manifest.json"
+PER_PAGE = 3  # as in views.post_list
+
+
+def _digest(*parts):
+    return hashlib.md5(repr(parts).encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def site_fingerprint():
+    """Changes whenever a template or the Markdown renderer changes."""
+    digest = hashlib.md5(renderer_version().encode("utf-8"), usedforsecurity=False)
+    dirs = [
+        str(d) for engine in settings.TEMPLATES for d in engine.get("DIRS", [])
+    ] + [str(d) for d in get_app_template_dirs("templates")]
+    for directory in sorted(set(dirs)):
+        for root, subdirs, files in os.walk(directory):
+            subdirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(path.encode("utf-8"))
+                with open(path, "rb") as fh:
+                    digest.update(fh.read())
+    return digest.hexdigest()
+
+
+def _tags_by_post():
+    rows = (
+        TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id__in=Post.published_posts.values("id"),
+        )
+        .order_by("tag__name")
+        .values_list("object_id", "tag__slug", "tag__name")
+    )
+    tags = {}
+    for post_id, slug, name in rows.iterator(chunk_size=5000):
+        tags.setdefault(post_id, []).append((slug, name))
+    return tags
+
+
+def _similar_by_post():
+    rows = SimilarPost.objects.order_by("post", "rank").values_list(
+        "post_id", "similar_id", "similar__updated_at"
+    )
+    similar = {}
+    for post_id, similar_id, updated_at in rows.iterator(chunk_size=5000):
+        similar.setdefault(post_id, []).append((similar_id, updated_at))
+    return similar
+
+
+def _list_pages(prefix, url, summaries, items, site):
+    """Pages of ``url`` (``"/"`` or a tag URL) listing ``summaries``."""
+    num_pages = max(1, math.ceil(len(summaries) / PER_PAGE))
+    for number in range(1, num_pages + 1):
+        on_page = summaries[(number - 1) * PER_PAGE : number * PER_PAGE]
+        if number == 1:
+            path, page_url = f"{prefix}index.html", url
+        else:
+            path = f"{prefix}page/{number}/index.html"
+            page_url = f"{url}?page={number}"
+        items[path] = (page_url, _digest(site, number, num_pages, on_page))
+
+
+def plan(site=None):
+    """``{relative path: (url, fingerprint)}`` for every page of the site."""
+    site = site or site_fingerprint()
+    tags = _tags_by_post()
+    similar = _similar_by_post()
+    posts = (
+        Post.published_posts.order_by("-published", "-id")
+        .annotate(
+            last_comment=Max("comments__updated", filter=Q(comments__active=True))
+        )
+        .values_list(
+            "id",
+            "slug",
+            "published",
+            "updated_at",
+            "comment_count",
+            "last_comment",
+            "image",
+            "image_derivatives",
+        )
+    )
+    items = {}
+    summaries = []  # post fingerprints, newest first
+    by_tag = {}
+    for pk, slug, published, updated_at, count, last_comment, image, variants in (
+        posts.iterator(chunk_size=2000)
+    ):
+        post_tags = tags.get(pk, [])
+        summary = _digest(
+            updated_at,
+            count,
+            last_comment,
+            image,
+            json.dumps(variants, sort_keys=True),
+            post_tags,
+        )
+        summaries.append(summary)
+        for tag_slug, _ in post_tags:
+            by_tag.setdefault(tag_slug, []).append(summary)
+        url = Post(slug=slug, published=published).get_absolute_url()
+        items[url.lstrip("/") + "index.html"] = (
+            url,
+            _digest(site, summary, similar.get(pk, [])),
+        )
+
+    _list_pages("", reverse("blog:post_list"), summaries, items, site)
+    for tag_slug, tagged in by_tag.items():
+        url = reverse("blog:post_list_by_tag", args=[tag_slug])
+        _list_pages(url.lstrip("/"), url, tagged, items, site)
+    return items
+
+
+def always_rendered():
+    """Feed and sitemaps: ``[(relative path, url)]``, rebuilt on every run."""
+    pages = [
+        ("feed/index.xml", reverse("blog:post_feed")),
+        ("sitemap.xml", reverse("sitemap")),
+    ]
+    size = shard_size()
+    shards = sorted(
+        {
+            (pk - 1) // size
+            for pk in Post.published_posts.values_list("id", flat=True).iterator()
+        }
+    )
+    for shard in shards:
+        url = reverse("sitemap_shard", args=[shard])
+        pages.append((url.lstrip("/"), url))
+    return pages
+
+
+# ---------------------------------------------------------------------
+# Rendering (runs in the worker processes)
+# ---------------------------------------------------------------------
+_clients = {}
+
+
+def _client(host):
+    if host not in _clients:
+        _clients[host] = Client(HTTP_HOST=host)
+    return _clients[host]
+
+
+def default_host():
+    host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*", "")), None)
+    return (host or "testserver").lstrip(".")
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(content)
+    os.replace(tmp, path)
+
+
+def render_batch(task):
+    """
+    Render ``task = (out_dir, host, secure, [(path, url), ...])`` into
+    ``out_dir``. Returns ``(rendered paths, [(path, error), ...])``.
+    """
+    out_dir, host, secure, pages = task
+    client = _client(host)
+    done, failed = [], []
+    # The static list pages are page-numbered, whatever the live site uses,
+    # and their forms fetch a CSRF token at submit time (see csrf_field).
+    # Pool workers don't inherit the command's pin: read from the primary so
+    # the pages match the versions recorded in the manifest.
+    with override_settings(
+        BLOG_PAGINATION_MODE="page", BLOG_STATIC_EXPORT=True
+    ), pin_primary():
+        for path, url in pages:
+            try:
+                response = client.get(url, secure=secure)
+                if response.status_code != 200:
+                    raise ValueError(f"{url} returned {response.status_code}")
+                content = (
+                    b"".join(response.streaming_content)
+                    if response.streaming
+                    else response.content
+                )
+                _write(os.path.join(out_dir, path), content)
+            except Exception as exc:
+                failed.append((path, f"{type(exc).__name__}: {exc}"))
+            else:
+                done.append(path)
+    return done, failed
+
+
+# ---------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------
+def _load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(
+    out_dir,
+    host=None,
+    secure=True,
+    force=False,
+    batch_size=50,
+    map_fn=map,
+    log=lambda message: None,
+):
+    """
+    Render the pages that changed since the last build into ``out_dir``.
+    Pass a process pool's ``map`` as ``map_fn`` to render in parallel.
+    Returns a dict of counts.
+    """
+    host = host or default_host()
+    site = site_fingerprint()
+    previous = _load_manifest(out_dir)
+    old_pages = {} if force or previous.get("site") != site else previous["pages"]
+
+    items = plan(site)
+    todo = [
+        (path, url)
+        for path, (url, fingerprint) in items.items()
+        if old_pages.get(path) != fingerprint
+        or not os.path.exists(os.path.join(out_dir, path))
+    ]
+    log(f"{len(todo)} of {len(items)} pages changed.")
+    todo += always_rendered()
+
+    tasks = [
+        (out_dir, host, secure, todo[start : start + batch_size])
+        for start in range(0, len(todo), batch_size)
+    ]
+    rendered = 0
+    failed = {}
+    for done, errors in map_fn(render_batch, tasks):
+        rendered += len(done)
+        failed.update(errors)
+        log(f"Rendered {rendered}/{len(todo)}")
+
+    removed = 0
+    for path in set(previous.get("pages", {})) - set(items):
+        try:
+            os.remove(os.path.join(out_dir, path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    pages = {
+        path: fingerprint
+        for path, (url, fingerprint) in items.items()
+        if path not in failed
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    _write(
+        os.path.join(out_dir, MANIFEST),
+        json.dumps({"site": site, "pages": pages}).encode("utf-8"),
+    )
+    return {
+        "pages": len(items),
+        "rendered": rendered,
+        "removed": removed,
+        "failed": failed,
+    }
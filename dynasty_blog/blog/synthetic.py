@@ -0,0 +1,278 @@
+"""
+Synthetic archive generator for benchmarks (``generate_blog_data``).
+
+Everything is inserted with ``bulk_create`` in batches, so 100k posts and
+1M comments take minutes rather than hours. ``bulk_create`` skips
+``save()`` and signals, so the rendered fields are filled in here, and
+the denormalised data (comment counts, similar posts) and cache versions
+are rebuilt once at the end. Database triggers (the PostgreSQL search
+vector, SQLite FTS5) still fire on insert.
+
+Bodies mix short notes, medium articles and long reads with headings,
+lists, links and code blocks; tag and comment popularity are skewed the
+way real archives are (a few very popular posts and tags, a long tail).
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag, TaggedItem
+
+from .cache import bump_feed_version, bump_posts_version, bump_sidebar_version
+from .models import Comment, OutboundEmail, Post, SimilarPost
+from .similar import rebuild_similar_posts
+
+AUTHOR_PREFIX = "synthetic-author-"
+
+WORDS = (
+    "family dynasty village river harvest wedding journey story memory school "
+    "market church garden mountain rain season letter photo recipe festival "
+    "grandmother grandfather uncle cousin history heritage music dance cattle "
+    "maize bread road city travel holiday birthday friendship lesson garden "
+    "football evening morning sunrise sunset kitchen fire song prayer market "
+    "business farm tractor well water drought community celebration reunion "
+    "language proverb tradition craft pottery weaving basket drum ancestors"
+).split()
+WORDS = list(dict.fromkeys(WORDS))
+
+# (share of posts, min words, max words)
+BODY_MIX = ((0.5, 60, 200), (0.35, 300, 900), (0.15, 1500, 4000))
+
+
+def _sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(6, 18))
+    return " ".join(words).capitalize() + "."
+
+
+def markdown_body(rng, words):
+    """A Markdown document of roughly ``words`` words."""
+    blocks = []
+    written = 0
+    while written < words:
+        roll = rng.random()
+        if written and roll < 0.12:
+            blocks.append(f"## {' '.join(rng.choices(WORDS, k=3)).title()}")
+        elif roll < 0.18:
+            blocks.append(
+                "\n".join(f"- {_sentence(rng)}" for _ in range(rng.randint(2, 5)))
+            )
+        elif roll < 0.21:
+            blocks.append(
+                "```\n"
+                + "\n".join(f"{w} = {rng.randint(1, 99)}" for w in rng.sample(WORDS, 3))
+                + "\n```"
+            )
+        else:
+            sentences = [_sentence(rng) for _ in range(rng.randint(2, 6))]
+            if rng.random() < 0.3:
+                word = rng.choice(WORDS)
+                sentences.append(f"See [{word}](https://example.com/{word}).")
+            if rng.random() < 0.3:
+                sentences[0] = f"**{sentences[0]}**"
+            blocks.append(" ".join(sentences))
+        written += len(blocks[-1].split())
+    return "\n\n".join(blocks)
+
+
+def _body_words(rng):
+    roll = rng.random()
+    for share, low, high in BODY_MIX:
+        if roll < share:
+            return rng.randint(low, high)
+        roll -= share
+    return BODY_MIX[-1][2]
+
+
+def _skewed_weights(rng, n):
+    """Pareto-ish popularity weights for ``n`` items."""
+    return [rng.paretovariate(1.2) for _ in range(n)]
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def rendered_fields(body):
+    """``Post.RENDERED_FIELDS`` for ``body`` (picklable, for worker processes)."""
+    post = Post(body=body)
+    post.refresh_body_html(force=True)
+    return {name: getattr(post, name) for name in Post.RENDERED_FIELDS}
+
+
+def _authors(count):
+    User = get_user_model()
+    authors = []
+    for i in range(count):
+        user, created = User.objects.get_or_create(
+            username=f"{AUTHOR_PREFIX}{i}",
+            defaults={"first_name": "Synthetic", "last_name": f"Author {i}"},
+        )
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+        authors.append(user)
+    return authors
+
+
+def _tags(count):
+    names = [f"{WORDS[i % len(WORDS)]}-{i // len(WORDS)}" for i in range(count)]
+    slugs = [slugify(name) for name in names]
+    existing = set(Tag.objects.filter(slug__in=slugs).values_list("slug", flat=True))
+    Tag.objects.bulk_create(
+        [
+            Tag(name=name, slug=slug)
+            for name, slug in zip(names, slugs)
+            if slug not in existing
+        ],
+        batch_size=1000,
+    )
+    return list(Tag.objects.filter(slug__in=slugs).values_list("id", flat=True))
+
+
+def generate(
+    posts=1000,
+    comments=10000,
+    tags=200,
+    authors=5,
+    years=10,
+    published_ratio=0.95,
+    batch_size=1000,
+    seed=0,
+    map_fn=map,
+    log=lambda message: None,
+):
+    """
+    Insert a synthetic archive; returns a dict of what was created.
+    Markdown rendering dominates the run time: pass a process pool's
+    ``map`` as ``map_fn`` to spread it over several cores.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    span = timedelta(days=365 * years).total_seconds()
+    run = f"{seed}-{int(now.timestamp())}"
+
+    author_objs = _authors(authors)
+    tag_ids = _tags(tags)
+    tag_weights = _skewed_weights(rng, len(tag_ids))
+
+    post_ids = []
+    for start in range(0, posts, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, posts)):
+            title = " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).title()
+            batch.append(
+                Post(
+                    title=title,
+                    slug=slugify(f"{title} {run} {i}")[:250],
+                    author=rng.choice(author_objs),
+                    body=markdown_body(rng, _body_words(rng)),
+                    published=now - timedelta(seconds=rng.random() * span),
+                    status=(
+                        Post.Status.PUBLISHED
+                        if rng.random() < published_ratio
+                        else Post.Status.DRAFT
+                    ),
+                )
+            )
+        for post, fields in zip(batch, map_fn(rendered_fields, [p.body for p in batch])):
+            for name, value in fields.items():
+                setattr(post, name, value)
+        with transaction.atomic():
+            created = Post.objects.bulk_create(batch)
+        if created and created[0].pk is None:  # backend can't return ids
+            slugs = [p.slug for p in batch]
+            post_ids += Post.objects.filter(slug__in=slugs).values_list("id", flat=True)
+        else:
+            post_ids += [p.pk for p in created]
+        log(f"Posts: {len(post_ids)}/{posts}")
+
+    content_type = ContentType.objects.get_for_model(Post)
+    items = []
+    for post_id in post_ids:
+        for tag_id in set(rng.choices(tag_ids, tag_weights, k=rng.randint(1, 5))):
+            items.append(
+                TaggedItem(tag_id=tag_id, object_id=post_id, content_type=content_type)
+            )
+    for batch in _batches(items, batch_size):
+        TaggedItem.objects.bulk_create(batch)
+    log(f"Tagged items: {len(items)}")
+
+    if not post_ids:
+        comments = 0
+    cum_weights = []
+    total = 0.0
+    for weight in _skewed_weights(rng, len(post_ids)):
+        total += weight
+        cum_weights.append(total)
+    made = 0
+    while made < comments:
+        size = min(batch_size, comments - made)
+        batch = []
+        for post_id in rng.choices(post_ids, cum_weights=cum_weights, k=size):
+            batch.append(
+                Comment(
+                    post_id=post_id,
+                    name=rng.choice(WORDS).title(),
+                    email=f"{rng.choice(WORDS)}@example.com",
+                    body=" ".join(_sentence(rng) for _ in range(rng.randint(1, 4))),
+                    active=rng.random() < 0.95,
+                )
+            )
+        Comment.objects.bulk_create(batch)
+        made += size
+        if made % (batch_size * 50) == 0 or made == comments:
+            log(f"Comments: {made}/{comments}")
+
+    Post.recount_comments(Post.objects.filter(id__in=post_ids))
+    rebuild_similar_posts(
+        Post.published_posts.filter(id__in=post_ids).values_list("id", flat=True)
+    )
+    bump_posts_version()
+    bump_feed_version()
+    bump_sidebar_version()
+    return {"posts": len(post_ids), "comments": made, "tags": len(tag_ids)}
+
+
+def clear(batch_size=5000):
+    """
+    Delete every post written by a synthetic author, with its comments,
+    tags and similar-post rows. Rows are removed with plain DELETEs (no
+    per-object signals), so the real posts that listed synthetic ones as
+    similar are collected first and rebuilt at the end.
+    """
+    ids = list(
+        Post.objects.filter(author__username__startswith=AUTHOR_PREFIX)
+        .order_by()
+        .values_list("id", flat=True)
+    )
+    content_type = ContentType.objects.get_for_model(Post)
+    referrers = set()
+    for batch in _batches(ids, batch_size):
+        referrers.update(
+            SimilarPost.objects.filter(similar_id__in=batch).values_list(
+                "post_id", flat=True
+            )
+        )
+        with transaction.atomic():
+            for queryset in (
+                Comment.objects.filter(post_id__in=batch),
+                SimilarPost.objects.filter(post_id__in=batch),
+                SimilarPost.objects.filter(similar_id__in=batch),
+                TaggedItem.objects.filter(
+                    content_type=content_type, object_id__in=batch
+                ),
+                Post.objects.filter(id__in=batch),
+            ):
+                queryset._raw_delete(queryset.db)
+            OutboundEmail.objects.filter(post_id__in=batch).update(post=None)
+    rebuild_similar_posts(referrers.difference(ids))
+    bump_posts_version()
+    bump_feed_version()
+    bump_sidebar_version()
+    return len(ids)
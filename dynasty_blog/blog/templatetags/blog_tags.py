@@ -1,37 +1,167 @@
 # blog/templatetags/blog_tags.py
 from django import template
+from django.conf import settings
+from django.template.defaulttags import CsrfTokenNode
+from django.urls import reverse
 from blog.models import Post
-from django.db.models import Count
-import markdown
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
+from blog import metrics
+from blog.cache import sidebar_cache_timeout, sidebar_version
+from blog.images import derivative_url, picture_sources
+from blog.rendering import render_markdown
+from blog.routers import pin_primary
+from blog.timing import timed
 
 register = template.Library()
 
 
-@register.simple_tag
-def total_posts():
+# The async views (blog/async_views.py) may prefetch the sidebar data
+# concurrently and pass it in as ``sidebar``; the tags below use it if so.
+def _prefetched(context, name, count=None):
+    sidebar = context.get("sidebar")
+    if not sidebar:
+        return None
+    return sidebar[name] if count is None else sidebar[name][:count]
+
+
+@register.simple_tag(takes_context=True)
+@timed("sidebar")
+def total_posts(context):
     """Returns the total number of published blog posts."""
-    return Post.published_posts.count()
+    # Only rendered when the sidebar fragment wasn't cached.
+    metrics.CACHE_MISSES.inc("sidebar")
+    total = _prefetched(context, "total")
+    if total is not None:
+        return total
+    # The fragment is cached under the current sidebar version: don't fill
+    # it from a replica that may not have the change behind that version.
+    with pin_primary():
+        return Post.published_posts.count()
 
 
-@register.inclusion_tag("blog/post/latest_posts.html")
-def show_latest_posts(count=5):
+@register.inclusion_tag("blog/post/latest_posts.html", takes_context=True)
+@timed("sidebar")
+def show_latest_posts(context, count=5):
     """Returns the latest published blog posts."""
-
-    latest_posts = Post.published_posts.order_by("-published")[:count]
+    latest_posts = _prefetched(context, "latest", count)
+    if latest_posts is None:
+        # Evaluated here so the sidebar timing includes the query.
+        with pin_primary():
+            latest_posts = list(
+                Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS).order_by(
+                    "-published"
+                )[:count]
+            )
     return {"latest_posts": latest_posts}
 
 
 # Creating a template tag that returns a Queryset
-@register.simple_tag
-def get_most_commented_posts(count=5):
+@register.simple_tag(takes_context=True)
+@timed("sidebar")
+def get_most_commented_posts(context, count=5):
     """Returns the most commented published blog posts."""
-    return Post.published_posts.annotate(total_comments=Count("comments")).order_by(
-        "-total_comments"
-    )[:count]
+    most_commented = _prefetched(context, "most_commented", count)
+    if most_commented is not None:
+        return most_commented
+    with pin_primary():
+        return list(
+            Post.published_posts.defer(*Post.LIST_DEFERRED_FIELDS).order_by(
+                "-comment_count", "-published"
+            )[:count]
+        )
+
+
+@register.simple_tag
+def sidebar_cache_info():
+    """
+    Returns the (timeout, version) pair used to key the cached sidebar
+    fragment in base.html. Costs one cache lookup, no queries.
+    """
+    metrics.CACHE_LOOKUPS.inc("sidebar")
+    return {"timeout": sidebar_cache_timeout(), "version": sidebar_version()}
+
+
+@register.simple_tag
+def responsive_image(post, sizes="100vw", style="max-width:100%;height:auto;"):
+    """
+    Renders ``post.image`` as a lazy-loaded ``<picture>`` with AVIF/WebP
+    sources and a JPEG srcset, or a plain lazy ``<img>`` of the original
+    while the derivatives are still being generated.
+    """
+    if not post.image:
+        return ""
+    picture = picture_sources(post)
+    if picture is None:
+        return format_html(
+            '<img src="{}" alt="{}" style="{}" loading="lazy" decoding="async" />',
+            post.image.url,
+            post.title,
+            style,
+        )
+    sources, (srcset, src, width, height) = picture
+    return format_html(
+        "<picture>{}"
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" '
+        'style="{}" loading="lazy" decoding="async" /></picture>',
+        format_html_join(
+            "",
+            '<source type="{}" srcset="{}" sizes="{}" />',
+            ((mime, value, sizes) for mime, value in sources.items()),
+        ),
+        src,
+        srcset,
+        sizes,
+        width,
+        height,
+        post.title,
+        style,
+    )
+
+
+@register.simple_tag
+def image_variant_url(post, min_width):
+    """URL of a JPEG derivative at least ``min_width`` px wide (e.g. posters)."""
+    return derivative_url(post, int(min_width))
+
+
+# Fills the empty token field from the dynamic app just before the form is
+# submitted; form.submit() doesn't fire "submit" again.
+CSRF_FETCH_SCRIPT = """<script>
+(function (field) {{
+  field.form.addEventListener("submit", function (event) {{
+    if (field.value) return;
+    event.preventDefault();
+    fetch("{}", {{credentials: "same-origin"}})
+      .then(function (response) {{ return response.json(); }})
+      .then(function (data) {{ field.value = data.token; field.form.submit(); }});
+  }});
+}})(document.currentScript.previousElementSibling);
+</script>"""
+
+
+@register.simple_tag(takes_context=True)
+def csrf_field(context):
+    """
+    ``{% csrf_token %}``, except in the static export (``BLOG_STATIC_EXPORT``):
+    a token baked into a file is not the visitor's, so the form is sent
+    with an empty field that a small script fills from ``blog:csrf_token``.
+    """
+    if not getattr(settings, "BLOG_STATIC_EXPORT", False):
+        return CsrfTokenNode().render(context)
+    return format_html(
+        '<input type="hidden" name="csrfmiddlewaretoken" value="">'
+        + CSRF_FETCH_SCRIPT,
+        reverse("blog:csrf_token"),
+    )
 
 
 @register.filter(name="markdown")
 def markdown_format(text):
-    """Converts Markdown text to HTML."""
-    return mark_safe(markdown.markdown(text))
+    """
+    Converts Markdown text to HTML.
+
+    Post bodies are pre-rendered into ``Post.body_html``; use that instead
+    of this filter for post content.
+    """
+    return mark_safe(render_markdown(text))
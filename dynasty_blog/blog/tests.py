@@ -1,3 +1,1615 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.db.models import Max
+from django.http import Http404, HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    modify_settings,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+from django.utils.text import slugify
+from taggit.models import Tag
+
+from . import (
+    archive,
+    async_views,
+    benchmarks,
+    metrics,
+    outbox,
+    sitemaps,
+    static_site,
+    synthetic,
+)
+from .autocomplete import title_index
+from .cache import feed_version, sidebar_version
+from .dbpool import pool_stats
+from .models import Comment, OutboundEmail, Post, SimilarPost
+from .outbox import OutboxSender
+from .ratelimit import client_ip
+from .rendering import source_hash
+from .routers import (
+    PIN_COOKIE,
+    PrimaryPinMiddleware,
+    ReplicaRouter,
+    _pinned,
+    pin_primary,
+)
+from .views import QUERY_BUDGETS
+
+
+class QueryBudgetTests(TestCase):
+    """Each public view stays within QUERY_BUDGETS regardless of page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(
+            username="mike_thomas", first_name="Mike", last_name="Thomas"
+        )
+        cls.posts = []
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_posts(author)
+
+    @classmethod
+    def create_posts(cls, author):
+        for i in range(8):
+            post = Post.objects.create(
+                title=f"Family story {i}",
+                slug=f"family-story-{i}",
+                author=author,
+                body=f"Story number {i} about the family.",
+                status=Post.Status.PUBLISHED,
+            )
+            post.tags.add("family", f"story-{i % 3}")
+            for j in range(3):
+                Comment.objects.create(
+                    post=post, name=f"Reader {j}", email="r@example.com", body="Nice"
+                )
+            cls.posts.append(post)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertWithinBudget(self, view_name, url):
+        # Warm the sidebar fragment cache first: the budget covers the view only.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx),
+            QUERY_BUDGETS[view_name],
+            f"{view_name} ran {len(ctx)} queries:\n"
+            + "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        return response
+
+    def test_post_list(self):
+        self.assertWithinBudget("post_list", reverse("blog:post_list"))
+
+    def test_post_list_by_tag(self):
+        url = reverse("blog:post_list_by_tag", args=["family"])
+        self.assertWithinBudget("post_list_by_tag", url)
+
+    @override_settings(BLOG_PAGINATION_MODE="cursor")
+    def test_post_list_cursor(self):
+        self.assertWithinBudget("post_list_cursor", reverse("blog:post_list"))
+
+    @override_settings(BLOG_PAGINATION_MODE="cursor")
+    def test_cursor_pages_cover_archive(self):
+        url = reverse("blog:post_list")
+        page = self.client.get(url).context["posts"]
+        seen = [p.pk for p in page]
+        pages = [seen]
+        while page.has_next():
+            page = self.client.get(url, {"cursor": page.next_cursor}).context["posts"]
+            pages.append([p.pk for p in page])
+            seen += pages[-1]
+        expected = [p.pk for p in sorted(self.posts, key=lambda p: (p.published, p.pk))]
+        self.assertEqual(seen, expected[::-1])
+
+        # Walking back from the last page returns the same pages.
+        page = self.client.get(url, {"cursor": page.previous_cursor}).context["posts"]
+        self.assertEqual([p.pk for p in page], pages[-2])
+
+    def test_post_detail(self):
+        response = self.assertWithinBudget(
+            "post_detail", self.posts[0].get_absolute_url()
+        )
+        self.assertContains(response, "3 comments")
+        self.assertEqual(len(response.context["similar_posts"]), 4)
+
+    def test_conditional_get(self):
+        for url in (
+            reverse("blog:post_list"),
+            self.posts[0].get_absolute_url(),
+            reverse("blog:post_feed"),
+        ):
+            etag = self.client.get(url).headers["ETag"]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertLessEqual(len(ctx), QUERY_BUDGETS["post_conditional_get"])
+
+        # A new comment changes the detail page's validator.
+        url = self.posts[0].get_absolute_url()
+        etag = self.client.get(url).headers["ETag"]
+        Comment.objects.create(
+            post=self.posts[0], name="New", email="n@example.com", body="Hi"
+        )
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_rerender_changes_validators(self):
+        urls = (
+            reverse("blog:post_list"),
+            self.posts[0].get_absolute_url(),
+            reverse("blog:post_feed"),
+        )
+        etags = {url: self.client.get(url).headers["ETag"] for url in urls}
+        with override_settings(BLOG_MARKDOWN_EXTENSIONS=["extra"]):
+            call_command("rerender_posts", stdout=io.StringIO())
+        for url in urls:
+            response = self.client.get(url, headers={"If-None-Match": etags[url]})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_post_search(self):
+        url = reverse("blog:post_search") + "?query=family"
+        response = self.assertWithinBudget("post_search", url)
+        self.assertContains(response, "Found 8 results")
+
+
+class RenderedBodyTests(TestCase):
+    """Stored HTML, excerpt and reading time, kept current by source hash."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="author")
+        self.post = Post.objects.create(
+            title="Rendered",
+            slug="rendered",
+            author=self.author,
+            body="Some *emphasis* here.",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def test_hash_tracks_source_and_renderer(self):
+        self.assertIn("<em>emphasis</em>", self.post.body_html)
+        self.assertEqual(self.post.body_html_hash, source_hash(self.post.body))
+        self.assertFalse(self.post.refresh_body_html())
+
+        self.post.body = "Some **strong** text."
+        self.assertTrue(self.post.refresh_body_html())
+        self.assertIn("<strong>strong</strong>", self.post.body_html)
+        with override_settings(BLOG_MARKDOWN_EXTENSIONS=["extra"]):
+            self.assertNotEqual(source_hash(self.post.body), self.post.body_html_hash)
+            self.assertTrue(self.post.refresh_body_html())
+
+    def test_rerender_command_only_forces_when_asked(self):
+        Post.objects.filter(pk=self.post.pk).update(body_html="<p>tampered</p>")
+        out = io.StringIO()
+        call_command("rerender_posts", stdout=out)
+        self.assertIn("Re-rendered 0 of 1", out.getvalue())
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).body_html, "<p>tampered</p>"
+        )
+
+        call_command("rerender_posts", "--force", stdout=out)
+        self.assertIn("Re-rendered 1 of 1", out.getvalue())
+        self.assertIn("<em>emphasis</em>", Post.objects.get(pk=self.post.pk).body_html)
+
+    @override_settings(BLOG_EXCERPT_WORDS=5, BLOG_WORDS_PER_MINUTE=200)
+    def test_excerpt_and_reading_time(self):
+        self.post.body = "word " * 450
+        self.post.save()
+        self.assertEqual(self.post.word_count, 450)
+        self.assertEqual(self.post.reading_time, 3)
+        self.assertEqual(strip_tags(self.post.excerpt_html), "word word word word word …")
+        self.assertContains(self.client.get(reverse("blog:post_list")), "3 min read")
+
+    def test_changes_bump_sidebar_version(self):
+        version = sidebar_version()
+        self.post.save()
+        self.assertNotEqual(sidebar_version(), version)
+
+        version = sidebar_version()
+        Comment.objects.create(
+            post=self.post, name="R", email="r@example.com", body="Hi"
+        )
+        self.assertNotEqual(sidebar_version(), version)
+
+        version = sidebar_version()
+        call_command("rerender_posts", "--force", stdout=io.StringIO())
+        self.assertNotEqual(sidebar_version(), version)
+
+
+class CommentCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username="author")
+        cls.post = Post.objects.create(
+            title="Counted",
+            slug="counted",
+            author=author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def add_comment(self, active=True):
+        return Comment.objects.create(
+            post=self.post, name="R", email="r@example.com", body="Hi", active=active
+        )
+
+    def assertCount(self, expected):
+        self.post.refresh_from_db(fields=["comment_count"])
+        self.assertEqual(self.post.comment_count, expected)
+
+    def test_create_toggle_delete(self):
+        comment = self.add_comment()
+        self.add_comment(active=False)
+        self.assertCount(1)
+
+        comment = Comment.objects.get(pk=comment.pk)
+        comment.active = False
+        comment.save()
+        self.assertCount(0)
+
+        comment.active = True
+        comment.save()
+        self.assertCount(1)
+
+        comment.delete()
+        self.assertCount(0)
+
+    def test_stale_post_save_keeps_count(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.add_comment()
+        stale.title = "Edited"
+        stale.save()
+        self.assertCount(1)
+
+    def test_admin_approve_and_recount(self):
+        from django.contrib.admin.sites import site
+
+        self.add_comment(active=False)
+        self.add_comment(active=False)
+        self.add_comment()
+        stale = timezone.now() - timedelta(hours=1)
+        Comment.objects.update(updated=stale)
+        # Already-active comments in the selection must not be counted twice.
+        site._registry[Comment].approve_comments(None, Comment.objects.all())
+        self.assertCount(3)
+        # Approval moves the post's Last-Modified (max comment ``updated``).
+        self.assertEqual(Comment.objects.filter(updated__gt=stale).count(), 2)
+
+        Post.objects.update(comment_count=42)
+        Post.recount_comments()
+        self.assertCount(3)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="author")
+        for title in ["Grandfather's village", "Village harvest", "River crossing"]:
+            Post.objects.create(
+                title=title,
+                slug=title.lower().replace(" ", "-").replace("'", ""),
+                author=self.author,
+                body="Body",
+                status=Post.Status.PUBLISHED,
+            )
+
+    def suggest(self, q):
+        response = self.client.get(reverse("blog:post_autocomplete"), {"q": q})
+        return [r["title"] for r in response.json()["results"]]
+
+    def test_prefix_matches(self):
+        self.assertEqual(
+            sorted(self.suggest("vill")), ["Grandfather's village", "Village harvest"]
+        )
+        self.assertEqual(self.suggest("vill riv"), [])
+        self.assertEqual(self.suggest("harv vill"), ["Village harvest"])
+        self.assertEqual(self.suggest("village h"), ["Village harvest"])
+
+    def test_single_letter_is_not_scanned(self):
+        with mock.patch("blog.autocomplete.bisect_left") as bisect:
+            self.assertEqual(self.suggest("v"), [])
+            self.assertEqual(self.suggest("v h"), [])
+        bisect.assert_not_called()
+
+    def test_no_queries_when_warm_and_rebuild_on_save(self):
+        self.suggest("river")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.suggest("riv"), ["River crossing"])
+        self.assertEqual(len(ctx), 0)
+
+        Post.objects.create(
+            title="Riverside picnic",
+            slug="riverside-picnic",
+            author=self.author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+        self.assertIn("Riverside picnic", self.suggest("riv"))
+
+
+class PostgresSearchTests(TestCase):
+    def setUp(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("PostgreSQL search backend")
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="author")
+        self.post = self.make_post(
+            "Harvest festival", "The whole family gathered for the stories."
+        )
+
+    def make_post(self, title, body="Body", status=Post.Status.PUBLISHED):
+        return Post.objects.create(
+            title=title,
+            slug=slugify(title),
+            author=self.author,
+            body=body,
+            status=status,
+        )
+
+    def search(self, query, page=1):
+        from .search import PostgresSearchBackend
+
+        return PostgresSearchBackend().search(query, page)
+
+    def test_trigger_maintains_search_vector(self):
+        def matches(term):
+            return Post.objects.filter(search_vector=SearchQuery(term)).exists()
+
+        self.assertTrue(matches("festival"))
+        self.assertTrue(matches("stories"))
+        self.post.body = "Planting season."
+        self.post.save()
+        self.assertFalse(matches("stories"))
+        self.assertTrue(matches("planting"))
+
+    def test_rank_cut_off_and_published_only(self):
+        # A lone body (weight B) match ranks below the 0.3 cut-off.
+        self.make_post("Planting season", "A short note on the harvest.")
+        self.make_post("Harvest draft", status=Post.Status.DRAFT)
+        result = self.search("harvest")
+        self.assertFalse(result["fuzzy"])
+        self.assertEqual(result["results"], [self.post])
+
+    def test_trigram_fallback_for_misspellings(self):
+        result = self.search("harvst")
+        self.assertTrue(result["fuzzy"])
+        self.assertEqual(result["results"], [self.post])
+        self.assertFalse(hasattr(result["results"][0], "headline"))
+
+    @override_settings(BLOG_SEARCH_RESULTS_PER_PAGE=5)
+    def test_pagination(self):
+        for i in range(11):
+            self.make_post(f"Harvest {i}")
+        result = self.search("harvest", page=3)
+        self.assertEqual(result["count"], 12)
+        self.assertEqual((result["number"], result["num_pages"]), (3, 3))
+        self.assertEqual(len(result["results"]), 2)
+
+    def test_headline_is_escaped_plain_text(self):
+        self.post.body = "**Stories** <img src=x onerror=alert(1)> &lt;b&gt; told"
+        self.post.save()
+        headline = self.search("stories")["results"][0].headline
+        self.assertIn("<mark>Stories</mark>", headline)
+        self.assertIn("&lt;b&gt;", headline)
+        self.assertNotIn("<img", headline)
+        self.assertNotIn("**", headline)
+
+    def test_results_are_cached_until_posts_change(self):
+        from .search import PostgresSearchBackend
+
+        url = reverse("blog:post_search")
+        with mock.patch.object(
+            PostgresSearchBackend,
+            "search",
+            autospec=True,
+            side_effect=PostgresSearchBackend.search,
+        ) as search:
+            self.client.get(url, {"query": "harvest"})
+            self.client.get(url, {"query": "harvest"})
+            self.assertEqual(search.call_count, 1)
+            self.make_post("Harvest supper")
+            response = self.client.get(url, {"query": "harvest"})
+            self.assertEqual(search.call_count, 2)
+        self.assertEqual(response.context["search"]["count"], 2)
+
+
+class SQLiteFTSSearchTests(TestCase):
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite FTS5 backend")
+        author = get_user_model().objects.create_user(username="author")
+        self.post = Post.objects.create(
+            title="Harvest festival",
+            slug="harvest-festival",
+            author=author,
+            body="The whole family gathered for the stories.",
+            status=Post.Status.PUBLISHED,
+        )
+        Post.objects.create(
+            title="Draft about harvest",
+            slug="draft",
+            author=author,
+            body="Not yet.",
+        )
+
+    def search(self, query):
+        from .search import SQLiteFTSSearchBackend
+
+        return SQLiteFTSSearchBackend().search(query, 1)
+
+    def test_stemmed_ranked_published_only(self):
+        result = self.search("story harvest")
+        self.assertEqual(result["count"], 1)
+        self.assertEqual(result["results"], [self.post])
+        self.assertIn("<mark>", result["results"][0].headline)
+
+    def test_triggers_follow_edits_and_deletes(self):
+        self.post.title = "Planting season"
+        self.post.save()
+        self.assertEqual(self.search("festival")["count"], 0)
+        self.assertEqual(self.search("planting")["count"], 1)
+        self.post.delete()
+        self.assertEqual(self.search("planting")["count"], 0)
+
+    def test_auto_backend_follows_install_state(self):
+        from .search import drop_sqlite_fts, get_search_backend, install_sqlite_fts
+
+        self.assertEqual(get_search_backend().name, "sqlite-fts5")
+        drop_sqlite_fts(connection)
+        self.assertEqual(get_search_backend().name, "orm")
+        install_sqlite_fts(connection)
+        self.assertEqual(get_search_backend().name, "sqlite-fts5")
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('harvest" OR "x')["count"], 0)
+        self.assertEqual(self.search("?")["count"], 0)
+
+    def test_snippet_is_plain_escaped_text(self):
+        self.post.body = (
+            "**Planting** <img src=x onerror=alert(1)> time &lt;b&gt; "
+            + "word " * 40
+            + "<div class='x'>tail</div>"
+        )
+        self.post.save()
+        headline = self.search("planting")["results"][0].headline
+        self.assertTrue(headline.startswith("<mark>Planting</mark>"))
+        self.assertIn("time &lt;b&gt; word", headline)
+        self.assertNotIn("<img", headline)
+        self.assertNotIn("**", headline)
+
+        response = self.client.get(reverse("blog:post_search"), {"query": "planting"})
+        self.assertContains(response, "<mark>Planting</mark>")
+        self.assertContains(response, "time &lt;b&gt; word")
+        self.assertNotContains(response, "onerror")
+
+
+class SimilarPostsTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username="author")
+
+    def make_post(self, slug, *tags, status=Post.Status.PUBLISHED):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title=slug, slug=slug, author=self.author, body="Body", status=status
+            )
+            post.tags.add(*tags)
+        return post
+
+    def similar(self, post):
+        return list(
+            SimilarPost.objects.filter(post=post).values_list("similar__slug", flat=True)
+        )
+
+    def test_incremental_updates(self):
+        a = self.make_post("a", "x", "y")
+        b = self.make_post("b", "x", "y")
+        c = self.make_post("c", "x")
+        draft = self.make_post("d", "x", "y", status=Post.Status.DRAFT)
+        self.assertEqual(self.similar(a), ["b", "c"])
+        self.assertEqual(self.similar(draft), [])  # only published posts get lists
+
+        # Removing a shared tag from b re-ranks a's list (ties by recency).
+        with self.captureOnCommitCallbacks(execute=True):
+            b.tags.remove("y")
+        self.assertEqual(self.similar(a), ["c", "b"])
+
+        # Publishing the draft makes it the best match.
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.status = Post.Status.PUBLISHED
+            draft.save()
+        self.assertEqual(self.similar(a), ["d", "c", "b"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            c.tags.clear()
+            draft.delete()
+        self.assertEqual(self.similar(a), ["b"])
+
+        # Unpublishing a post clears its own list, as a full rebuild would.
+        with self.captureOnCommitCallbacks(execute=True):
+            a.status = Post.Status.DRAFT
+            a.save()
+        self.assertEqual(self.similar(a), [])
+        self.assertEqual(self.similar(b), [])
+
+    @override_settings(BLOG_SIMILAR_POSTS=2)
+    def test_new_post_is_merged_without_rebuilding_other_lists(self):
+        from . import similar
+
+        posts = [self.make_post(f"p{i}", "x") for i in range(4)]
+        self.make_post("both", "x", "y")
+        with mock.patch.object(
+            similar, "_ranked_pairs", wraps=similar._ranked_pairs
+        ) as ranked:
+            newest = self.make_post("newest", "x", "y")
+        # Only the new post's own list was computed with the tag join.
+        self.assertEqual([c.args[0] for c in ranked.call_args_list], [[newest.pk]])
+        self.assertEqual(self.similar(newest), ["both", "p3"])
+        self.assertEqual(self.similar(posts[0]), ["newest", "both"])
+
+        # The merged lists match a full rebuild.
+        merged = list(SimilarPost.objects.values_list("post", "similar", "rank"))
+        call_command("rebuild_similar_posts", stdout=io.StringIO())
+        self.assertCountEqual(
+            SimilarPost.objects.values_list("post", "similar", "rank"), merged
+        )
+
+    def test_rebuild_conflicts_are_logged_not_raised(self):
+        from . import similar
+
+        a = self.make_post("a", "x")
+        self.make_post("b", "x")
+        with mock.patch.object(
+            SimilarPost.objects, "bulk_create", side_effect=IntegrityError
+        ), self.assertLogs("blog.similar", "WARNING"):
+            similar.rebuild_similar_posts([a.pk])
+        self.assertEqual(self.similar(a), ["b"])
+
+
+class FeedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="author")
+        self.post = Post.objects.create(
+            title="First harvest",
+            slug="first-harvest",
+            author=self.author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+        self.post.tags.add("harvest")
+
+    def fetch(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), len(ctx)
+
+    def test_cached_until_published_content_changes(self):
+        url = reverse("blog:post_feed")
+        first, _ = self.fetch(url)
+        again, queries = self.fetch(url)
+        self.assertEqual(first, again)
+        self.assertLessEqual(queries, 1)  # freshness check only
+
+        # The query string doesn't create new cache entries.
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.assertEqual(self.fetch(url + "?x=1")[0], first)
+        cache_set.assert_not_called()
+
+        # Draft edits don't touch the feed cache.
+        draft = Post.objects.create(
+            title="Draft", slug="draft", author=self.author, body="Body"
+        )
+        self.assertLessEqual(self.fetch(url)[1], 1)
+
+        draft.status = Post.Status.PUBLISHED
+        draft.save()
+        self.assertIn("<title>Draft</title>", self.fetch(url)[0])
+
+        draft.status = Post.Status.DRAFT
+        draft.save()
+        self.assertNotIn("<title>Draft</title>", self.fetch(url)[0])
+
+    def test_tag_feed(self):
+        content, _ = self.fetch(reverse("blog:post_feed_by_tag", args=["harvest"]))
+        self.assertIn("First harvest", content)
+        self.post.tags.clear()
+        content, _ = self.fetch(reverse("blog:post_feed_by_tag", args=["harvest"]))
+        self.assertNotIn("First harvest", content)
+
+
+@override_settings(BLOG_SITEMAP_SHARD_SIZE=2)
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create_user(username="author")
+        self.posts = [
+            Post.objects.create(
+                title=f"Post {i}",
+                slug=f"post-{i}",
+                author=author,
+                body="Body",
+                status=Post.Status.DRAFT if i == 1 else Post.Status.PUBLISHED,
+            )
+            for i in range(5)
+        ]
+
+    def shard(self, number):
+        response = self.client.get(reverse("sitemap_shard", args=[number]))
+        if response.status_code != 200:
+            return None
+        return b"".join(response) if response.streaming else response.content
+
+    def test_index_and_shards(self):
+        index = self.client.get(reverse("sitemap")).content.decode()
+        shard_urls = [reverse("sitemap_shard", args=[n]) for n in range(3)]
+        for url in shard_urls:
+            self.assertIn(url, index)
+
+        urls = b"".join(self.shard(n) for n in range(3)).decode()
+        for post in self.posts:
+            self.assertEqual(post.get_absolute_url() in urls, post.slug != "post-1")
+
+    def test_shard_cache_follows_changes(self):
+        first_id = self.posts[0].pk
+        shard = (first_id - 1) // 2
+        self.assertIsNotNone(self.shard(shard))
+        with CaptureQueriesContext(connection) as ctx:
+            self.shard(shard)
+        self.assertEqual(len(ctx), 1)  # shard stats only; XML from cache
+
+        self.posts[0].status = Post.Status.DRAFT
+        self.posts[0].save()
+        content = self.shard(shard) or b""
+        self.assertNotIn(self.posts[0].get_absolute_url().encode(), content)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            BLOG_IMAGE_DERIVATIVES_ASYNC=False,
+            BLOG_IMAGE_WIDTHS=[160, 320],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, size=(500, 300)):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "purple").save(buffer, "JPEG")
+        return SimpleUploadedFile("photo.jpg", buffer.getvalue(), "image/jpeg")
+
+    def test_generated_after_commit_and_rendered(self):
+        author = get_user_model().objects.create_user(username="author")
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title="Photo",
+                slug="photo",
+                author=author,
+                body="Body",
+                image=self.upload(),
+                status=Post.Status.PUBLISHED,
+            )
+        post.refresh_from_db()
+        widths = [w for w, _ in post.image_derivatives["variants"]["jpeg"]]
+        self.assertEqual(widths, [160, 320])  # never wider than configured
+
+        html = self.client.get(post.get_absolute_url()).content.decode()
+        self.assertIn("<picture>", html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn("320w", html)
+
+    def test_backfill_moves_validators(self):
+        author = get_user_model().objects.create_user(username="author")
+        post = Post.objects.create(  # on_commit never runs: no derivatives
+            title="Old photo",
+            slug="old-photo",
+            author=author,
+            body="Body",
+            image=self.upload(),
+            status=Post.Status.PUBLISHED,
+        )
+        stale = timezone.now() - timedelta(days=1)
+        Post.objects.filter(pk=post.pk).update(updated_at=stale)
+        feed = feed_version()
+
+        call_command("generate_image_derivatives", workers=1, stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.image_derivatives)
+        self.assertGreater(post.updated_at, stale)
+        self.assertNotEqual(feed_version(), feed)
+
+
+class MediaRangeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.media_root, "blog_audio"))
+        with open(os.path.join(self.media_root, "blog_audio", "a.mp3"), "wb") as fh:
+            fh.write(bytes(range(100)))
+        self.url = reverse("media", args=["blog_audio/a.mp3"])
+
+    def test_full_file_with_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        etag = response["ETag"]
+        again = self.client.get(self.url, headers={"if-none-match": etag})
+        self.assertEqual(again.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, headers={"range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+
+        suffix = self.client.get(self.url, headers={"range": "bytes=-5"})
+        self.assertEqual(b"".join(suffix.streaming_content), bytes(range(95, 100)))
+
+        stale = self.client.get(
+            self.url, headers={"range": "bytes=0-9", "if-range": '"old"'}
+        )
+        self.assertEqual(stale.status_code, 200)
+
+        unsatisfiable = self.client.get(self.url, headers={"range": "bytes=200-"})
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable["Content-Range"], "bytes */100")
+
+    @override_settings(BLOG_MEDIA_OFFLOAD="nginx")
+    def test_offload_to_proxy(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/blog_audio/a.mp3"
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_path_traversal(self):
+        response = self.client.get("/media/../settings.py")
+        self.assertEqual(response.status_code, 404)
+
+
+class EmailOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username="author")
+        cls.post = Post.objects.create(
+            title="Shared",
+            slug="shared",
+            author=author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def share(self):
+        return self.client.post(
+            reverse("blog:post_share", args=[self.post.id]),
+            {"name": "Ann", "email": "ann@example.com", "to": "bob@example.com"},
+        )
+
+    def test_share_queues_without_sending(self):
+        response = self.share()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, OutboundEmail.Status.QUEUED)
+        self.assertEqual(queued.to, "bob@example.com")
+
+        call_command("send_outbox", "--once", "--rate=0", stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Shared", mail.outbox[0].subject)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundEmail.Status.SENT)
+
+    @override_settings(BLOG_OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_give_up(self):
+        self.share()
+        sender = OutboxSender(rate=0)
+        failing = mock.patch.object(EmailMessage, "send", side_effect=OSError("down"))
+        with failing, self.assertLogs("blog.outbox", "WARNING"):
+            self.assertEqual(sender.send_batch(), (0, 1))
+            email = OutboundEmail.objects.get()
+            self.assertEqual(email.status, OutboundEmail.Status.QUEUED)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertEqual(sender.send_batch(), (0, 0))  # not due yet
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(sender.send_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.Status.FAILED)
+        self.assertIn("down", email.last_error)
+
+    def test_lease_covers_the_batch_and_is_not_outlived(self):
+        for _ in range(2):
+            self.share()
+        before = timezone.now()
+        # 2 messages at 0.01/s need 200s, on top of the margin.
+        claimed = outbox.claim_batch(2, outbox.lease_for(2, 0.01))
+        self.assertGreaterEqual(
+            min(e.next_attempt_at for e in claimed) - before,
+            outbox.LEASE_MARGIN + timedelta(seconds=200),
+        )
+
+        # A worker whose lease has run out stops instead of double-sending.
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(
+            outbox, "LEASE_MARGIN", timedelta(0)
+        ), mock.patch.object(EmailMessage, "send") as send, self.assertLogs(
+            "blog.outbox", "WARNING"
+        ):
+            self.assertEqual(OutboxSender(rate=0).send_batch(), (0, 0))
+        send.assert_not_called()
+        # Rows that were never tried don't lose an attempt.
+        self.assertEqual(
+            list(OutboundEmail.objects.values_list("attempts", flat=True)), [1, 1]
+        )
+
+
+@override_settings(
+    BLOG_RATE_LIMITS={"comment": {"ip": "3/m"}, "share": {"email": "1/h"}}
+)
+class RateLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username="author")
+        cls.post = Post.objects.create(
+            title="Limited",
+            slug="limited",
+            author=author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("blog:post_comment", args=[self.post.id])
+
+    def comment(self, body):
+        return self.client.post(
+            self.url, {"name": "Ann", "email": "ann@example.com", "body": body}
+        )
+
+    def test_throttled_requests_skip_the_database(self):
+        for i in range(3):
+            self.assertEqual(self.comment(f"Comment number {i}").status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.comment("One too many")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(Comment.objects.count(), 3)
+
+    def test_near_duplicate_comment_rejected(self):
+        self.assertEqual(self.comment("Great post!").status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.comment("  great   POST ")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_unpublished_post_does_not_claim_the_body(self):
+        Post.objects.filter(pk=self.post.pk).update(status=Post.Status.DRAFT)
+        self.assertEqual(self.comment("Early bird").status_code, 404)
+        Post.objects.filter(pk=self.post.pk).update(status=Post.Status.PUBLISHED)
+        self.assertEqual(self.comment("Early bird").status_code, 200)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    @override_settings(BLOG_CLIENT_IP_HEADER="HTTP_X_FORWARDED_FOR")
+    def test_spoofed_forwarded_for_entries_are_ignored(self):
+        # One proxy appends the real peer; whatever the client sent is left of it.
+        for i in range(4):
+            response = self.client.post(
+                self.url,
+                {"name": "Ann", "email": f"ann{i}@example.com", "body": f"Hi {i}"},
+                HTTP_X_FORWARDED_FOR=f"10.0.0.{i}, 203.0.113.7",
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Comment.objects.count(), 3)
+
+        request = RequestFactory().get(
+            "/", HTTP_X_FORWARDED_FOR="10.9.9.9, 203.0.113.7, 192.0.2.1"
+        )
+        with self.settings(BLOG_TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(client_ip(request), "203.0.113.7")
+        with self.settings(BLOG_TRUSTED_PROXY_COUNT=5):
+            self.assertEqual(client_ip(request), "10.9.9.9")
+
+    def test_share_limited_per_sender(self):
+        url = reverse("blog:post_share", args=[self.post.id])
+        data = {"name": "Ann", "email": "ann@example.com", "to": "bob@example.com"}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self.client.post(url, data).status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)  # reads unaffected
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username="author")
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.posts = []
+            for i in range(4):
+                post = Post.objects.create(
+                    title=f"Async post {i}",
+                    slug=f"async-post-{i}",
+                    author=author,
+                    body=f"Body {i}",
+                    status=Post.Status.PUBLISHED,
+                )
+                post.tags.add("shared")
+                cls.posts.append(post)
+        Comment.objects.create(
+            post=cls.posts[0], name="Ann", email="a@example.com", body="First!"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    async def test_list_matches_sync_view(self):
+        request = self.factory.get("/", {"page": "2"})
+        response = await async_views.post_list(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        html = response.content.decode()
+        self.assertIn("Async post 0", html)  # oldest post, on page 2
+        self.assertNotIn("Async post 3", html.split('id="sidebar"')[0])
+        self.assertIn("<strong>4</strong> posts", html)  # prefetched sidebar
+
+        sync = await sync_to_async(self.client.get)("/", {"page": "2"})
+        self.assertEqual(sync["ETag"], response["ETag"])
+
+        cached = self.factory.get("/", headers={"if-none-match": response["ETag"]})
+        self.assertEqual((await async_views.post_list(cached)).status_code, 304)
+
+    async def test_detail_comments_and_similar_posts(self):
+        post = self.posts[0]
+        published = timezone.localtime(post.published)  # URLs use local dates
+        request = self.factory.get(post.get_absolute_url())
+        response = await async_views.post_detail(
+            request,
+            year=published.year,
+            month=published.month,
+            day=published.day,
+            post=post.slug,
+        )
+        html = response.content.decode()
+        self.assertIn("First!", html)
+        self.assertIn("Async post 3", html)  # similar: shares a tag
+
+        with self.assertRaises(Http404):
+            await async_views.post_detail(
+                request, year=2000, month=1, day=1, post=post.slug
+            )
+
+    async def test_feed_served_from_cache(self):
+        request = self.factory.get("/feed/")
+        first = await async_views.post_feed(request)
+        self.assertEqual(first.status_code, 200)
+        rebuild = mock.patch.object(
+            async_views.LatestPostsFeed, "items", side_effect=AssertionError
+        )
+        with rebuild:
+            second = await async_views.post_feed(self.factory.get("/feed/"))
+        self.assertEqual(second.content, first.content)
+
+
+class DatabasePoolTests(TestCase):
+    def test_stats_are_staff_only(self):
+        url = reverse("db_pool_stats")
+        self.assertEqual(self.client.get(url).status_code, 302)  # to login
+
+        staff = get_user_model().objects.create_user(
+            username="staff", password="pw", is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Not pooled here (SQLite / no DB_POOL): reported as null.
+        self.assertEqual(response.json()["default"], pool_stats("default"))
+
+    def test_mean_wait_time(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {"requests_num": 4, "requests_wait_ms": 10}
+        with mock.patch.object(connections["default"], "pool", pool, create=True):
+            self.assertEqual(pool_stats()["requests_wait_ms_avg"], 2.5)
+
+
+@override_settings(REPLICA_DATABASES=["replica1", "replica2"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_round_robin_writes_to_primary(self):
+        reads = [self.router.db_for_read(Post) for _ in range(4)]
+        self.assertEqual(reads, ["replica1", "replica2", "replica1", "replica2"])
+        self.assertEqual(self.router.db_for_write(Post), "default")
+        self.assertEqual(self.router.db_for_read(OutboundEmail), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "blog"))
+
+    def test_pinned_and_transactional_reads_use_primary(self):
+        with pin_primary():
+            self.assertEqual(self.router.db_for_read(Comment), "default")
+        with mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertEqual(self.router.db_for_read(Comment), "default")
+        self.assertEqual(self.router.db_for_read(Comment), "replica1")
+
+    def test_middleware_pins_writes_and_following_requests(self):
+        seen = []
+
+        def view(request):
+            seen.append(_pinned.get())
+            return HttpResponse()
+
+        middleware = PrimaryPinMiddleware(view)
+        factory = RequestFactory()
+        middleware(factory.get("/"))
+        response = middleware(factory.post("/1/comment/"))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        follow_up = factory.get("/")
+        follow_up.COOKIES[PIN_COOKIE] = "1"
+        middleware(follow_up)
+        middleware(factory.get("/admin/blog/post/"))
+        self.assertEqual(seen, [False, True, True, True])
+        self.assertFalse(_pinned.get())
+
+
+@override_settings(
+    REPLICA_DATABASES=["lagging"], DATABASE_ROUTERS=["blog.routers.ReplicaRouter"]
+)
+class LaggingReplicaTests(TransactionTestCase):
+    """Caches keyed by a fresh version must not be filled from a stale replica."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Registered here rather than in settings, so the test runner
+        # doesn't try to create a test database for it.
+        cls.databases = {"default", "lagging"}
+        handle, cls.replica_path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(handle)
+        connections.settings["lagging"] = connections.configure_settings(
+            {
+                **connections.settings,
+                "lagging": {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": cls.replica_path,
+                },
+            }
+        )["lagging"]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["lagging"].close()
+        del connections["lagging"]
+        connections.settings.pop("lagging")
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("snapshots the SQLite test database")
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="author")
+        self.make_post("Old news")
+        # The replica is a snapshot taken before the next write: it never
+        # catches up during the test.
+        connections["lagging"].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+        self.fresh = self.make_post("Fresh news")
+
+    def make_post(self, title):
+        # No test transaction here: on_commit callbacks run straight away.
+        post = Post.objects.create(
+            title=title,
+            slug=slugify(title),
+            author=self.author,
+            body=f"{title} from the farm.",
+            status=Post.Status.PUBLISHED,
+        )
+        post.tags.add("farm")
+        return post
+
+    def test_replica_is_behind(self):
+        self.assertFalse(
+            Post.objects.using("lagging").filter(pk=self.fresh.pk).exists()
+        )
+
+    def test_cache_fills_read_from_primary(self):
+        sidebar = self.client.get(reverse("blog:post_list")).content.decode()
+        self.assertIn("<strong>2</strong> posts", sidebar)
+        self.assertContains(self.client.get(reverse("blog:post_feed")), "Fresh news")
+        self.assertContains(
+            self.client.get(reverse("blog:post_search"), {"query": "fresh"}),
+            "Fresh news",
+        )
+        self.assertEqual(
+            sitemaps._shards()[-1][1],
+            Post.objects.using("default").aggregate(lastmod=Max("updated_at"))[
+                "lastmod"
+            ],
+        )
+        self.assertEqual(
+            [s["title"] for s in title_index.suggest("fresh")], ["Fresh news"]
+        )
+
+    def test_import_sees_its_own_previous_chunk(self):
+        record = {
+            "title": "Same day",
+            "author": "author",
+            "published": timezone.now().isoformat(),
+        }
+        stats = archive.Importer(batch_size=1).run([record, dict(record)])
+        self.assertEqual(stats["renamed"], 1)
+        self.assertEqual(
+            set(
+                Post.objects.using("default")
+                .filter(title="Same day")
+                .values_list("slug", flat=True)
+            ),
+            {"same-day", "same-day-2"},
+        )
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        synthetic.generate(posts=12, comments=40, tags=5, authors=2, seed=1)
+
+    def test_generator_and_clear(self):
+        self.assertEqual(Post.objects.count(), 12)
+        self.assertEqual(Comment.objects.count(), 40)
+        post = Post.objects.exclude(body_html="").first()
+        self.assertIn("<p>", post.body_html)
+        self.assertEqual(synthetic.clear(), 12)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_clear_rebuilds_real_posts_similar_lists(self):
+        author = get_user_model().objects.create_user(username="author")
+        tags = list(Tag.objects.values_list("name", flat=True))
+        real = []
+        for i in range(5):
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(
+                    title=f"real {i}",
+                    slug=f"real-{i}",
+                    author=author,
+                    body="Body",
+                    status=Post.Status.PUBLISHED,
+                    published=timezone.now() - timedelta(days=3650),
+                )
+                post.tags.add(*(tags if i == 0 else tags[:1]))
+            real.append(post)
+
+        def similar_ids():
+            return set(real[0].similar_posts.values_list("similar", flat=True))
+
+        # Newer synthetic posts crowd the older real ones out of the list.
+        self.assertFalse(similar_ids() & {p.pk for p in real})
+
+        synthetic.clear()
+        self.assertEqual(similar_ids(), {p.pk for p in real[1:]})
+
+    def test_baseline_comparison(self):
+        path = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        out = io.StringIO()
+        call_command(
+            "benchmark", iterations=2, baseline=path, save_baseline=True, stdout=out
+        )
+        baseline = benchmarks.load(path)
+        self.assertIn("post_list", baseline["results"])
+        self.assertEqual(baseline["meta"]["posts"], Post.published_posts.count())
+
+        current = {"results": {k: dict(v) for k, v in baseline["results"].items()}}
+        self.assertEqual(benchmarks.compare(current, baseline), [])
+        current["results"]["post_list"]["queries"] += 1
+        current["results"]["post_detail"]["p95_ms"] = (
+            baseline["results"]["post_detail"]["p95_ms"] * 2 + 10
+        )
+        self.assertCountEqual(
+            [name for name, _ in benchmarks.compare(current, baseline)],
+            ["post_list", "post_detail"],
+        )
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(username="author")
+        self.post = Post.objects.create(
+            title="Harvest day",
+            slug="harvest-day",
+            author=self.author,
+            body="# Harvest\n\nWe brought in the maize.",
+            published=timezone.now() - timezone.timedelta(days=3),
+            status=Post.Status.PUBLISHED,
+        )
+        self.post.tags.add("farm", "family")
+        comment = Comment.objects.create(
+            post=self.post, name="Ann", email="ann@example.com", body="Lovely"
+        )
+        Comment.objects.filter(pk=comment.pk).update(
+            created=timezone.now() - timezone.timedelta(days=2)
+        )
+
+    def test_front_matter_round_trip(self):
+        meta = {"title": 'Say "hi": yes', "tags": ["a, b", "c"]}
+        text = archive.dump_front_matter(meta, "Body\n")
+        self.assertEqual(archive.parse_front_matter(text), (meta, "Body\n"))
+        parsed, body = archive.parse_front_matter(
+            "---\ntitle: Plain\ntags:\n  - one\n  - 'two'\n---\nText"
+        )
+        self.assertEqual(parsed, {"title": "Plain", "tags": ["one", "two"]})
+        self.assertEqual(body, "Text")
+
+    def test_jsonl_round_trip_dedupes_slug_for_date(self):
+        out = io.StringIO()
+        call_command("export_posts", stdout=out)
+        records = out.getvalue()
+        self.assertEqual(len(records.splitlines()), 1)
+
+        # A chunk costs the same queries however many records it holds:
+        # author, slugs, tags, 3 inserts + created fix-up, then similar posts
+        # (including the row lock).
+        source = io.StringIO(records * 3)
+        with self.assertNumQueries(17):
+            stats = archive.Importer(batch_size=10).run(archive.read_jsonl(source))
+        self.assertEqual(stats["posts"], 3)
+        self.assertEqual(stats["renamed"], 3)
+        self.assertEqual(
+            set(Post.objects.values_list("slug", flat=True)),
+            {"harvest-day", "harvest-day-2", "harvest-day-3", "harvest-day-4"},
+        )
+        copy = Post.objects.get(slug="harvest-day-2")
+        self.assertEqual(copy.published, self.post.published)
+        self.assertEqual(copy.author, self.author)
+        self.assertEqual(copy.body_html, self.post.body_html)
+        self.assertEqual(copy.comment_count, 1)
+        self.assertEqual(set(copy.tags.names()), {"farm", "family"})
+        self.assertEqual(
+            copy.comments.get().created, self.post.comments.get().created
+        )
+
+    def test_markdown_directory_import(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        call_command(
+            "export_posts", format="markdown", output=path, stdout=io.StringIO()
+        )
+        with open(os.path.join(path, "new.md"), "w", encoding="utf-8") as fh:
+            fh.write("---\ntitle: New post\ntags: [farm]\n---\nHello *there*.")
+        call_command("import_posts", path, author="author", stdout=io.StringIO())
+        new = Post.objects.get(title="New post")
+        self.assertEqual(new.slug, "new-post")
+        self.assertEqual(new.status, Post.Status.PUBLISHED)
+        self.assertIn("<em>there</em>", new.body_html)
+        self.assertEqual(Post.objects.filter(title="Harvest day").count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_markdown_re_export_overwrites(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for _ in range(2):
+            call_command(
+                "export_posts", format="markdown", output=path, stdout=io.StringIO()
+            )
+        self.assertEqual(len(os.listdir(path)), 2)  # post + its comments
+
+        self.post.comments.all().delete()
+        call_command(
+            "export_posts", format="markdown", output=path, stdout=io.StringIO()
+        )
+        self.assertEqual(len(os.listdir(path)), 1)
+
+        # A renamed post replaces its old file; unrelated files are kept.
+        with open(os.path.join(path, "notes.txt"), "w", encoding="utf-8") as fh:
+            fh.write("keep me")
+        Post.objects.filter(pk=self.post.pk).update(slug="harvest-festival")
+        call_command(
+            "export_posts", format="markdown", output=path, stdout=io.StringIO()
+        )
+        day = timezone.localtime(self.post.published).date().isoformat()
+        self.assertEqual(
+            sorted(os.listdir(path)), [f"{day}-harvest-festival.md", "notes.txt"]
+        )
+
+
+@modify_settings(MIDDLEWARE={"prepend": "blog.timing.RequestTimingMiddleware"})
+@override_settings(BLOG_SERVER_TIMING=True, BLOG_SLOW_REQUEST_MS=0)
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create_user(username="author")
+        Post.objects.create(
+            title="Timed",
+            slug="timed",
+            author=author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("blog:post_list"))
+        header = response["Server-Timing"]
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("template;dur=", header)
+        self.assertIn("sidebar;dur=", header)
+        self.assertRegex(header, r"total;dur=[\d.]+$")
+
+        response = self.client.get(reverse("blog:post_search"), {"query": "timed"})
+        self.assertIn("search;dur=", response["Server-Timing"])
+
+    @override_settings(BLOG_SERVER_TIMING=False, BLOG_SLOW_REQUEST_MS=1)
+    def test_slow_request_log(self):
+        with mock.patch("blog.timing.RequestTiming.elapsed", return_value=2.5):
+            with self.assertLogs("blog.timing", "WARNING") as logs:
+                response = self.client.get(reverse("blog:post_list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertIn("Slow request: GET / -> 200 in 2500.0ms", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+@modify_settings(MIDDLEWARE={"prepend": "blog.timing.RequestTimingMiddleware"})
+@override_settings(BLOG_METRICS=True, BLOG_METRICS_TOKEN="", BLOG_METRICS_DIR="")
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create_user(username="author")
+        Post.objects.create(
+            title="Counted",
+            slug="counted",
+            author=author,
+            body="Body",
+            status=Post.Status.PUBLISHED,
+        )
+
+    def _value(self, sample):
+        return metrics.collect().get(sample, 0)
+
+    def test_request_and_cache_metrics(self):
+        key = ("blog_responses_total", ("blog:post_list", "200"))
+        before = self._value(key)
+        misses = self._value(("blog_cache_misses_total", ("sidebar",)))
+        self.client.get(reverse("blog:post_list"))
+        self.client.get(reverse("blog:post_list"))
+        self.assertEqual(self._value(key), before + 2)
+        # The second page view found the sidebar fragment in the cache.
+        self.assertEqual(
+            self._value(("blog_cache_misses_total", ("sidebar",))), misses + 1
+        )
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn("# TYPE blog_request_duration_seconds histogram", body)
+        self.assertRegex(
+            body,
+            r'blog_request_duration_seconds_bucket\{view="blog:post_list",'
+            r'le="\+Inf"\} \d+',
+        )
+        self.assertRegex(body, r'blog_db_queries_total\{view="blog:post_list"\} \d+')
+
+    def test_comment_outcomes(self):
+        post = Post.objects.get()
+        accepted = self._value(("blog_comments_total", ("accepted",)))
+        duplicate = self._value(("blog_comments_total", ("duplicate",)))
+        data = {"name": "Ann", "email": "ann@example.com", "body": "Same words"}
+        url = reverse("blog:post_comment", args=[post.id])
+        self.client.post(url, data)
+        self.client.post(url, data)
+        self.assertEqual(
+            self._value(("blog_comments_total", ("accepted",))), accepted + 1
+        )
+        self.assertEqual(
+            self._value(("blog_comments_total", ("duplicate",))), duplicate + 1
+        )
+
+    def test_access_control(self):
+        with override_settings(BLOG_METRICS=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with override_settings(BLOG_METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            response = self.client.get(
+                "/metrics", headers={"Authorization": "Bearer s3cret"}
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_multiprocess_files_are_merged(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        key = ("blog_emails_total", ("sent",))
+        with override_settings(BLOG_METRICS_DIR=directory):
+            own = self._value(key)
+            with open(os.path.join(directory, "metrics-1.json"), "w") as fh:
+                fh.write('[["blog_emails_total", ["sent"], 5]]')
+            self.assertEqual(self._value(key), own + 5)
+            metrics.flush()
+            own_file = metrics._own_file(directory)
+            self.assertTrue(os.path.exists(own_file))
+            self.assertTrue(
+                os.path.basename(own_file).startswith(
+                    f"metrics-{metrics._host}-{os.getpid()}-"
+                )
+            )
+            # Our own file is replaced by the live values, not added to them.
+            self.assertEqual(self._value(key), own + 5)
+
+    def test_exited_processes_files_are_adopted(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+
+        def write(name, value, age=0):
+            path = os.path.join(directory, name)
+            with open(path, "w") as fh:
+                fh.write(f'[["blog_emails_total", ["failed"], {value}]]')
+            if age:
+                os.utime(path, (time.time() - age, time.time() - age))
+
+        key = ("blog_emails_total", ("failed",))
+        with override_settings(BLOG_METRICS_DIR=directory, BLOG_METRICS_RETENTION=60):
+            own = self._value(key)
+            write(f"metrics-{metrics._host}-{exited.pid}-abc.json", 1)
+            write("metrics-otherhost-7-old.json", 10, age=120)
+            write("metrics-otherhost-8-new.json", 100)
+            self.assertEqual(self._value(key), own + 111)
+            # Adopted once: counted in our own file, and no longer on disk.
+            self.assertEqual(self._value(key), own + 111)
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                sorted(
+                    [
+                        os.path.basename(metrics._own_file(directory)),
+                        "metrics-otherhost-8-new.json",
+                    ]
+                ),
+            )
+
+    def test_exited_threads_are_folded_into_retired_totals(self):
+        key = ("blog_rate_limited_total", ("test",))
+        before = self._value(key)
+        metrics.RATE_LIMITED.inc("test")  # this thread's shard exists
+        metrics.snapshot()
+        live = len(metrics._shards)
+        for _ in range(5):
+            thread = threading.Thread(target=metrics.RATE_LIMITED.inc, args=("test",))
+            thread.start()
+            thread.join()
+        self.assertEqual(self._value(key), before + 6)
+        self.assertEqual(len(metrics._shards), live)
+
+
+class StaticSiteTests(TestCase):
+    def setUp(self):
+        self.out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out)
+        author = get_user_model().objects.create_user(username="author")
+        # 23:30 UTC in June is already the next day in London.
+        late = timezone.datetime(2024, 6, 1, 23, 30, tzinfo=timezone.timezone.utc)
+        self.posts = [
+            Post.objects.create(
+                title=f"Static post {i}",
+                slug=f"static-post-{i}",
+                author=author,
+                body=f"Body {i}",
+                published=late - timezone.timedelta(days=i),
+                status=Post.Status.PUBLISHED,
+            )
+            for i in range(4)
+        ]
+        self.posts[0].tags.add("farm")
+
+    def _path(self, post):
+        return os.path.join(self.out, post.get_absolute_url().lstrip("/"), "index.html")
+
+    def test_forms_fetch_a_csrf_token(self):
+        self.assertEqual(static_site.build(self.out)["failed"], {})
+        with open(self._path(self.posts[1]), encoding="utf-8") as fh:
+            html = fh.read()
+        # No baked-in token: the field is filled from the dynamic app.
+        self.assertEqual(html.count('name="csrfmiddlewaretoken"'), 1)
+        self.assertIn('name="csrfmiddlewaretoken" value=""', html)
+        self.assertIn(reverse("blog:csrf_token"), html)
+
+        client = Client(enforce_csrf_checks=True)
+        url = reverse("blog:post_comment", args=[self.posts[1].id])
+        data = {"name": "Ann", "email": "ann@example.com", "body": "Hello"}
+        self.assertEqual(client.post(url, data).status_code, 403)
+        token = client.get(reverse("blog:csrf_token")).json()["token"]
+        response = client.post(url, {**data, "csrfmiddlewaretoken": token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.posts[1].comments.count(), 1)
+
+    def test_incremental_rebuild(self):
+        result = static_site.build(self.out)
+        self.assertEqual(result["failed"], {})
+        self.assertIn("/2024/6/2/static-post-0/", self.posts[0].get_absolute_url())
+        for post in self.posts:
+            self.assertTrue(os.path.exists(self._path(post)))
+        for path in (
+            "index.html",
+            "page/2/index.html",
+            "tag/farm/index.html",
+            "feed/index.xml",
+            "sitemap.xml",
+        ):
+            self.assertTrue(os.path.exists(os.path.join(self.out, path)), path)
+        with open(os.path.join(self.out, "page/2/index.html"), encoding="utf-8") as fh:
+            self.assertIn("Static post 3", fh.read())
+
+        # Nothing changed: only the feed and sitemaps are written again.
+        always = len(static_site.always_rendered())
+        self.assertEqual(static_site.build(self.out)["rendered"], always)
+
+        # A new comment re-renders its post and the list pages showing it.
+        Comment.objects.create(
+            post=self.posts[0], name="Ann", email="ann@example.com", body="Hi"
+        )
+        self.assertEqual(static_site.build(self.out)["rendered"], always + 3)
+        with open(self._path(self.posts[0]), encoding="utf-8") as fh:
+            self.assertIn("Hi", fh.read())
+
+        # An unpublished post's page is removed.
+        Post.objects.filter(pk=self.posts[3].pk).update(status=Post.Status.DRAFT)
+        result = static_site.build(self.out)
+        self.assertEqual(result["removed"], 2)  # its page and page 2
+        self.assertFalse(os.path.exists(self._path(self.posts[3])))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("export_static_site", self.out, workers=1, stdout=out)
+        self.assertIn("removed 0.", out.getvalue())
+        call_command("export_static_site", self.out, workers=1, force=True, stdout=out)
+        self.assertIn(f"for {len(static_site.plan())} page(s)", out.getvalue())
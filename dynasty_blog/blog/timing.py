@@ -0,0 +1,227 @@
+"""
+Per-request timing: SQL, template rendering and the blog's hot functions.
+
+:class:`RequestTimingMiddleware` opens a :class:`RequestTiming` for each
+request in a context variable. While it is open:
+
+* every query on every connection is timed by an execute wrapper that is
+  installed once per connection (``connection_created``), so queries run
+  from ``sync_to_async`` threads in the async views are counted too;
+* ``TimedDjangoTemplates`` times each top-level template render;
+* functions decorated with :func:`timed` (Markdown rendering, search,
+  similar-post rebuilds, the sidebar tags) add their own time.
+
+With ``BLOG_SERVER_TIMING`` the totals go out in a ``Server-Timing``
+header, which browsers show in their network panel. Requests slower than
+``BLOG_SLOW_REQUEST_MS`` are logged to ``blog.timing`` with their
+slowest queries. With ``BLOG_METRICS`` the same numbers feed the
+``/metrics`` histograms and counters (blog/metrics.py). Outside a request
+(commands, the shell) every hook is a single context-variable lookup.
+Entries overlap: ``template`` includes the queries and sidebar tags
+evaluated while rendering.
+"""
+
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("blog_request_timing", default=None)
+
+
+class RequestTiming:
+    """Accumulated ``name -> [count, seconds]`` plus the slowest queries."""
+
+    def __init__(self, keep_queries=3):
+        self.start = time.perf_counter()
+        self.metrics = {}
+        self.keep_queries = keep_queries
+        self._slowest = []  # min-heap of (seconds, seq, sql)
+        self._seq = itertools.count()
+
+    def add(self, name, seconds):
+        entry = self.metrics.get(name)
+        if entry is None:
+            self.metrics[name] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_query(self, sql, seconds):
+        self.add("db", seconds)
+        if self.keep_queries:
+            item = (seconds, next(self._seq), sql)
+            if len(self._slowest) < self.keep_queries:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def slowest_queries(self):
+        """``[(ms, sql)]``, slowest first."""
+        return [
+            (round(seconds * 1000, 2), sql)
+            for seconds, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+    def server_timing(self, total):
+        parts = []
+        for name, (count, seconds) in self.metrics.items():
+            desc = f'"{count} queries"' if name == "db" else f'"{count} calls"'
+            parts.append(f"{name};dur={seconds * 1000:.2f};desc={desc}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current():
+    """The open :class:`RequestTiming`, or None outside a timed request."""
+    return _current.get()
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to ``name`` (if a request is timed)."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator form of :func:`measure`."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timing = _current.get()
+            if timing is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timing.add(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# ---------------------------------------------------------------------
+# Hooks: database and templates
+# ---------------------------------------------------------------------
+def _time_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.add_query(sql, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def _install_query_timer(sender, connection, **kwargs):
+    # Connection wrappers outlive reconnects: install once per wrapper.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with measure("template"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose templates report their render time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# ---------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------
+def _finish(request, response, timing):
+    total = timing.elapsed()
+    if settings.BLOG_SERVER_TIMING:
+        response["Server-Timing"] = timing.server_timing(total)
+    threshold = settings.BLOG_SLOW_REQUEST_MS
+    if threshold and total * 1000 >= threshold:
+        summary = " ".join(
+            f"{name}={seconds * 1000:.1f}ms/{count}"
+            for name, (count, seconds) in timing.metrics.items()
+        )
+        queries = "".join(
+            f"\n  {ms}ms {sql[:500]}" for ms, sql in timing.slowest_queries()
+        )
+        logger.warning(
+            "Slow request: %s %s -> %s in %.1fms [%s]%s",
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            total * 1000,
+            summary,
+            queries,
+        )
+    if settings.BLOG_METRICS:
+        metrics.observe_request(request, response, timing, total)
+        metrics.maybe_flush()
+    return response
+
+
+@sync_and_async_middleware
+def RequestTimingMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            timing = RequestTiming(settings.BLOG_SLOW_QUERY_COUNT)
+            token = _current.set(timing)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, timing)
+
+    else:
+
+        def middleware(request):
+            timing = RequestTiming(settings.BLOG_SLOW_QUERY_COUNT)
+            token = _current.set(timing)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, timing)
+
+    return middleware
@@ -1,18 +1,37 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-from .feeds import LatestPostsFeed
+from django.views.decorators.http import condition
+from . import freshness, views
+from .feeds import LatestPostsFeed, TagPostsFeed
+
+# Both feeds answer If-None-Match / If-Modified-Since with a 304.
+feed_condition = condition(
+    etag_func=freshness.feed_etag,
+    last_modified_func=freshness.feed_last_modified,
+)
+
+# Under ASGI the read-only views can run natively async (blog/async_views.py).
+if settings.BLOG_ASYNC_VIEWS:
+    from . import async_views as read_views
+
+    post_feed = read_views.post_feed
+    post_feed_by_tag = read_views.post_feed_by_tag
+else:
+    read_views = views
+    post_feed = feed_condition(LatestPostsFeed())
+    post_feed_by_tag = feed_condition(TagPostsFeed())
 
 app_name = "blog"
 
 urlpatterns = [
     # Main blog list
-    path("", views.post_list, name="post_list"),
+    path("", read_views.post_list, name="post_list"),
     # Tag filter route (used in list.html)
-    path("tag/<slug:tag_slug>/", views.post_list, name="post_list_by_tag"),
+    path("tag/<slug:tag_slug>/", read_views.post_list, name="post_list_by_tag"),
     # Post detail
     path(
         "<int:year>/<int:month>/<int:day>/<slug:post>/",
-        views.post_detail,
+        read_views.post_detail,
         name="post_detail",
     ),
     # Share via email
@@ -28,9 +47,13 @@ urlpatterns = [
         name="post_comment",
     ),
     # RSS feed
-    path("feed/", LatestPostsFeed(), name="post_feed"),
+    path("feed/", post_feed, name="post_feed"),
+    path("tag/<slug:tag_slug>/feed/", post_feed_by_tag, name="post_feed_by_tag"),
     # Search
-    path("search/", views.post_search, name="post_search"),
+    path("search/", read_views.post_search, name="post_search"),
+    path("search/suggest/", views.post_autocomplete, name="post_autocomplete"),
+    # CSRF token for the forms on statically exported pages
+    path("csrf/", views.csrf_token, name="csrf_token"),
     # ✅ New static pages
     path("about/", views.about, name="about"),
     path("contact/", views.contact, name="contact"),
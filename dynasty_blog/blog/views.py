@@ -1,22 +1,58 @@
 from django.conf import settings
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.generic import ListView
-from django.views.decorators.http import require_POST
-from django.db.models import Count
-from django.db import connection
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.http import Http404, JsonResponse
+from django.core.cache import cache
+from django.db import transaction
 from taggit.models import Tag
 
-# Postgres full-text search bits (only used when connection is PostgreSQL)
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-
+from . import freshness, metrics
+from .autocomplete import title_index
+from .cache import search_cache_key
 from .forms import EmailPostForm, CommentForm, SearchForm
 from .models import Post, Comment
+from .outbox import enqueue
+from .pagination import CursorPaginator, pagination_mode
+from .ratelimit import (
+    claim_comment_body,
+    ratelimit,
+    release_comment_body,
+    too_many_requests,
+)
+from .routers import pin_primary
+from .search import get_search_backend
+from .similar import similar_posts_for
+
+# Maximum number of SQL queries each view may run for an anonymous visitor
+# (sidebar fragment cache warm). Enforced by blog/tests.py, so a template or
+# queryset change that reintroduces an N+1 fails CI. List and detail views
+# also run one freshness query for their ETag / Last-Modified validators.
+QUERY_BUDGETS = {
+    "post_list": 4,  # freshness, COUNT, page of posts (+ author), tags prefetch
+    "post_list_cursor": 4,  # freshness, cached COUNT (cold), page, tags prefetch
+    "post_list_by_tag": 5,  # + tag lookup
+    "post_detail": 4,  # freshness, post (+ author), similar posts, comments
+    "post_conditional_get": 1,  # a matching If-None-Match costs one query
+    "post_search": 3,  # COUNT, page of results (+ posts for FTS5); 0 when cached
+}
+
+
+def _post_summaries(queryset):
+    """Prepare a post queryset for list-style rendering (no N+1 queries)."""
+    return (
+        queryset.defer(*Post.LIST_DEFERRED_FIELDS)
+        .select_related("author")
+        .prefetch_related("tags")
+    )
 
 
+@ratelimit("share")
 def post_share(request, post_id):
     post = get_object_or_404(Post, id=post_id, status=Post.Status.PUBLISHED)
     sent = False
@@ -31,20 +67,13 @@ def post_share(request, post_id):
                 f"Read “{post.title}” at {post_url}\n\n"
                 f"{cd['name']}'s comments:\n{cd['comments']}"
             )
-            try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[cd["to"]],
-                    fail_silently=False,
-                )
-                messages.success(request, "Email sent successfully.")
-                sent = True
-                # PRG pattern to prevent form resubmission
-                return redirect(reverse("blog:post_share", args=[post.id]) + "?sent=1")
-            except Exception as e:
-                messages.error(request, f"Could not send email: {e}")
+            # Queue the message and return; `send_outbox` delivers it, so a
+            # slow mail relay never holds up this request.
+            with transaction.atomic():
+                enqueue(subject, message, to=cd["to"], post=post)
+            messages.success(request, "Email queued for delivery.")
+            # PRG pattern to prevent form resubmission
+            return redirect(reverse("blog:post_share", args=[post.id]) + "?sent=1")
     else:
         form = EmailPostForm()
         if request.GET.get("sent"):
@@ -58,27 +87,39 @@ def post_share(request, post_id):
 
 
 class PostListView(ListView):
-    queryset = Post.published_posts.all()
+    queryset = _post_summaries(Post.published_posts.all())
     context_object_name = "posts"
     paginate_by = 3
     template_name = "blog/post/list.html"
 
 
+@condition(
+    etag_func=freshness.list_etag, last_modified_func=freshness.list_last_modified
+)
 def post_list(request, tag_slug=None):
-    posts_list = Post.published_posts.all()
+    posts_list = _post_summaries(Post.published_posts.all())
     tag = None
     if tag_slug:
         tag = get_object_or_404(Tag, slug=tag_slug)
         posts_list = posts_list.filter(tags__in=[tag])
-    paginator = Paginator(posts_list, 3)
-    page_number = request.GET.get("page", 1)
-    posts = paginator.get_page(page_number)
+    if pagination_mode() == "cursor":
+        paginator = CursorPaginator(
+            posts_list, 3, count_key=f"tag:{tag.pk}" if tag else "all"
+        )
+        posts = paginator.get_page(request.GET.get("cursor"))
+    else:
+        paginator = Paginator(posts_list, 3)
+        page_number = request.GET.get("page", 1)
+        posts = paginator.get_page(page_number)
     return render(request, "blog/post/list.html", {"posts": posts, "tag": tag})
 
 
+@condition(
+    etag_func=freshness.detail_etag, last_modified_func=freshness.detail_last_modified
+)
 def post_detail(request, year, month, day, post):
     post = get_object_or_404(
-        Post,
+        Post.objects.select_related("author"),
         status=Post.Status.PUBLISHED,
         slug=post,
         published__year=year,
@@ -86,24 +127,14 @@ def post_detail(request, year, month, day, post):
         published__day=day,
     )
 
-    # Active comments
-    comments = post.comments.filter(active=True)
+    # Active comments (evaluated once; the template only iterates/measures it)
+    comments = list(post.comments.filter(active=True))
 
     # Comment form
     form = CommentForm()
 
-    # Similar posts by shared tags
-    post_tag_ids = list(post.tags.values_list("id", flat=True))
-    if post_tag_ids:
-        similar_posts = (
-            Post.published_posts.filter(tags__in=post_tag_ids)
-            .exclude(id=post.id)
-            .annotate(same_tags=Count("tags", distinct=True))
-            .order_by("-same_tags", "-published")
-            .distinct()[:4]
-        )
-    else:
-        similar_posts = []
+    # Similar posts by shared tags (precomputed, see blog/similar.py)
+    similar_posts = similar_posts_for(post)
 
     return render(
         request,
@@ -118,16 +149,33 @@ def post_detail(request, year, month, day, post):
 
 
 @require_POST
+@ratelimit("comment")
 def post_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id, status=Post.Status.PUBLISHED)
+    # Reject a repeat of a recent comment before any database work.
+    body = request.POST.get("body", "")
+    if body.strip() and not claim_comment_body(post_id, body):
+        metrics.COMMENTS.inc("duplicate")
+        return too_many_requests(
+            settings.BLOG_COMMENT_DUPLICATE_WINDOW, "Duplicate comment."
+        )
+
+    try:
+        post = get_object_or_404(Post, id=post_id, status=Post.Status.PUBLISHED)
+    except Http404:
+        # Don't let a missing or unpublished post hold the body's claim.
+        release_comment_body(post_id, body)
+        raise
     comment = None
     form = CommentForm(data=request.POST)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
         comment.save()
+        metrics.COMMENTS.inc("accepted")
         messages.success(request, "Your comment has been submitted successfully.")
     else:
+        release_comment_body(post_id, body)
+        metrics.COMMENTS.inc("invalid")
         messages.error(request, "Please correct the errors below.")
     return render(
         request,
@@ -139,45 +187,54 @@ def post_comment(request, post_id):
 def post_search(request):
     form = SearchForm()
     query = None
-    results = []
+    search = None
 
     if "query" in request.GET:
         form = SearchForm(request.GET)
         if form.is_valid():
             query = form.cleaned_data["query"]
-
-            # Use Postgres full-text search if the current DB is PostgreSQL
-            if connection.vendor == "postgresql":
-                search_vector = SearchVector("title", weight="A") + SearchVector(
-                    "body", weight="B"
-                )
-                search_query = SearchQuery(query)
-                results = (
-                    Post.published_posts.annotate(
-                        search=search_vector,
-                        rank=SearchRank(search_vector, search_query),
-                    )
-                    .filter(rank__gte=0.3)
-                    .order_by("-rank", "-published")
-                )
-            else:
-                # Fallback: simple case-insensitive substring search
-                results = (
-                    (
-                        Post.published_posts.filter(title__icontains=query)
-                        | Post.published_posts.filter(body__icontains=query)
-                    )
-                    .distinct()
-                    .order_by("-published")
-                )
+            page_number = request.GET.get("page", 1)
+
+            # Popular queries are served from a short-lived cache; the key
+            # includes the posts version, so edits invalidate it.
+            backend = get_search_backend()
+            cache_key = search_cache_key(backend.name, query, page_number)
+            search = cache.get(cache_key)
+            metrics.cache_lookup("search", search is not None)
+            if search is None:
+                # Cached under the current posts version: read from the
+                # primary, which a lagging replica may not have caught up to.
+                with pin_primary():
+                    search = backend.search(query, page_number)
+                cache.set(cache_key, search, settings.BLOG_SEARCH_CACHE_TIMEOUT)
 
     return render(
         request,
         "blog/post/search.html",
-        {"form": form, "query": query, "results": results},
+        {
+            "form": form,
+            "query": query,
+            "search": search,
+            "results": search["results"] if search else [],
+        },
     )
 
 
+@require_GET
+@cache_control(public=True, max_age=60)
+def post_autocomplete(request):
+    """Title suggestions for the search box, served from an in-process index."""
+    results = title_index.suggest(request.GET.get("q", "")[:100])
+    return JsonResponse({"results": results})
+
+
+@require_GET
+@never_cache
+def csrf_token(request):
+    """A fresh token (and cookie) for forms on the static export's pages."""
+    return JsonResponse({"token": get_token(request)})
+
+
 # ---------- NEW STATIC PAGES FOR NAV ----------
 def about(request):
     return render(request, "blog/about.html")
@@ -79,7 +79,8 @@ ROOT_URLCONF = "dynasty_blog.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that reports render time (see blog/timing.py)
+        "BACKEND": "blog.timing.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],  # project-level templates folder
         "APP_DIRS": True,
         "OPTIONS": {
@@ -125,6 +126,77 @@ else:
         }
     }
 
+# Verify a connection is still alive before reusing it (with the pool
+# below, on every checkout).
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = config(
+    "DB_CONN_HEALTH_CHECKS", cast=bool, default=True
+)
+
+# psycopg 3 connection pool (PostgreSQL only). Each process keeps between
+# DB_POOL_MIN_SIZE and DB_POOL_MAX_SIZE open connections shared by all its
+# threads; a request waits up to DB_POOL_TIMEOUT seconds for one. Idle
+# connections above the minimum close after DB_POOL_MAX_IDLE seconds and
+# every connection is recycled after DB_POOL_MAX_LIFETIME. The pool replaces
+# persistent connections, so CONN_MAX_AGE is forced to 0. Stats (wait time,
+# checkouts) are at /admin/db-pool/ for staff.
+DB_POOL = config("DB_POOL", cast=bool, default=False)
+if DB_POOL and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": config("DB_POOL_MIN_SIZE", cast=int, default=2),
+        "max_size": config("DB_POOL_MAX_SIZE", cast=int, default=10),
+        "timeout": config("DB_POOL_TIMEOUT", cast=float, default=10.0),
+        "max_idle": config("DB_POOL_MAX_IDLE", cast=float, default=300.0),
+        "max_lifetime": config("DB_POOL_MAX_LIFETIME", cast=float, default=3600.0),
+    }
+
+# Read replicas: comma-separated database URLs, registered as replica1,
+# replica2, ... with the primary's connection settings. Post/comment/tag
+# reads are spread over them round-robin by blog.routers.ReplicaRouter;
+# writes, the admin, and a client's requests for BLOG_REPLICA_PIN_SECONDS
+# after it posts something use the primary.
+REPLICA_DATABASES = []
+for _i, _url in enumerate(
+    (u.strip() for u in config("REPLICA_DATABASE_URLS", default="").split(",")),
+    start=1,
+):
+    if not _url:
+        continue
+    _replica = dj_database_url.parse(
+        _url,
+        conn_max_age=DATABASES["default"]["CONN_MAX_AGE"],
+        conn_health_checks=DATABASES["default"]["CONN_HEALTH_CHECKS"],
+        ssl_require=config("DB_SSL_REQUIRE", cast=bool, default=False),
+    )
+    if "pool" in DATABASES["default"].get("OPTIONS", {}):
+        _replica.setdefault("OPTIONS", {})["pool"] = dict(
+            DATABASES["default"]["OPTIONS"]["pool"]
+        )
+    _replica["TEST"] = {"MIRROR": "default"}
+    DATABASES[f"replica{_i}"] = _replica
+    REPLICA_DATABASES.append(f"replica{_i}")
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ["blog.routers.ReplicaRouter"]
+    MIDDLEWARE.append("blog.routers.PrimaryPinMiddleware")
+BLOG_REPLICA_PIN_SECONDS = config("BLOG_REPLICA_PIN_SECONDS", cast=int, default=10)
+
+# ---------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------
+# Local memory by default. Use a shared backend in production so cache
+# invalidation reaches every worker, e.g.
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="dynasty-blog"),
+    }
+}
+
 # ---------------------------------------------------------------------
 # Password validation
 # ---------------------------------------------------------------------
@@ -178,3 +250,127 @@ SERVER_EMAIL = config("SERVER_EMAIL", default=DEFAULT_FROM_EMAIL)
 # Misc
 # ---------------------------------------------------------------------
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# ---------------------------------------------------------------------
+# Blog
+# ---------------------------------------------------------------------
+# Markdown extensions, excerpt length and reading speed used when rendering
+# Post.body. After changing any of these, run `python manage.py rerender_posts`
+# to rebuild the stored HTML, excerpts and reading times.
+BLOG_MARKDOWN_EXTENSIONS = []
+BLOG_EXCERPT_WORDS = config("BLOG_EXCERPT_WORDS", cast=int, default=30)
+BLOG_WORDS_PER_MINUTE = config("BLOG_WORDS_PER_MINUTE", cast=int, default=200)
+
+# The sidebar fragment is invalidated by signals whenever posts, comments or
+# tags change; this TTL is only a safety net.
+BLOG_SIDEBAR_CACHE_TIMEOUT = config("BLOG_SIDEBAR_CACHE_TIMEOUT", cast=int, default=600)
+
+# "page" = numbered pages (COUNT + OFFSET); "cursor" = keyset pagination on
+# (published, id) with next/prev tokens, so deep archive pages cost the same
+# as page 1. In cursor mode the post total is cached for this many seconds.
+BLOG_PAGINATION_MODE = config("BLOG_PAGINATION_MODE", default="page")
+BLOG_PAGINATION_COUNT_TIMEOUT = config(
+    "BLOG_PAGINATION_COUNT_TIMEOUT", cast=int, default=300
+)
+
+# Search results are paginated; each page is cached briefly per query.
+BLOG_SEARCH_RESULTS_PER_PAGE = config("BLOG_SEARCH_RESULTS_PER_PAGE", cast=int, default=10)
+BLOG_SEARCH_CACHE_TIMEOUT = config("BLOG_SEARCH_CACHE_TIMEOUT", cast=int, default=60)
+
+# Similar posts shown on a post page. They're precomputed; after changing
+# this run `python manage.py rebuild_similar_posts`.
+BLOG_SIMILAR_POSTS = config("BLOG_SIMILAR_POSTS", cast=int, default=4)
+
+# RSS feeds: number of items, and a safety-net TTL for the cached XML
+# (it's invalidated by signals whenever a published post changes).
+BLOG_FEED_ITEMS = config("BLOG_FEED_ITEMS", cast=int, default=5)
+BLOG_FEED_CACHE_TIMEOUT = config("BLOG_FEED_CACHE_TIMEOUT", cast=int, default=3600)
+
+# Responsive image derivatives (see blog/images.py): target widths, and
+# whether uploads are processed on a background thread pool after commit.
+BLOG_IMAGE_WIDTHS = [160, 320, 640, 960, 1280, 1920]
+BLOG_IMAGE_DERIVATIVES_ASYNC = config(
+    "BLOG_IMAGE_DERIVATIVES_ASYNC", cast=bool, default=True
+)
+BLOG_IMAGE_WORKERS = config("BLOG_IMAGE_WORKERS", cast=int, default=2)
+
+# Sitemap: posts per shard (max 50,000) and how long rendered shards and the
+# index stay cached (shards are re-keyed whenever their posts change).
+BLOG_SITEMAP_SHARD_SIZE = config("BLOG_SITEMAP_SHARD_SIZE", cast=int, default=5000)
+BLOG_SITEMAP_CACHE_TIMEOUT = config(
+    "BLOG_SITEMAP_CACHE_TIMEOUT", cast=int, default=86400
+)
+
+# Uploaded media is served by blog.media.serve_media (byte ranges, strong
+# ETags). BLOG_MEDIA_OFFLOAD hands the transfer to the front proxy instead:
+# "nginx" sends X-Accel-Redirect to BLOG_MEDIA_ACCEL_PREFIX (an `internal`
+# location aliased to MEDIA_ROOT); "sendfile" sends X-Sendfile with the
+# absolute path (Apache mod_xsendfile, lighttpd). Empty = Django streams it.
+BLOG_MEDIA_OFFLOAD = config("BLOG_MEDIA_OFFLOAD", default="")
+BLOG_MEDIA_ACCEL_PREFIX = config("BLOG_MEDIA_ACCEL_PREFIX", default="/protected-media/")
+BLOG_MEDIA_MAX_AGE = config("BLOG_MEDIA_MAX_AGE", cast=int, default=31536000)
+
+# Share emails are queued in the outbox table and delivered by
+# `python manage.py send_outbox`: rows per batch, maximum messages per
+# second (0 = unlimited), attempts before a row is marked failed, the first
+# retry delay in seconds (doubling each time), and the idle poll interval.
+BLOG_OUTBOX_BATCH_SIZE = config("BLOG_OUTBOX_BATCH_SIZE", cast=int, default=50)
+BLOG_OUTBOX_RATE = config("BLOG_OUTBOX_RATE", cast=float, default=5.0)
+BLOG_OUTBOX_MAX_ATTEMPTS = config("BLOG_OUTBOX_MAX_ATTEMPTS", cast=int, default=6)
+BLOG_OUTBOX_RETRY_BASE = config("BLOG_OUTBOX_RETRY_BASE", cast=int, default=30)
+BLOG_OUTBOX_POLL_INTERVAL = config("BLOG_OUTBOX_POLL_INTERVAL", cast=float, default=5.0)
+
+# Throttling for comments and share emails (see blog/ratelimit.py), shared
+# across workers through the cache. Rates are "<count>/<n><s|m|h|d>" per
+# client IP, submitted email address and post. Behind a proxy, set
+# BLOG_CLIENT_IP_HEADER (e.g. HTTP_X_FORWARDED_FOR) so clients are told apart,
+# and BLOG_TRUSTED_PROXY_COUNT to the number of proxies that append to it:
+# the client address is read that many entries from the right.
+BLOG_RATE_LIMITS = {
+    "comment": {"ip": "5/10m", "email": "5/10m", "post": "60/10m"},
+    "share": {"ip": "5/h", "email": "5/h", "post": "100/h"},
+}
+BLOG_RATE_LIMITER = "blog.ratelimit.SlidingWindowLimiter"
+BLOG_CLIENT_IP_HEADER = config("BLOG_CLIENT_IP_HEADER", default="")
+BLOG_TRUSTED_PROXY_COUNT = config("BLOG_TRUSTED_PROXY_COUNT", cast=int, default=1)
+# Identical (case/punctuation-insensitive) comments on a post are rejected
+# for this many seconds.
+BLOG_COMMENT_DUPLICATE_WINDOW = config(
+    "BLOG_COMMENT_DUPLICATE_WINDOW", cast=int, default=3600
+)
+
+# Serve post_list, post_detail, post_search and the feeds from the async
+# views in blog/async_views.py. Only worth it under an ASGI server
+# (dynasty_blog/asgi.py); under WSGI keep the sync views.
+BLOG_ASYNC_VIEWS = config("BLOG_ASYNC_VIEWS", cast=bool, default=False)
+
+# Per-request timing (blog/timing.py): SQL, templates, Markdown, search,
+# similar posts and sidebar. BLOG_SERVER_TIMING adds a Server-Timing header
+# (visible to every client: it reveals timings, not data). Requests slower
+# than BLOG_SLOW_REQUEST_MS (0 = never) are logged to "blog.timing" with
+# their BLOG_SLOW_QUERY_COUNT slowest queries.
+BLOG_SERVER_TIMING = config("BLOG_SERVER_TIMING", cast=bool, default=False)
+BLOG_SLOW_REQUEST_MS = config("BLOG_SLOW_REQUEST_MS", cast=int, default=1000)
+BLOG_SLOW_QUERY_COUNT = config("BLOG_SLOW_QUERY_COUNT", cast=int, default=3)
+
+# Prometheus metrics at /metrics (blog/metrics.py): per-view latency and
+# query counts, cache hit ratios, share-email and comment outcomes. Set
+# BLOG_METRICS_TOKEN to require "Authorization: Bearer <token>". With
+# several worker processes (and the send_outbox worker) point
+# BLOG_METRICS_DIR at a directory they all share so any one of them can
+# report the totals; each writes its counters there every
+# BLOG_METRICS_FLUSH_INTERVAL seconds. Files of exited processes are folded
+# into a live one's; on other hosts, where PIDs can't be checked, a file
+# counts as exited once it hasn't been rewritten for BLOG_METRICS_RETENTION
+# seconds.
+BLOG_METRICS = config("BLOG_METRICS", cast=bool, default=False)
+BLOG_METRICS_TOKEN = config("BLOG_METRICS_TOKEN", default="")
+BLOG_METRICS_DIR = config("BLOG_METRICS_DIR", default="")
+BLOG_METRICS_FLUSH_INTERVAL = config(
+    "BLOG_METRICS_FLUSH_INTERVAL", cast=float, default=5.0
+)
+BLOG_METRICS_RETENTION = config("BLOG_METRICS_RETENTION", cast=int, default=86400)
+
+if BLOG_SERVER_TIMING or BLOG_SLOW_REQUEST_MS or BLOG_METRICS:
+    # Outermost, so the total covers the other middleware too.
+    MIDDLEWARE.insert(0, "blog.timing.RequestTimingMiddleware")
@@ -16,26 +16,32 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
 from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
-from blog.sitemaps import PostSitemap
-
-sitemaps = {
-    "posts": PostSitemap,
-}
+from blog.dbpool import db_pool_stats
+from blog.media import serve_media
+from blog.metrics import metrics_view
+from blog.sitemaps import sitemap_index, sitemap_shard
 
 urlpatterns = [
+    # Connection pool counters for sizing DB_POOL_MAX_SIZE (staff only)
+    path("admin/db-pool/", db_pool_stats, name="db_pool_stats"),
     path("admin/", admin.site.urls),
+    # Prometheus scrape endpoint (BLOG_METRICS, see blog/metrics.py)
+    path("metrics", metrics_view, name="metrics"),
     path("", include(("blog.urls", "blog"), namespace="blog")),  # blog at root
-    path(
-        "sitemap.xml",
-        sitemap,
-        {"sitemaps": sitemaps},
-        name="django.contrib.sitemaps.views.sitemap",
-    ),
+    # Sitemap index + fixed-size, streamed post shards (see blog/sitemaps.py)
+    path("sitemap.xml", sitemap_index, name="sitemap"),
+    path("sitemap-posts-<int:shard>.xml", sitemap_shard, name="sitemap_shard"),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media with byte-range support (see blog/media.py); skipped when
+# MEDIA_URL points at another host such as a CDN.
+if settings.MEDIA_URL.startswith("/"):
+    urlpatterns += [
+        path(
+            f"{settings.MEDIA_URL.lstrip('/')}<path:path>",
+            serve_media,
+            name="media",
+        ),
+    ]